@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+SOMEORIGINS - BATCH MODE FOR MANY TARGET AREAS
+
+Script for identifying the most probable home country of the visitors of many target areas (e.g. national parks
+or events) in one run. The single area scripts use the FromKruger flag of the input data, this script generalizes
+it to a file of target area polygons:
+    - Tag each post with its target area (one indexed point-in-polygon pass over the whole posting history,
+      see target_areas.py)
+    - Aggregate the posts once for each user, region unit and target area tag (number of posts, first and last post,
+      bitmap of days with posts, see region_rollup.py). A user who visited several areas is aggregated only once.
+    - For each target area:
+        - visitors: users with at least one post in the area
+        - exclude the posts of the visitors within the area (as the Kruger posts in the single area scripts)
+        - detect the home country of each visitor with the basic and hierarchical maxposts, maxtimedelta and
+          maxmonths / maxweeks / maxdays methods, by rolling up the aggregates of the visitors
+        - Save results into csv (per user and per country) in a folder for each area
+
+Data:
+    Input: Posting history of social media users (post table input, see post_table.py), and polygons of the
+    target areas with an identifier column.
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+
+usage:
+    python batch_target_areas.py <target area file> <identifier column>
+"""
+import os
+import sys
+import numpy as np
+import pandas as pd
+from post_table import decode, read_post_table, region_hierarchy
+from region_rollup import aggregate_units, rank_regions, rollup, select_hierarchically, select_regions
+from target_areas import read_target_areas, tag_posts, visitor_sets
+
+
+#-------------------------
+# Functions
+#-------------------------
+def maxposts_regions(aggregates, hierarchy, levels, cells):
+    """Region with most posts for each user, at each level within the region selected at the upper level
+    (equal post counts are resolved by the first post, as in value_counts)
+
+    :param aggregates: aggregates of the region units (see region_rollup.aggregate_units)
+    :param hierarchy: region hierarchy lookup table
+    :param levels: region levels from the largest to the smallest (e.g. ["FIPS"] or ["RegCode", "SubReg_2", "FIPS"])
+    :param cells: boolean numpy array of the aggregates to include
+    :return: Pandas Series of the selected region code of each user (user code as index)
+    """
+    selected = None
+    upper_level = None
+
+    for level in levels:
+        table = rollup(aggregates, hierarchy, level, selected=selected, upper_level=upper_level, cells=cells)
+        selected = table[rank_regions(table, "n_posts") == 1].set_index("user")["region"]
+        upper_level = level
+
+    return selected
+
+
+def temporal_regions(aggregates, hierarchy, value_column, bitmaps, cells, hierarchical):
+    """Region with the highest time value (time delta or number of distinct periods) for each user.
+    Equal values are resolved with the number of posts, and then randomly.
+
+    :param value_column: "TimeDelta" or number of distinct periods (e.g. "n_day")
+    :param hierarchical: select the continent, sub-region and country hierarchically (True), or the country (False)
+    :return: Pandas Series of the selected region code of each user (user code as index)
+    """
+    if hierarchical:
+        table = select_hierarchically(aggregates, hierarchy, value_column, bitmaps=bitmaps, cells=cells)
+
+    else:
+        periods = [value_column.replace("n_", "", 1)] if value_column.startswith("n_") else []
+        table = rollup(aggregates, hierarchy, "FIPS", bitmaps=bitmaps, periods=periods, cells=cells)
+        table["TimeDelta"] = table["t_max"] - table["t_min"]
+        table = select_regions(table, value_column)
+
+    return table[table["selected"]].set_index("user")["region"]
+
+
+def write_results(selected, codebooks, method_name, folder):
+    """Write the selected countries by user and by country
+
+    :param selected: Pandas Series of the selected country code of each user (user code as index)
+    :param codebooks: codebooks of the post table
+    :param method_name: method name (column name of the result)
+    :param folder: result folder of the target area
+    """
+    results = pd.DataFrame({method_name: decode(codebooks, "FIPS", selected.values)},
+                           index=pd.Index(decode(codebooks, "userid", selected.index), name="userid"))
+
+    # Write result to file by user
+    users_filename = "%s_%susers.csv" % (method_name, str(results.index.nunique()))
+    results.to_csv(os.path.join(folder, users_filename), sep=";")
+
+    # Write result to file by region
+    region_filename = "%s_%susers_by_country.csv" % (method_name, str(results.index.nunique()))
+    results[method_name].value_counts().to_csv(os.path.join(folder, region_filename),
+                                               sep=";",
+                                               index_label="FIPS",
+                                               header=[method_name])
+
+#-------------------------
+# Inputs & outputs
+#------------------------
+
+# Social media posting history, with region info
+fp = r"./demo_data/fake_input_data.shp"
+
+# Target area polygons and their identifier column from command line (no demo target areas in this repository)
+if len(sys.argv) < 3:
+    print("usage: python batch_target_areas.py <target area file> <identifier column>")
+    sys.exit(1)
+
+areas_fp = sys.argv[1]
+id_column = sys.argv[2]
+
+# Result folder (one sub-folder for each target area)
+folder = r"./demo_results/target_areas"
+
+#--------------------------
+# SOCIAL MEDIA DATA
+#--------------------------
+some, codebooks = read_post_table(fp)
+
+print("Number of posts:", len(some))
+print("Number of users:", some.user.nunique())
+
+#--------------------------
+# TARGET AREAS
+#--------------------------
+areas, area_ids = read_target_areas(areas_fp, id_column)
+
+# Target area of each post (-1: not in any target area)
+tags = tag_posts(some, areas)
+visitors = visitor_sets(some["user"].values, tags, len(area_ids))
+
+print("Number of target areas:", len(area_ids))
+print("Number of posts in target areas:", (tags >= 0).sum())
+
+#-----------------------------------------------
+# AGGREGATES BY USER, REGION UNIT AND TARGET AREA
+#-----------------------------------------------
+hierarchy, units = region_hierarchy(some)
+
+# Computed once for all target areas
+aggregates, bitmaps = aggregate_units(some["user"].values, units, some["time"].values, some["day"].values, tags)
+
+print("Number of user-region-area aggregates:", len(aggregates))
+
+#-----------------------------------------------
+# ORIGINS OF THE VISITORS OF EACH TARGET AREA
+#-----------------------------------------------
+for area, area_id in enumerate(area_ids):
+
+    # Visitors of the area, without their posts within the area
+    cells = np.isin(aggregates["user"].values, visitors[area]) & (aggregates["tag"].values != area)
+
+    print("\n%s: %s visitors" % (area_id, len(visitors[area])))
+
+    if not cells.any():
+        continue
+
+    area_folder = os.path.join(folder, str(area_id))
+
+    if not os.path.isdir(area_folder):
+        os.makedirs(area_folder)
+
+    write_results(maxposts_regions(aggregates, hierarchy, ["FIPS"], cells), codebooks, "basic_maxposts",
+                  area_folder)
+    write_results(maxposts_regions(aggregates, hierarchy, ["RegCode", "SubReg_2", "FIPS"], cells), codebooks,
+                  "hierarchical_maxposts", area_folder)
+
+    for approach in ["basic", "hierarchical"]:
+        write_results(temporal_regions(aggregates, hierarchy, "TimeDelta", bitmaps, cells, approach == "hierarchical"),
+                      codebooks, "%s_maxtimedelta" % approach, area_folder)
+
+        for time in ["month", "week", "day"]:
+            write_results(temporal_regions(aggregates, hierarchy, "n_" + time, bitmaps, cells,
+                                           approach == "hierarchical"),
+                          codebooks, "%s_max%ss" % (approach, time), area_folder)
+
+print("DONE! Results in folder:", folder)
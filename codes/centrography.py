@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+Centrographic measures (mean center, median center, standard distance, standard deviational ellipse)
+for all users at once.
+
+Numpy / pyproj version of the arcpy spatial statistics tools used in spatial_arcpy/1a_spatial_arcpy_basic.py:
+    - The posts are projected to World Azimuthal Equidistant (ESRI:54032) with one batched transformation.
+      The projected coordinates are cached next to the compact post table (see post_table.py), so the projection
+      is done only once for each input data set.
+    - The measures are computed for all users at once (grouped by user code), and the centers are transformed
+      back to WGS84 in one batch. No intermediate shapefiles are written.
+    - The standard distance circles and standard deviational ellipses are computed from grouped moments of the
+      coordinates, and returned as attributes (center, standard distances, rotation). Polygons are created only
+      if requested (e.g. for plotting), the centers do not need them.
+    - Optionally, the mean center can be computed from 3D unit vectors (ECEF), which is free of projection
+      distortion: the mean of the unit vectors is normalized back to the surface of the sphere.
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+"""
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from pyproj import Transformer
+from shapely.geometry import Polygon
+
+# Projection used in the arcpy scripts: World Azimuthal Equidistant
+PROJECTED_CRS = "ESRI:54032"
+GEOGRAPHIC_CRS = "EPSG:4326"
+
+# Transformers between WGS84 and the projection (always_xy: coordinates in longitude, latitude order)
+to_projected = Transformer.from_crs(GEOGRAPHIC_CRS, PROJECTED_CRS, always_xy=True)
+to_geographic = Transformer.from_crs(PROJECTED_CRS, GEOGRAPHIC_CRS, always_xy=True)
+
+
+#-----------------------------------------------------------------------
+# Batched reprojection
+#-----------------------------------------------------------------------
+def project_points(lat, lon):
+    """Project WGS84 coordinates to World Azimuthal Equidistant in one batch
+
+    :param lat: numpy array of latitudes
+    :param lon: numpy array of longitudes
+    :return: numpy arrays of x and y coordinates (meters)
+    """
+    x, y = to_projected.transform(np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+
+    return np.asarray(x), np.asarray(y)
+
+
+def unproject_points(x, y):
+    """Transform projected coordinates (e.g. centers of all users) back to WGS84 in one batch
+
+    :param x: numpy array of x coordinates (meters)
+    :param y: numpy array of y coordinates (meters)
+    :return: numpy arrays of latitudes and longitudes
+    """
+    lon, lat = to_geographic.transform(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+
+    return np.asarray(lat), np.asarray(lon)
+
+
+def projected_coordinates(posts, cache_fp, data_hash):
+    """Projected coordinates of all posts in the post table, read from the cache file if the cache was created
+    from the same input data, otherwise projected and saved into the cache file.
+
+    NOTE! Use the full post table (before excluding or subsetting posts), the cached coordinates are
+    aligned with the rows of the post table.
+
+    :param posts: post table (see post_table.py)
+    :param cache_fp: file path of the cache file (.npz)
+    :param data_hash: hash of the input data (see result_store.input_hash)
+    :return: numpy arrays of x and y coordinates (meters)
+    """
+    if os.path.isfile(cache_fp):
+        cache = np.load(cache_fp)
+
+        if str(cache["input_hash"]) == data_hash and len(cache["x"]) == len(posts):
+            print("using existing projected coordinates")
+            return cache["x"], cache["y"]
+
+    print("Projecting input demo_data...")
+    x, y = project_points(posts["lat"].values, posts["lon"].values)
+
+    folder = os.path.dirname(cache_fp)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    np.savez(cache_fp, x=x, y=y, input_hash=np.array(data_hash))
+
+    return x, y
+
+
+#-----------------------------------------------------------------------
+# Centers of all users
+#-----------------------------------------------------------------------
+def group_index(users):
+    """Consecutive group numbers of the users
+
+    :param users: numpy array of user codes (one per post)
+    :return: group number of each post, and the user code of each group (sorted)
+    """
+    groups, group_users = pd.factorize(np.asarray(users), sort=True)
+
+    return groups, np.asarray(group_users)
+
+
+def mean_centers(users, x, y, weights=None):
+    """Weighted mean center of each user (same as arcpy MeanCenter_stats with Case_Field="userid")
+
+    :param users: numpy array of user codes (one per post)
+    :param x: numpy array of x coordinates
+    :param y: numpy array of y coordinates
+    :param weights: numpy array of weights of the posts (None: all posts have weight 1)
+    :return: Pandas DataFrame with user code as index, and columns CenterX, CenterY
+    """
+    groups, group_users = group_index(users)
+    weights = np.ones(len(groups)) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    total = np.bincount(groups, weights=weights)
+
+    return pd.DataFrame({"CenterX": np.bincount(groups, weights=weights * x) / total,
+                         "CenterY": np.bincount(groups, weights=weights * y) / total},
+                        index=pd.Index(group_users, name="user"))
+
+
+def median_centers(users, x, y, weights=None, tolerance=1e-6, max_iterations=1000):
+    """Median center of each user: the location that minimizes the (weighted) sum of Euclidean distances to the
+    posts (same as arcpy MedianCenter_stats with Case_Field="userid").
+
+    Weiszfeld's iteration is run for all users at once, starting from the mean centers. The iteration stops when
+    no center moves more than the tolerance (relative to the standard distance of the user's posts).
+
+    :param users: numpy array of user codes (one per post)
+    :param x: numpy array of x coordinates
+    :param y: numpy array of y coordinates
+    :param weights: numpy array of weights of the posts (None: all posts have weight 1)
+    :param tolerance: relative tolerance for the convergence
+    :param max_iterations: maximum number of iterations
+    :return: Pandas DataFrame with user code as index, and columns CenterX, CenterY
+    """
+    groups, group_users = group_index(users)
+    weights = np.ones(len(groups)) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    # Start from the mean centers
+    total = np.bincount(groups, weights=weights)
+    center_x = np.bincount(groups, weights=weights * x) / total
+    center_y = np.bincount(groups, weights=weights * y) / total
+
+    # Scale for the convergence criteria (standard distance, 1 meter for users with one location)
+    scale = np.sqrt(np.bincount(groups, weights=weights * ((x - center_x[groups]) ** 2 +
+                                                           (y - center_y[groups]) ** 2)) / total)
+    scale = np.maximum(scale, 1.0)
+
+    for i in range(max_iterations):
+        distance = np.hypot(x - center_x[groups], y - center_y[groups])
+
+        # Posts at the current center would divide by zero. Weiszfeld's iteration is continued with a small
+        # distance (the center does not move if all posts of the user are at the same location).
+        inverse = weights / np.maximum(distance, 1e-9 * scale[groups])
+
+        inverse_sum = np.bincount(groups, weights=inverse)
+        new_x = np.bincount(groups, weights=inverse * x) / inverse_sum
+        new_y = np.bincount(groups, weights=inverse * y) / inverse_sum
+
+        shift = np.hypot(new_x - center_x, new_y - center_y) / scale
+        center_x, center_y = new_x, new_y
+
+        if shift.max() < tolerance:
+            break
+
+    return pd.DataFrame({"CenterX": center_x, "CenterY": center_y}, index=pd.Index(group_users, name="user"))
+
+
+def unit_vector_mean_centers(users, lat, lon, weights=None):
+    """Mean center of each user computed from 3D unit vectors (earth-centered, earth-fixed coordinates on a
+    unit sphere). The mean vector is normalized back to the surface, so there is no projection distortion.
+
+    :param users: numpy array of user codes (one per post)
+    :param lat: numpy array of latitudes
+    :param lon: numpy array of longitudes
+    :param weights: numpy array of weights of the posts (None: all posts have weight 1)
+    :return: Pandas DataFrame with user code as index, and columns lat, lon
+    """
+    groups, group_users = group_index(users)
+    weights = np.ones(len(groups)) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+
+    # Sums of the unit vectors of each user (the length of the sum does not matter)
+    vx = np.bincount(groups, weights=weights * np.cos(lat_rad) * np.cos(lon_rad))
+    vy = np.bincount(groups, weights=weights * np.cos(lat_rad) * np.sin(lon_rad))
+    vz = np.bincount(groups, weights=weights * np.sin(lat_rad))
+
+    return pd.DataFrame({"lat": np.degrees(np.arctan2(vz, np.hypot(vx, vy))),
+                         "lon": np.degrees(np.arctan2(vy, vx))},
+                        index=pd.Index(group_users, name="user"))
+
+
+def centers_to_wgs84(centers):
+    """Add WGS84 coordinates (lat, lon) to projected centers of all users with one batched transformation
+
+    :param centers: Pandas DataFrame with columns CenterX, CenterY
+    :return: Pandas DataFrame with columns CenterX, CenterY, lat, lon
+    """
+    centers = centers.copy()
+    centers["lat"], centers["lon"] = unproject_points(centers["CenterX"].values, centers["CenterY"].values)
+
+    return centers
+
+
+#-----------------------------------------------------------------------
+# Standard distance and standard deviational ellipse
+#-----------------------------------------------------------------------
+def grouped_moments(users, x, y, weights=None):
+    """Weighted mean and second central moments of the coordinates of each user, in one pass over the posts.
+
+    The coordinates are shifted by the first post of each user before summing, so the moments do not lose
+    precision with large projected coordinates.
+
+    :param users: numpy array of user codes (one per post)
+    :param x: numpy array of x coordinates
+    :param y: numpy array of y coordinates
+    :param weights: numpy array of weights of the posts (None: all posts have weight 1)
+    :return: Pandas DataFrame with user code as index, and columns weight (sum of weights), CenterX, CenterY,
+             Sxx, Syy, Sxy (weighted means of the squared and cross deviations from the center)
+    """
+    groups, group_users = group_index(users)
+    weights = np.ones(len(groups)) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    # Coordinates relative to the first post of each user
+    first = np.zeros(len(group_users), dtype=np.int64)
+    first[groups[::-1]] = np.arange(len(groups))[::-1]
+    dx = x - x[first][groups]
+    dy = y - y[first][groups]
+
+    total = np.bincount(groups, weights=weights)
+    mean_dx = np.bincount(groups, weights=weights * dx) / total
+    mean_dy = np.bincount(groups, weights=weights * dy) / total
+
+    return pd.DataFrame({"weight": total,
+                         "CenterX": x[first] + mean_dx,
+                         "CenterY": y[first] + mean_dy,
+                         "Sxx": np.bincount(groups, weights=weights * dx * dx) / total - mean_dx ** 2,
+                         "Syy": np.bincount(groups, weights=weights * dy * dy) / total - mean_dy ** 2,
+                         "Sxy": np.bincount(groups, weights=weights * dx * dy) / total - mean_dx * mean_dy},
+                        index=pd.Index(group_users, name="user"))
+
+
+def standard_distances(users, x, y, weights=None, n_std=1, geometry=False):
+    """Standard distance circle of each user (same as arcpy StandardDistance_stats with Case_Field="userid").
+
+    :param users: numpy array of user codes (one per post)
+    :param x: numpy array of x coordinates
+    :param y: numpy array of y coordinates
+    :param weights: numpy array of weights of the posts (None: all posts have weight 1)
+    :param n_std: circle size in standard deviations
+    :param geometry: if True, return a GeoDataFrame with circle polygons (only needed for output)
+    :return: Pandas DataFrame with user code as index, and columns CenterX, CenterY, StdDist
+    """
+    moments = grouped_moments(users, x, y, weights)
+
+    circles = moments[["CenterX", "CenterY"]].copy()
+    circles["StdDist"] = n_std * np.sqrt(np.maximum(moments["Sxx"] + moments["Syy"], 0))
+
+    if geometry:
+        return gpd.GeoDataFrame(circles, geometry=ellipse_polygons(circles["CenterX"], circles["CenterY"],
+                                                                   circles["StdDist"], circles["StdDist"], 0),
+                                crs=PROJECTED_CRS)
+
+    return circles
+
+
+def standard_deviational_ellipses(users, x, y, weights=None, n_std=1, geometry=False):
+    """Standard deviational ellipse of each user (same as arcpy DirectionalDistribution_stats with
+    Case_Field="userid").
+
+    The axes are the eigenvectors of the covariance matrix of the coordinates. As in arcpy, the standard
+    deviations along the axes are multiplied by sqrt(2), YStdDist is along the major axis, and the rotation
+    is the angle of the y axis of the ellipse clockwise from north (0-180 degrees).
+
+    :param users: numpy array of user codes (one per post)
+    :param x: numpy array of x coordinates
+    :param y: numpy array of y coordinates
+    :param weights: numpy array of weights of the posts (None: all posts have weight 1)
+    :param n_std: ellipse size in standard deviations
+    :param geometry: if True, return a GeoDataFrame with ellipse polygons (only needed for output)
+    :return: Pandas DataFrame with user code as index, and columns CenterX, CenterY, XStdDist, YStdDist, Rotation
+    """
+    moments = grouped_moments(users, x, y, weights)
+
+    half_difference = (moments["Sxx"].values - moments["Syy"].values) / 2
+    half_sum = (moments["Sxx"].values + moments["Syy"].values) / 2
+    radius = np.hypot(half_difference, moments["Sxy"].values)
+
+    # Direction of the major axis counter-clockwise from east
+    major_angle = 0.5 * np.arctan2(moments["Sxy"].values, half_difference)
+
+    ellipses = moments[["CenterX", "CenterY"]].copy()
+    ellipses["XStdDist"] = n_std * np.sqrt(2 * np.maximum(half_sum - radius, 0))
+    ellipses["YStdDist"] = n_std * np.sqrt(2 * np.maximum(half_sum + radius, 0))
+    ellipses["Rotation"] = np.mod(90 - np.degrees(major_angle), 180)
+
+    if geometry:
+        return gpd.GeoDataFrame(ellipses, geometry=ellipse_polygons(ellipses["CenterX"], ellipses["CenterY"],
+                                                                    ellipses["XStdDist"], ellipses["YStdDist"],
+                                                                    ellipses["Rotation"]),
+                                crs=PROJECTED_CRS)
+
+    return ellipses
+
+
+def ellipse_polygons(center_x, center_y, x_radius, y_radius, rotation, n_vertices=72):
+    """Polygons of ellipses (or circles)
+
+    :param center_x: x coordinates of the centers
+    :param center_y: y coordinates of the centers
+    :param x_radius: radii along the x axes of the ellipses
+    :param y_radius: radii along the y axes of the ellipses
+    :param rotation: rotation of the y axes clockwise from north (degrees)
+    :param n_vertices: number of vertices of each polygon
+    :return: list of shapely polygons
+    """
+    center_x, center_y, x_radius, y_radius, rotation = np.broadcast_arrays(
+        *[np.asarray(values, dtype=np.float64)[:, None] if np.ndim(values) else np.float64(values)
+          for values in (center_x, center_y, x_radius, y_radius, rotation)])
+
+    angles = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    ex = x_radius * np.cos(angles)
+    ey = y_radius * np.sin(angles)
+
+    # Rotate clockwise
+    theta = np.radians(rotation)
+    px = center_x + ex * np.cos(theta) + ey * np.sin(theta)
+    py = center_y - ex * np.sin(theta) + ey * np.cos(theta)
+
+    return [Polygon(np.column_stack([ring_x, ring_y])) for ring_x, ring_y in zip(px, py)]
@@ -0,0 +1,653 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+Shared DBSCAN helpers for the clustering scripts (clusters_basic.py, clusters_hierarchical.py).
+
+Posting volume is very heavy-tailed, so the clustering adapts to the size of each user's posting history:
+    - pairwise: users with few posts are clustered from a full haversine distance matrix
+    - ball_tree: the default DBSCAN setup following G. Boeing 2018
+    - chunked: users with a very large number of posts are clustered with a chunked radius-neighbor search,
+      which keeps the memory use bounded by the chunk size instead of the whole neighborhood graph
+
+All paths return the same labels as sklearn DBSCAN with algorithm='ball_tree'.
+
+With min_samples=1, DBSCAN clusters are single-linkage clusters cut at epsilon. A single-linkage forest
+(the haversine minimum spanning tree of each user) can be built once, and cut at any epsilon afterwards
+(see build_single_linkage_forest and cut_single_linkage_forest).
+
+With min_samples > 1, the OPTICS reachability ordering of a user's points (computed once for each min_samples) gives
+the DBSCAN clusters for any epsilon up to the max_eps of the ordering (see optics_sweep_labels). This is used for the
+sensitivity analysis of epsilon and min_samples (clusters_sensitivity.py).
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+
+Note:
+    scikit-learn haversine distance requires the coordinates in latitude, longitude order (in radians)!
+"""
+import logging
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.cluster import DBSCAN, OPTICS, cluster_optics_dbscan
+from sklearn.metrics.pairwise import haversine_distances
+from sklearn.neighbors import BallTree
+
+logger = logging.getLogger(__name__)
+
+KMS_PER_RADIAN = 6371.0088
+
+# Users with at most this many posts are clustered using a full pairwise distance matrix
+PAIRWISE_MAX_POSTS = 200
+
+# Users with at least this many posts are clustered using the chunked neighbor search
+CHUNKED_MIN_POSTS = 10000
+
+# Number of query points in one chunk of the chunked neighbor search
+CHUNK_SIZE = 1000
+
+
+def select_cluster_path(n_points):
+    """Select the clustering path based on the number of points of one user.
+
+    :param n_points: number of points (posts) to be clustered
+    :return: name of the clustering path ("pairwise", "ball_tree" or "chunked")
+    """
+    if n_points <= PAIRWISE_MAX_POSTS:
+        return "pairwise"
+
+    elif n_points < CHUNKED_MIN_POSTS:
+        return "ball_tree"
+
+    else:
+        return "chunked"
+
+
+def cluster_points(geom_column, min_distance_in_km, n_posts=1, sample_weight=None):
+    """ Applies DBSCAN clustering method on a set of points using haversine (great-circle) distance.
+    Noisy samples are given the label -1.
+
+    Uses: https://scikit-learn.org/stable/modules/generated/sklearn.cluster.DBSCAN.html#sklearn.cluster.DBSCAN.fit
+    Haversine distance calculation following G. Boeing 2018 https://arxiv.org/pdf/1803.08101.pdf
+
+    :param geom_column: Geopandas GeoSeries that contains point geometries as Shapely points (geometry column).
+    :param min_distance_in_km: minimum distance in kilometers.
+    :param n_posts: Minimum number of points per cluster. if 1 (default), there will be no outliers.
+    :param sample_weight: optional weight of each point (e.g. number of posts at a location, see deduplicate_points)
+    :return: DBSCAN cluster labels as a numpy array
+    """
+    # NOTE! in shapely points, x=longitude (east-west), y=latitude (north-south).
+    return cluster_coordinates(geom_column.y, geom_column.x, min_distance_in_km, n_posts=n_posts,
+                               sample_weight=sample_weight)
+
+
+def cluster_coordinates(lat, lon, min_distance_in_km, n_posts=1, sample_weight=None):
+    """ Applies DBSCAN clustering method on a set of coordinates using haversine (great-circle) distance.
+    See cluster_points.
+
+    :param lat: latitudes in degrees
+    :param lon: longitudes in degrees
+    :param min_distance_in_km: minimum distance in kilometers.
+    :param n_posts: Minimum number of points per cluster. if 1 (default), there will be no outliers.
+    :param sample_weight: optional weight of each point (e.g. number of posts at a location, see deduplicate_points)
+    :return: DBSCAN cluster labels as a numpy array
+    """
+    epsilon = min_distance_in_km / KMS_PER_RADIAN
+
+    # In the Haversine distance calculation;
+    # "the first distance of each point is assumed to be the latitude, the second is the longitude, given in radians."
+    # So, we stack the coordinates in the order [latitude, longitude] / [Point.y, Point.x]
+    coords = np.radians(np.column_stack([np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)]))
+
+    path = select_cluster_path(len(coords))
+    logger.info("Clustering %s points using the %s path", len(coords), path)
+
+    if path == "pairwise":
+        # Small users: the full distance matrix is cheaper than building a tree
+        clustering = DBSCAN(eps=epsilon,
+                            min_samples=n_posts,
+                            metric='precomputed').fit(haversine_distances(coords), sample_weight=sample_weight)
+        return clustering.labels_
+
+    elif path == "chunked":
+        # Hot users: bounded memory neighbor search
+        return chunked_dbscan(coords, epsilon, n_posts, sample_weight=sample_weight)
+
+    # Get clusters using DBSCAN:
+    # https://scikit-learn.org/stable/modules/generated/sklearn.cluster.DBSCAN.html#sklearn.cluster.DBSCAN.fit
+    # Settings adapted from G. Boeing 2018 https://arxiv.org/pdf/1803.08101.pdf
+    clustering = DBSCAN(eps=epsilon,
+                        min_samples=n_posts,
+                        algorithm='ball_tree',
+                        metric='haversine').fit(coords, sample_weight=sample_weight)
+
+    return clustering.labels_
+
+
+def chunked_dbscan(coords, epsilon, min_samples, sample_weight=None, chunk_size=CHUNK_SIZE):
+    """DBSCAN with a chunked radius-neighbor search. Produces the same labels as sklearn DBSCAN:
+        - core points are connected into clusters, and clusters are numbered in the order of their first core point
+        - border points get the smallest label among the clusters of their core neighbors (like sklearn, which
+          expands the clusters one at a time)
+        - other points are noise (-1)
+
+    Only the neighbors of one chunk of query points are held in memory at a time.
+
+    :param coords: numpy array of [latitude, longitude] pairs in radians
+    :param epsilon: maximum distance between two neighbors in radians
+    :param min_samples: minimum number of points in the neighborhood of a core point (including the point itself)
+    :param sample_weight: optional weight of each point, the neighborhood of a core point has at least min_samples weight
+    :param chunk_size: number of query points per chunk
+    :return: cluster labels as a numpy array
+    """
+    n_points = len(coords)
+    labels = np.full(n_points, -1, dtype=np.int64)
+
+    if n_points == 0:
+        return labels
+
+    # Detect core points
+    if min_samples <= 1 and sample_weight is None:
+        is_core = np.ones(n_points, dtype=bool)
+
+    elif sample_weight is None:
+        tree = BallTree(coords, metric="haversine")
+        neighbor_counts = np.concatenate([tree.query_radius(coords[start:start + chunk_size], r=epsilon, count_only=True)
+                                          for start in range(0, n_points, chunk_size)])
+        is_core = neighbor_counts >= min_samples
+
+    else:
+        # Sum of the weights in the neighborhood of each point
+        sample_weight = np.asarray(sample_weight, dtype=float)
+        tree = BallTree(coords, metric="haversine")
+        neighbor_weights = []
+
+        for start in range(0, n_points, chunk_size):
+            neighbors = tree.query_radius(coords[start:start + chunk_size], r=epsilon)
+            offsets = np.concatenate([[0], np.cumsum([len(x) for x in neighbors])[:-1]])
+            neighbor_weights.append(np.add.reduceat(sample_weight[np.concatenate(neighbors)], offsets))
+
+        is_core = np.concatenate(neighbor_weights) >= min_samples
+
+    core_index = np.flatnonzero(is_core)
+
+    if len(core_index) == 0:
+        return labels
+
+    # Connect core points chunk by chunk, keeping only the current component of each core point in memory
+    core_coords = coords[core_index]
+    core_tree = BallTree(core_coords, metric="haversine")
+    components = np.arange(len(core_index))
+
+    for start in range(0, len(core_index), chunk_size):
+        neighbors = core_tree.query_radius(core_coords[start:start + chunk_size], r=epsilon)
+        rows = np.repeat(np.arange(start, start + len(neighbors)), [len(x) for x in neighbors])
+        components = _merge_components(components, rows, np.concatenate(neighbors))
+
+    # Number the clusters in the order of their first core point
+    _, first_index, inverse = np.unique(components, return_index=True, return_inverse=True)
+    core_labels = np.argsort(np.argsort(first_index))[inverse.ravel()]
+    labels[core_index] = core_labels
+
+    # Border points take the smallest cluster label among their core neighbors
+    other_index = np.flatnonzero(~is_core)
+
+    for start in range(0, len(other_index), chunk_size):
+        chunk = other_index[start:start + chunk_size]
+        neighbors = core_tree.query_radius(coords[chunk], r=epsilon)
+        n_neighbors = np.array([len(x) for x in neighbors])
+        has_neighbors = n_neighbors > 0
+
+        if has_neighbors.any():
+            neighbor_labels = core_labels[np.concatenate(neighbors[has_neighbors])]
+            offsets = np.concatenate([[0], np.cumsum(n_neighbors[has_neighbors])[:-1]])
+            labels[chunk[has_neighbors]] = np.minimum.reduceat(neighbor_labels, offsets)
+
+    return labels
+
+
+def _merge_components(components, rows, cols):
+    """Merge the current components of core points with a new set of edges between them."""
+    n_core = len(components)
+    nodes = np.arange(n_core)
+
+    # Each point is linked to the representative of its current component, plus the new edges
+    graph = coo_matrix((np.ones(n_core + len(rows), dtype=np.int8),
+                        (np.concatenate([nodes, rows]), np.concatenate([components, cols]))),
+                       shape=(n_core, n_core)).tocsr()
+
+    _, merged = connected_components(graph, directed=False)
+
+    # Use the first point of each component as its representative
+    _, first_index = np.unique(merged, return_index=True)
+
+    return first_index[merged]
+
+
+def cluster_users_connected_components(lat, lon, users, min_distance_in_km):
+    """Cluster the points of all users at once for the special case min_samples=1.
+
+    With min_samples=1 every point is a core point, and DBSCAN reduces to the connected components of the
+    radius-neighbors graph (single-linkage clusters cut at epsilon). The radius-neighbors graph of each user
+    is built as a block of one sparse CSR matrix, and all users are labeled with one connected components call.
+    Hot users (see select_cluster_path) are first labeled with the chunked search and added to the graph as
+    one star per cluster, so that their neighborhood graph is never held in memory.
+
+    :param lat: numpy array of latitudes in degrees
+    :param lon: numpy array of longitudes in degrees
+    :param users: array of user identifiers for each point
+    :param min_distance_in_km: minimum distance in kilometers.
+    :return: cluster labels as a numpy array (in the input order). Labels start from 0 for each user and are
+             numbered in the same order as DBSCAN labels.
+    """
+    epsilon = min_distance_in_km / KMS_PER_RADIAN
+
+    # Sort points by user so that each user gets one contiguous block in the graph
+    order, block_starts, block_stops = _user_blocks(users)
+    coords = np.radians(np.column_stack([np.asarray(lat), np.asarray(lon)]))[order]
+
+    rows = []
+    cols = []
+
+    for start, stop in zip(block_starts, block_stops):
+        block = coords[start:stop]
+        path = select_cluster_path(len(block))
+
+        if path == "pairwise":
+            block_rows, block_cols = np.nonzero(haversine_distances(block) <= epsilon)
+
+        elif path == "ball_tree":
+            neighbors = BallTree(block, metric="haversine").query_radius(block, r=epsilon)
+            block_rows = np.repeat(np.arange(len(block)), [len(x) for x in neighbors])
+            block_cols = np.concatenate(neighbors)
+
+        else:
+            # Link each point to the first point of its cluster
+            block_labels = chunked_dbscan(block, epsilon, 1)
+            _, first_index = np.unique(block_labels, return_index=True)
+            block_rows = np.arange(len(block))
+            block_cols = first_index[block_labels]
+
+        rows.append(block_rows + start)
+        cols.append(block_cols + start)
+
+    rows = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.array([], dtype=np.int64)
+
+    # Block-diagonal radius-neighbors graph of all users
+    return _label_user_blocks(rows, cols, order, block_starts, block_stops)
+
+
+def _user_blocks(users):
+    """Order the points by user, and get the start and stop position of each user's block in that order."""
+    _, user_codes = np.unique(np.asarray(users), return_inverse=True)
+    user_codes = user_codes.ravel()
+
+    order = np.argsort(user_codes, kind="stable")
+    block_starts = np.flatnonzero(np.r_[True, np.diff(user_codes[order]) != 0]) if len(order) else np.array([], dtype=np.int64)
+    block_stops = np.r_[block_starts[1:], len(order)].astype(np.int64)
+
+    return order, block_starts, block_stops
+
+
+def _label_user_blocks(rows, cols, order, block_starts, block_stops):
+    """Label the connected components of a block-diagonal graph (one block per user, in the user-sorted order).
+    Components are numbered in the order of their first point and start from 0 within each user, like DBSCAN labels.
+    Returns the labels in the input order."""
+    n_points = len(order)
+
+    graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n_points, n_points)).tocsr()
+    _, components = connected_components(graph, directed=False)
+
+    # Number the components in the order of their first point, and start from 0 within each user
+    _, first_index, inverse = np.unique(components, return_index=True, return_inverse=True)
+    ordered = np.argsort(np.argsort(first_index))[inverse.ravel()]
+    user_first_label = ordered[block_starts]
+    local_labels = ordered - np.repeat(user_first_label, block_stops - block_starts)
+
+    # Back to the input order
+    labels = np.empty(n_points, dtype=np.int64)
+    labels[order] = local_labels
+
+    return labels
+
+
+def build_single_linkage_forest(lat, lon, users):
+    """Build the haversine minimum spanning tree of each user's points (a single-linkage forest).
+
+    Cutting the forest at epsilon (dropping edges longer than epsilon) gives the DBSCAN clusters
+    with min_samples=1 for every user, so a forest can answer any number of epsilon values.
+    Each user's tree is built with Prim's algorithm, which needs memory only for one row of distances.
+
+    :param lat: numpy array of latitudes in degrees
+    :param lon: numpy array of longitudes in degrees
+    :param users: array of user identifiers for each point
+    :return: forest as a dictionary of numpy arrays (see save_single_linkage_forest)
+    """
+    order, block_starts, block_stops = _user_blocks(users)
+    coords = np.radians(np.column_stack([np.asarray(lat), np.asarray(lon)]))[order]
+
+    edge_from = []
+    edge_to = []
+    edge_distance = []
+
+    for start, stop in zip(block_starts, block_stops):
+        block_from, block_to, block_distance = _haversine_mst(coords[start:stop])
+        edge_from.append(block_from + start)
+        edge_to.append(block_to + start)
+        edge_distance.append(block_distance)
+
+    forest = {"order": order.astype(np.int64),
+              "block_starts": block_starts.astype(np.int64),
+              "block_stops": block_stops.astype(np.int64),
+              "edge_from": np.concatenate(edge_from).astype(np.int32) if edge_from else np.array([], dtype=np.int32),
+              "edge_to": np.concatenate(edge_to).astype(np.int32) if edge_to else np.array([], dtype=np.int32),
+              "edge_distance": np.concatenate(edge_distance) if edge_distance else np.array([])}
+
+    return forest
+
+
+def save_single_linkage_forest(forest, fp):
+    """Save a single-linkage forest into a compressed numpy file. The forest contains:
+        - order: position of each point in the input, ordered by user
+        - block_starts, block_stops: start and stop of each user's points in that order
+        - edge_from, edge_to, edge_distance: minimum spanning tree edges (n_points - n_users edges in total),
+          as positions in the user-ordered points, and the haversine distance in radians
+
+    :param forest: forest from build_single_linkage_forest
+    :param fp: output file path (.npz)
+    """
+    np.savez_compressed(fp, **forest)
+
+
+def load_single_linkage_forest(fp):
+    """Read a single-linkage forest saved with save_single_linkage_forest"""
+    with np.load(fp) as data:
+        forest = {key: data[key] for key in data.files}
+
+    return forest
+
+
+def cut_single_linkage_forest(forest, min_distance_in_km):
+    """Cut a single-linkage forest at epsilon.
+
+    :param forest: forest from build_single_linkage_forest
+    :param min_distance_in_km: minimum distance in kilometers (DBSCAN epsilon).
+    :return: cluster labels as a numpy array in the input order, same as DBSCAN labels with min_samples=1
+    """
+    epsilon = min_distance_in_km / KMS_PER_RADIAN
+    keep = forest["edge_distance"] <= epsilon
+
+    return _label_user_blocks(forest["edge_from"][keep], forest["edge_to"][keep],
+                              forest["order"], forest["block_starts"], forest["block_stops"])
+
+
+def _haversine_mst(coords):
+    """Minimum spanning tree of a set of [latitude, longitude] points (radians) using Prim's algorithm."""
+    n_points = len(coords)
+
+    if n_points < 2:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+
+    in_tree = np.zeros(n_points, dtype=bool)
+    in_tree[0] = True
+    nearest = np.zeros(n_points, dtype=np.int64)
+    distance = haversine_distances(coords[:1], coords)[0]
+    distance[0] = np.inf
+
+    edge_from = np.empty(n_points - 1, dtype=np.int64)
+    edge_to = np.empty(n_points - 1, dtype=np.int64)
+    edge_distance = np.empty(n_points - 1)
+
+    for i in range(n_points - 1):
+        # Closest point outside the tree
+        point = np.argmin(distance)
+        edge_from[i], edge_to[i], edge_distance[i] = nearest[point], point, distance[point]
+
+        in_tree[point] = True
+        distance[point] = np.inf
+
+        # Update the distances to the tree
+        new_distance = haversine_distances(coords[point:point + 1], coords)[0]
+        closer = (new_distance < distance) & ~in_tree
+        distance[closer] = new_distance[closer]
+        nearest[closer] = point
+
+    return edge_from, edge_to, edge_distance
+
+
+def optics_sweep_labels(lat, lon, eps_values_km, min_samples, sample_weight=None):
+    """DBSCAN labels of one user's points for many epsilon values, extracted from one OPTICS reachability ordering.
+
+    The ordering is computed once with max_eps = the largest epsilon, and the labels for each epsilon are read from it
+    (sklearn cluster_optics_dbscan), and the border points are assigned to the cluster of their nearest core point.
+    Core points and noise are the same as with DBSCAN, but a border point (within epsilon of several clusters) may get
+    the label of another one of its clusters than with DBSCAN.
+    OPTICS does not support sample weights, so weighted points (see deduplicate_points) are repeated by their weight.
+
+    :param lat: latitudes in degrees
+    :param lon: longitudes in degrees
+    :param eps_values_km: list of minimum distances in kilometers (DBSCAN epsilon)
+    :param min_samples: minimum number of points (posts) in the neighborhood of a core point, at least 2
+                        (with min_samples=1, use cut_single_linkage_forest)
+    :param sample_weight: optional integer weight of each point (e.g. number of posts at a location). Fractional
+                          weights (e.g. from period_weights.post_weights) are not supported.
+    :return: numpy array of cluster labels with one row for each epsilon (noise: -1)
+    """
+    coords = np.radians(np.column_stack([np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)]))
+
+    if sample_weight is None:
+        sample_weight = np.ones(len(coords), dtype=np.int64)
+
+    if np.any(np.mod(sample_weight, 1) != 0):
+        raise ValueError("OPTICS sweep requires integer sample weights (points are repeated by their weight)")
+
+    # Repeat each point by its weight, the labels are read at the first copy of each point
+    sample_weight = np.asarray(sample_weight, dtype=np.int64)
+    repeated = np.repeat(np.arange(len(coords)), sample_weight)
+    first_copy = np.r_[0, np.cumsum(sample_weight)[:-1]]
+
+    labels = np.full((len(eps_values_km), len(coords)), -1, dtype=np.int64)
+
+    # Not enough posts for a single core point: all points are noise
+    if len(repeated) < min_samples:
+        return labels
+
+    max_eps = max(eps_values_km) / KMS_PER_RADIAN
+
+    with warnings.catch_warnings():
+        # All points farther than max_eps from each other: all reachabilities are inf, and all points are noise
+        warnings.filterwarnings("ignore", message="All reachability values are inf")
+
+        if select_cluster_path(len(repeated)) == "pairwise":
+            optics = OPTICS(min_samples=min_samples, max_eps=max_eps,
+                            metric="precomputed").fit(haversine_distances(coords[repeated]))
+        else:
+            optics = OPTICS(min_samples=min_samples, max_eps=max_eps, algorithm="ball_tree",
+                            metric="haversine").fit(coords[repeated])
+
+    core_distances = optics.core_distances_[first_copy]
+
+    for i, eps in enumerate(eps_values_km):
+        epsilon = eps / KMS_PER_RADIAN
+        labels[i] = cluster_optics_dbscan(reachability=optics.reachability_, core_distances=optics.core_distances_,
+                                          ordering=optics.ordering_, eps=epsilon)[first_copy]
+
+        # Border points that come before their core neighbors in the ordering are labeled as noise by OPTICS.
+        # Each non-core point within epsilon of a core point gets the label of its nearest core point.
+        core = core_distances <= epsilon
+
+        if core.any() and not core.all():
+            distance, nearest = BallTree(coords[core], metric="haversine").query(coords[~core], k=1)
+            border_labels = np.where(distance[:, 0] <= epsilon, labels[i][core][nearest[:, 0]], -1)
+            labels[i][~core] = border_labels
+
+    return labels
+
+
+def great_circle_distances(lat1, lon1, lat2, lon2):
+    """Vectorized great-circle distance in meters, using the same formula as geopy.distance.great_circle.
+
+    :param lat1: latitude(s) of the first point(s) in degrees
+    :param lon1: longitude(s) of the first point(s) in degrees
+    :param lat2: latitude(s) of the second point(s) in degrees
+    :param lon2: longitude(s) of the second point(s) in degrees
+    :return: numpy array of distances in meters
+    """
+    lat1, lon1, lat2, lon2 = [np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2)]
+
+    sin_lat1, cos_lat1 = np.sin(lat1), np.cos(lat1)
+    sin_lat2, cos_lat2 = np.sin(lat2), np.cos(lat2)
+    delta_lon = lon2 - lon1
+    cos_delta_lon, sin_delta_lon = np.cos(delta_lon), np.sin(delta_lon)
+
+    d = np.arctan2(np.sqrt((cos_lat2 * sin_delta_lon) ** 2 + (cos_lat1 * sin_lat2 - sin_lat1 * cos_lat2 * cos_delta_lon) ** 2),
+                   sin_lat1 * sin_lat2 + cos_lat1 * cos_lat2 * cos_delta_lon)
+
+    # geopy.distance.EARTH_RADIUS in meters
+    return 6371009 * d
+
+
+def deduplicate_points(users, lat, lon, weights=None):
+    """Collapse posts at identical locations of the same user into unique points with multiplicity weights.
+
+    Clustering the unique points with the weights as sample_weight gives the same labels as clustering all posts,
+    and summarize_clusters gives the same cluster sizes and centroids when the weights are passed to it.
+
+    :param users: array of user identifiers for each post
+    :param lat: numpy array of latitudes in degrees
+    :param lon: numpy array of longitudes in degrees
+    :param weights: optional weight of each post (e.g. 1 / posts of the user on the same day, see period_weights.py).
+                    The weight of a unique point is the sum of the weights of its posts (default: number of posts).
+    :return: Pandas DataFrame of unique points (columns userid, lat, lon and weight, in the order of first appearance)
+             and a numpy array with the position of each post in the unique points (for expanding labels back to posts)
+    """
+    points = pd.DataFrame({"userid": np.asarray(users), "lat": np.asarray(lat, dtype=float),
+                           "lon": np.asarray(lon, dtype=float)})
+
+    # Groups are numbered in the order of their first post
+    point_index = points.groupby(["userid", "lat", "lon"], sort=False).ngroup().values
+
+    unique_points = points.loc[~points.duplicated(["userid", "lat", "lon"])].reset_index(drop=True)
+    unique_points["weight"] = np.bincount(point_index, weights=weights, minlength=len(unique_points))
+
+    return unique_points, point_index
+
+
+def summarize_clusters(users, labels, lat, lon, weights=None):
+    """Get the size and the most central point of each cluster, and flag the biggest cluster(s) of each user.
+    Vectorized version of the get_centermost_point loop in the clustering scripts: the centroid of a cluster is
+    the average of its coordinates, and the centermost point is the first point with the minimum great-circle
+    distance to the centroid.
+
+    :param users: array of user identifiers for each point
+    :param labels: cluster labels for each point
+    :param lat: numpy array of latitudes in degrees
+    :param lon: numpy array of longitudes in degrees
+    :param weights: optional weight of each point (e.g. number of posts at a location, see deduplicate_points).
+                    Cluster sizes are sums of the weights, and centroids are weighted averages.
+    :return: Pandas DataFrame with one row per cluster and columns userid, cluster_code, cluster_size,
+             lat and lon (of the centermost point) and largest_cluster
+    """
+    points = pd.DataFrame({"userid": np.asarray(users), "cluster_code": np.asarray(labels),
+                           "lat": np.asarray(lat, dtype=float), "lon": np.asarray(lon, dtype=float),
+                           "weight": 1 if weights is None else np.asarray(weights)})
+
+    points["weighted_lat"] = points["lat"] * points["weight"]
+    points["weighted_lon"] = points["lon"] * points["weight"]
+
+    grouped = points.groupby(["userid", "cluster_code"], sort=True)
+    cluster_weight = grouped["weight"].transform("sum")
+
+    # Distance from each point to the (weighted) centroid of its cluster
+    points["distance"] = great_circle_distances(points["lat"], points["lon"],
+                                                grouped["weighted_lat"].transform("sum") / cluster_weight,
+                                                grouped["weighted_lon"].transform("sum") / cluster_weight)
+
+    clusters = points.loc[grouped["distance"].idxmin(), ["userid", "cluster_code", "lat", "lon"]]
+    clusters["cluster_size"] = grouped["weight"].sum().values
+    clusters["largest_cluster"] = clusters["cluster_size"] == clusters.groupby("userid")["cluster_size"].transform("max")
+
+    clusters.index = clusters["userid"].astype(str) + "_" + clusters["cluster_code"].astype(str)
+
+    return clusters
+
+
+def join_cluster_regions(clusters, posts, region_columns):
+    """Join region info to cluster centers from the posts located at the same coordinates.
+
+    Same as the spatial join (op="intersects") between the cluster centers and the posts in the clustering scripts:
+    a cluster center is one of the posts, and gets one row per post at identical coordinates.
+
+    :param clusters: cluster DataFrame from summarize_clusters
+    :param posts: DataFrame of posts with columns lat, lon and the region columns
+    :param region_columns: list of region columns to join
+    :return: clusters with region columns
+    """
+    joined = clusters.reset_index().merge(posts[["lat", "lon"] + list(region_columns)], on=["lat", "lon"], how="left")
+
+    return joined.set_index("index")
+
+
+def origin_candidates(clusters, reg_col="FIPS"):
+    """Rank the candidate origin regions of each user based on the location of the user's clusters.
+
+    Each (user, region) pair is scored with grouped reductions over the clusters:
+        1. number of the user's biggest clusters in the region
+        2. number of clusters (of any size) in the region
+        3. number of posts in clusters in the region
+    and the regions of each user are sorted by the scores in lexicographic order (descending), then by region.
+
+    :param clusters: cluster DataFrame with columns userid, cluster_size, largest_cluster and the region column
+    :param reg_col: region column (default: "FIPS": per country code)
+    :return: Pandas DataFrame with one row for each user and region with at least one of the user's biggest clusters:
+             userid, region column, largest_clusters, clusters, posts (sorted by userid and rank)
+    """
+    table = clusters[["userid", reg_col, "cluster_size", "largest_cluster"]].dropna(subset=[reg_col])
+
+    scores = table.groupby(["userid", reg_col]).agg(largest_clusters=("largest_cluster", "sum"),
+                                                     clusters=("largest_cluster", "size"),
+                                                     posts=("cluster_size", "sum")).reset_index()
+
+    # Only regions with at least one of the user's biggest clusters are candidates
+    scores = scores[scores["largest_clusters"] > 0]
+
+    return scores.sort_values(["userid", "largest_clusters", "clusters", "posts", reg_col],
+                              ascending=[True, False, False, False, True]).reset_index(drop=True)
+
+
+def get_user_origins(clusters, reg_col="FIPS", return_ties=False):
+    """Determine origin country for users based on location of (1-x) biggest cluster(s).
+        1. Country with most of the user's biggest clusters
+        2. If many countries are tied, country with most clusters (of any size) among those countries
+        3. If still tied, country with most posts in clusters among those countries
+    The rule is resolved for all users at once as a lexicographic arg-max of the scores (see origin_candidates).
+    If the countries are still tied after the post counts, the first country (by code) is selected.
+
+    :param clusters: cluster DataFrame with columns userid, cluster_size, largest_cluster and the region column
+    :param reg_col: region column (default: "FIPS": per country code)
+    :param return_ties: return also the flag of the users that remain tied after all three rules
+    :return: Pandas Series of origin regions with userid as index (and Pandas Series of tie flags)
+    """
+    ranked = origin_candidates(clusters, reg_col=reg_col)
+
+    first = ~ranked["userid"].duplicated().values
+    origins = pd.Series(ranked[reg_col].values[first], index=ranked["userid"].values[first], dtype=object)
+
+    if not return_ties:
+        return origins
+
+    # Users whose 2nd candidate has the same scores as the 1st one
+    scores = ranked[["largest_clusters", "clusters", "posts"]].values
+    same_user = ranked["userid"].values[1:] == ranked["userid"].values[:-1]
+    same_scores = (scores[1:] == scores[:-1]).all(axis=1)
+
+    tied = pd.Series(False, index=origins.index)
+    tied.loc[ranked["userid"].values[:-1][same_user & same_scores & first[:-1]]] = True
+
+    return origins, tied
@@ -16,6 +16,8 @@ The script does the following things:
     - All posts from all users who visited Kruger in 2014
         --> Exclude posts within target area (Kruger) from further analysis
 2. Get clusters for each user using DBSCAN
+    --> Users with all posts in one country get it as origin directly, and are not clustered
+    --> Posts at identical locations are collapsed into unique points, weighted by the number of posts
     --> Find centermost point for each cluster (Using G. Boeing's approach).
     --> Join info about country to cluster center points
 3. Find biggest cluster(s) for each user
@@ -51,109 +53,16 @@ usage:
     If min_points is not defined, it defaults to 1.
 """
 import pandas as pd
-import geopandas as gpd
 import os
 import sys
-import numpy as np
-from sklearn.cluster import DBSCAN
-from shapely.geometry import Point, MultiPoint
-from geopy.distance import great_circle
+from cluster_utils import cluster_coordinates, cluster_users_connected_components, deduplicate_points, \
+    get_user_origins, join_cluster_regions, select_cluster_path, summarize_clusters
+from period_weights import post_weights
+from post_table import decode, read_post_table, split_trivial_users
+from result_store import input_hash, lookup_result, result_key, store_result
+from target_areas import exclude_target_area
 
 
-def cluster_points(geom_column, min_distance_in_km, n_posts=1):
-    """ Applies DBSCAN clustering method on a set of points using haversine (great-circle) distance. 
-    Noisy samples are given the label -1.
-    
-    Uses: https://scikit-learn.org/stable/modules/generated/sklearn.cluster.DBSCAN.html#sklearn.cluster.DBSCAN.fit
-    Haversine distance calculation following G. Boeing 2018 https://arxiv.org/pdf/1803.08101.pdf
-
-    :param geom_column: Geopandas GeoSeries that contains point geometries as Shapely points (geometry column).
-    :param min_distance_in_km: minimum distance in kilometers.
-    :param n_posts: Minimum number of points per cluster. if 1 (default), there will be no outliers.
-    :return: DBSCAN cluster labels as a Pandas Series
-    """
-    kms_per_radian = 6371.0088
-    epsilon = min_distance_in_km / kms_per_radian
-
-    # Prepare geometry column into the correct format
-    # NOTE! in shapely points, x=longitude (east-west), y=latitude (north-south).
-    # In the Haversine distance calculation;
-    # "the first distance of each point is assumed to be the latitude, the second is the longitude, given in radians."
-    # So, we create a list of coordinate pairs in the order [latitude, longitude] / [Point.y, Point.x]
-    coords_list = list(zip(geom_column.y, geom_column.x))
-
-    # Get clusters using DBSCAN:
-    # https://scikit-learn.org/stable/modules/generated/sklearn.cluster.DBSCAN.html#sklearn.cluster.DBSCAN.fit
-    # Settings adapted from G. Boeing 2018 https://arxiv.org/pdf/1803.08101.pdf
-    clustering = DBSCAN(eps=epsilon,
-                        min_samples=n_posts,
-                        algorithm='ball_tree',
-                        metric='haversine').fit(np.radians(coords_list))
-
-    return clustering.labels_
-
-
-def get_centermost_point(points_in_cluster):
-    """Get the point in a cluster which is closest to the geographic cluster centroid.
-    Adapted from G. Boeing 2018 https://arxiv.org/pdf/1803.08101.pdf
-
-    :param points_in_cluster: Geopandas GeoSeries that contains point geometries of the cluster as Shapely points (the geometry column of one cluster)
-    :return: Shapely point that contains the geometry (x, y) / (longitude, latitude) of the most central point
-    """
-
-    # Define cluster centroid (might be that none of the points is located exactly here).
-    centroid = Point(MultiPoint(points_in_cluster.to_list()).centroid.x, MultiPoint(points_in_cluster.to_list()).centroid.y)
-
-    # Define point closest to cluster centroid (following G. Boeing 2018).
-    # NOTE: geopy great circle takes in coordinates in the order latitude, longitude (y,x)
-    cluster_coords = list(zip(points_in_cluster.y, points_in_cluster.x))
-    centermost_y, centermost_x = min(cluster_coords, key=lambda point: great_circle(point, (centroid.y, centroid.x)).m)
-
-    # Convert coordiantes to a shapely point Point(lon, lat)
-    centermost_point = Point(centermost_x, centermost_y)
-
-    return centermost_point
-
-
-def get_origin_country(clusters_df, reg_col='FIPS'):
-    """ Determine which country has most clusters in case of many candidates
-
-    :param clusters_df: demo_data frame with biggest cluster(s), with a column for region info.
-    :param reg_col: column to use to summarize number of points (default: "FIPS": per country code)
-    :return: country code (str) or a list of country codes
-    """
-
-    # Check if there are more than one clusters with the largest number of posts
-    if len(clusters_df) > 1:
-
-        # Number of clusters per country (can be one country or many countries)
-        value_counts = clusters_df[reg_col].value_counts()
-
-        # Check if there are more than one countries listed 
-        if len(value_counts) > 1:
-
-            # Series of countries which had most clusters (can be one country or many countries)
-            countries_with_most_clusters = value_counts[value_counts == value_counts.max()]
-
-            # Check if there is more than one country with maximum number of clusters
-            if len(countries_with_most_clusters) > 1:
-
-                # List countries with equal number of biggest clusters
-                orig = list(countries_with_most_clusters.index)
-
-            else:
-                orig = value_counts.idxmax()
-
-        else:
-            # In case there is only one country with the largest number of cluster centers
-            orig = value_counts.index[0]
-
-    else:
-        # If there was only one cluster to begin with
-        orig = clusters_df.at[clusters_df.index[0], reg_col]
-
-    return orig
-
 #-----------------------
 # Settings
 #-----------------------
@@ -169,8 +78,23 @@ except:
 # minimum distance in kilometers
 min_points = 1
 
+# Weighting of the posts (None: each post counts once, "day": each day with posts counts once,
+# "location_day": each location counts once per day). See period_weights.py.
+# NOTE! With weights, min_points is the minimum sum of the weights (e.g. number of days) in the neighborhood of a
+# core point. Weighted posts are always clustered with DBSCAN sample weights (also with min_points=1).
+post_weighting = None
+
+# Exclude also the posts within +-trip_days days of the visit to the target area (None: only the target area posts)
+trip_days = None
+
+# Suffix of the result names if the posts within the trip window are also excluded
+trip_suffix = "" if trip_days is None else "_trip_%sd" % trip_days
+
+# Suffix of the result names if the posts are weighted
+weight_suffix = "" if post_weighting is None else "_%s_weights" % post_weighting
+
 # Create column name for final output with info of used min_distance
-method_name = "basic_dbscan_%s_km" % min_distance
+method_name = "basic_dbscan_%s_km%s%s" % (min_distance, weight_suffix, trip_suffix)
 
 # --------------------------
 # Read in demo_data
@@ -181,138 +105,131 @@ print("Reading demo_data..")
 #each point is assigned to the nearest region if found not on land. Also duplicates have been removed
 fp = r"./demo_data/fake_input_data.shp"
 
-#read demo_data with geopandas
-some = gpd.read_file(fp)
+# Key of the result in the result store: method, parameters and hash of the input data
+data_hash = input_hash(fp)
+params = {"eps": min_distance, "min_points": min_points, "region_level": "FIPS"}
+
+if post_weighting is not None:
+    params["weights"] = post_weighting
+
+if trip_days is not None:
+    params["trip_days"] = trip_days
+
+key = result_key("basic_dbscan", params, data_hash)
+
+# Skip the run if the same result already exists
+if lookup_result(key) is not None:
+    print("Result %s (%s) is already in the result store, skipping.." % (method_name, key))
+    sys.exit()
+
+# Read demo_data into a compact post table: coordinates, and integer codes for users and regions.
+# Original user ids and region values are in the codebooks, and are decoded only for output.
+some, codebooks = read_post_table(fp)
 
 # Print layer info
 print("Number of posts:", len(some))
-print("Number of users:", some.userid.nunique())
+print("Number of users:", some.user.nunique())
 
 # EXCLUDE POSTS WITHIN KRUGER NATIONAL PARK (ASSUME NO ONE LIVES THERE..even though in fact people do live there..)
-some = some[some["FromKruger"] == 0]
+some = exclude_target_area(some, some["FromKruger"].values == 1, trip_days)
 
 # Print layer info
 print("\nAfter excluding posts from Kruger:")
 print("Number of posts:", len(some))
-print("Number of users:", some.userid.nunique(), "\n")
+print("Number of users:", some.user.nunique(), "\n")
+
+# Weights of the posts (1 for each post, if post_weighting is None)
+some["weight"] = post_weights(some, post_weighting)
 
 # -----------------------------------
-# Get clusters for all users
+# Fast path for users with all posts in one region
 # -----------------------------------
-print("Getting clusters..")
 
-# add new column for cluster labels 
-some["cluster"] = ""
+# Every method gives these users their only region, so they are not clustered
+trivial_users, clustered = split_trivial_users(some, "FIPS")
 
-# Group by userid
-grouped = some.groupby("userid")
+# -----------------------------------
+# Get clusters for all other users
+# -----------------------------------
+print("Getting clusters..")
 
-# For each user, detect clusters
-for key, group in grouped:
-    clusters = cluster_points(group.geometry, min_distance_in_km=min_distance, n_posts=min_points)
-    some.loc[some["userid"] == key, "cluster"] = clusters
+# Collapse posts at identical locations of the same user into unique points.
+# The number of posts (or the sum of the post weights) at each location is used as a weight.
+unique_points, point_index = deduplicate_points(clustered["user"].values, clustered["lat"].values,
+                                                clustered["lon"].values, weights=clustered["weight"].values)
 
-# --------------------------------------
-# Get most central point for all clusters
-# --------------------------------------
-print("Finding most central point for each cluster..(this takes a few moments)")
+print("Number of unique user locations:", len(unique_points))
+
+# Clustering path (pairwise / ball_tree / chunked) used for each user, depends on the number of locations
+cluster_paths = unique_points.groupby("userid").size().apply(select_cluster_path)
 
-# Group by user AND cluster
-grouped = some.groupby(["userid", "cluster"])
+print("Number of users per clustering path:")
+print(cluster_paths.value_counts().to_string(), "\n")
 
-# DataFrame for cluster info
-cluster_results = gpd.GeoDataFrame(index=grouped.groups.keys())
-cluster_results["geometry"] = ""
+if min_points == 1 and post_weighting is None:
+    # With min_points=1 there are no outliers, and DBSCAN clusters are the connected components
+    # of the radius-neighbors graph. Cluster all users at once.
+    # NOTE! This ignores the weights, so weighted posts are clustered with DBSCAN below.
+    unique_points["cluster"] = cluster_users_connected_components(unique_points["lat"].values,
+                                                                  unique_points["lon"].values,
+                                                                  unique_points["userid"].values,
+                                                                  min_distance_in_km=min_distance)
 
-# For each cluster, find the most central point
-for key, group in grouped:
-    
-    # Add info of cluster size
-    cluster_size = len(group)
-    cluster_results.loc[key, "cluster_size"] = cluster_size
+else:
+    # add new column for cluster labels
+    unique_points["cluster"] = -1
 
-    # Find the point that is closest to the geographic center of the cluster
-    centermost_point = get_centermost_point(group["geometry"])
+    # For each user, detect clusters (the number of posts or the sum of the post weights at each location is
+    # used as sample weight)
+    for key, group in unique_points.groupby("userid"):
+        unique_points.loc[group.index, "cluster"] = cluster_coordinates(group["lat"], group["lon"],
+                                                                        min_distance_in_km=min_distance,
+                                                                        n_posts=min_points,
+                                                                        sample_weight=group["weight"])
 
-    # Add point closest to cluster centroid to geodataframe as a shapely point
-    cluster_results.loc[key, "geometry"] = centermost_point
+# Expand cluster labels back to the posts
+clustered["cluster"] = unique_points["cluster"].values[point_index]
 
 # --------------------------------------
-# Find biggest cluster for each user
+# Get most central point for all clusters
 # --------------------------------------
-print("Finding each user's biggest cluster..")
-
-# add userid and cluster code into own column (just because multi index is a bit complex to grasp..) 
-cluster_results["userid"] = cluster_results.index.get_level_values(0)
-cluster_results["cluster_code"] = cluster_results.index.get_level_values(1)
-
-grouped = cluster_results.groupby("userid")
-
-# Biggest cluster per user
-#grouped.cluster_size.max()
+print("Finding most central point for each cluster..")
 
-for key, group in grouped:
-    # Get size of the biggest cluster for this user (could be multiple clusters..)
-    biggest_cluster_size = group.cluster_size.max()
-
-    # Find rows for this user in the cluster results which represent this user's largest cluster (could be multiple)
-    condition = (cluster_results["userid"] == key) & (cluster_results["cluster_size"] == biggest_cluster_size)
-    cluster_results.loc[condition, "largest_cluster"] = True
+# Cluster sizes and centroids are weighted with the number of posts at each location.
+# Each user's biggest cluster(s) are flagged in the "largest_cluster" column.
+cluster_results = summarize_clusters(unique_points["userid"].values, unique_points["cluster"].values,
+                                     unique_points["lat"].values, unique_points["lon"].values,
+                                     weights=unique_points["weight"].values)
 
 # Check how many users have more than one biggest cluster )
-cluster_results.groupby("userid").largest_cluster.count().value_counts()
+cluster_results.groupby("userid").largest_cluster.sum().value_counts()
 
 # -------------------------------
 # Join region info to clusters
 # ------------------------------
 print("Joining region info to cluster centers..")
 
-# Both layer geometries are in WGS 84, but the crs definitions don't yet match
-cluster_results.crs = some.crs
-
-# update cluster results index for the join..
-cluster_results.index = cluster_results.apply(lambda x: x["userid"] + "_" + str(x["cluster_code"]), axis=1)
-
-# Join country info for each post (points are liked with the nearest polygon on land).
-clusters = gpd.sjoin(cluster_results, some[["FIPS", "geometry"]], how="left", op="intersects")
+# Join region info from the posts at the cluster centers (points are liked with the nearest polygon on land).
+# The point closest to cluster centroid is one of the posts, so this equals a spatial join (intersects) of the
+# center points with the post locations.
+clusters = join_cluster_regions(cluster_results, clustered, ["FIPS"])
 
 # ---------------------------------------------------------------------------------
 # Determine origin country for users based on location of (1-x) biggest cluster(s)
 # ---------------------------------------------------------------------------------
 print("Determining origin country..")
 
-user_list = pd.DataFrame(index=some.userid.unique())
+user_list = pd.DataFrame(index=some.user.unique())
 
-# Group clusters per user (all clusters are still included at this step)
-grouped = clusters.groupby("userid")
+# Origin country of each user, based on the biggest cluster(s). If there are equally big clusters in several
+# countries, the number of clusters and the number of posts in clusters in those countries are considered.
+origins, tied_users = get_user_origins(clusters, reg_col="FIPS", return_ties=True)
+user_list[method_name] = origins
 
-# For each user, check the location of biggest cluster(s) and decide origin country
-for key, group in grouped:
+print("Users with several equally good origin candidates (first one selected):", tied_users.sum())
 
-    # Continue with only the biggest cluster(s) (can be one or many)
-    largest_clusters = group[group["largest_cluster"] == True]
-
-    # Get origin country (can also be a list of countries if unambiguous
-    origin_country = get_origin_country(largest_clusters, reg_col="FIPS")
-
-    # If there is a list of potential origin countries, apply additional rules:
-    if type(origin_country) == list:
-        clusters_in_candidate_countries = group[group["FIPS"].isin(origin_country)]
-
-        # if the previous step returned more than one options, consider also other clusters in these countries
-        origin_country = get_origin_country(clusters_in_candidate_countries, reg_col="FIPS")
-        
-        # If there still are more than one candidates, then determine based on post count in clusters
-        if type(origin_country) == list:
-            cluster_point_counts_per_country = clusters_in_candidate_countries.groupby("FIPS").cluster_size.sum()
-
-            if len(cluster_point_counts_per_country):
-                origin_country = cluster_point_counts_per_country.idxmax()
-
-            else:
-                origin_country = list(cluster_point_counts_per_country.index)
-            
-    user_list.at[key, method_name] = origin_country
+# Users with all posts in one region
+user_list.loc[trivial_users.index, method_name] = trivial_users.values
 
 # ------------------------------
 # Write result to file by user
@@ -322,6 +239,10 @@ print("Writing results with min_distance %s.." % min_distance)
 # Drop users with no result
 user_list = user_list.dropna()
 
+# Decode user ids and region codes for output
+user_list.index = decode(codebooks, "userid", user_list.index)
+user_list[method_name] = decode(codebooks, "FIPS", user_list[method_name].astype(int))
+
 folder = r"./demo_results"
 fp_by_users = os.path.join(folder, "%s_%susers.csv" % (method_name, str(len(user_list))))
 
@@ -334,6 +255,9 @@ fp_by_region = os.path.join(folder, "%s_%susers_by_country.csv" % (method_name,
 
 user_list[method_name].value_counts().to_csv(fp_by_region, sep=";", index_label="FIPS", header=[method_name])
 
+# Save the result into the result store
+store_result(user_list[[method_name]], "basic_dbscan", params, data_hash)
+
 """
 #----------------------------
 # Test clustering for one user
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+SOMEORIGINS - DBSCAN sensitivity analysis (epsilon and min_points)
+
+https://scikit-learn.org/stable/modules/generated/sklearn.cluster.OPTICS.html
+
+Script for identifying the origin country of each user with the basic DBSCAN approach (see clusters_basic.py) for
+a full grid of epsilon (min_distance) and min_points values, without a separate DBSCAN run for each combination:
+    - min_points = 1: the single-linkage forest of all users is built once, and cut at each epsilon
+    - min_points > 1: the OPTICS reachability ordering of each user is computed once for each min_points value, and
+      the DBSCAN labels for each epsilon are extracted from the ordering (see cluster_utils.optics_sweep_labels).
+      The users can be processed in parallel.
+
+1. Read input demo_data
+    - All posts from all users who visited Kruger in 2014
+        --> Exclude posts within target area (Kruger) from further analysis
+2. Get clusters for each user for all epsilon and min_points values
+    --> Users with all posts in one country get it as origin directly, and are not clustered
+    --> Posts at identical locations are collapsed into unique points, weighted by the number of posts
+3. For each epsilon and min_points value, determine origin country based on the location of biggest cluster(s)
+   (as in clusters_basic.py)
+4. Print origin countries of all combinations to file by user and by country
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+
+usage:
+    python clusters_sensitivity.py n_workers
+
+    n_workers is the number of worker processes for the OPTICS orderings. If not defined, it defaults to 1 (no
+    parallel processing).
+"""
+import os
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from cluster_utils import build_single_linkage_forest, cut_single_linkage_forest, deduplicate_points, \
+    get_user_origins, join_cluster_regions, optics_sweep_labels, summarize_clusters
+from post_table import decode, read_post_table, split_trivial_users
+from target_areas import exclude_target_area
+
+
+#-----------------------
+# Settings
+#-----------------------
+
+# number of worker processes
+try:
+    n_workers = int(sys.argv[1])
+
+except:
+    n_workers = 1
+
+# minimum distances in kilometers (DBSCAN epsilon), same as in clusters_repeat.py
+eps_values = [1, 10, 25, 60, 120, 210, 340, 500, 725, 1000]
+
+# minimum number of posts per cluster (DBSCAN min_samples)
+min_points_values = [1, 2, 3, 5, 10]
+
+# Exclude also the posts within +-trip_days days of the visit to the target area (None: only the target area posts)
+trip_days = None
+
+# Suffix of the result names if the posts within the trip window are also excluded
+trip_suffix = "" if trip_days is None else "_trip_%sd" % trip_days
+
+# Social media mobility history for Kruger national park visitors, with regioninfo
+fp = r"./demo_data/fake_input_data.shp"
+
+# Output folder
+folder = r"./demo_results/clusters_temp"
+
+
+#-------------------------
+# Functions
+#-------------------------
+def sweep_user(task):
+    """DBSCAN labels of one user's unique points for all epsilon values and min_points values > 1
+
+    :param task: tuple of latitudes, longitudes and weights of the user's unique points, epsilon values and
+                 min_points values
+    :return: dictionary of label arrays (one row for each epsilon) by min_points
+    """
+    lat, lon, weight, eps_list, min_points_list = task
+
+    return {min_points: optics_sweep_labels(lat, lon, eps_list, min_points, sample_weight=weight)
+            for min_points in min_points_list if min_points > 1}
+
+
+def column_name(min_distance, min_points):
+    """Column name of the result for one combination of epsilon and min_points"""
+    return "basic_dbscan_%s_km_%s_points" % (min_distance, min_points)
+
+
+if __name__ == "__main__":
+
+    # --------------------------
+    # Read in demo_data
+    # --------------------------
+    print("Reading demo_data..")
+
+    some, codebooks = read_post_table(fp)
+
+    print("Number of posts:", len(some))
+    print("Number of users:", some.user.nunique())
+
+    # EXCLUDE POSTS WITHIN KRUGER NATIONAL PARK
+    some = exclude_target_area(some, some["FromKruger"].values == 1, trip_days)
+
+    print("\nAfter excluding posts from Kruger:")
+    print("Number of posts:", len(some))
+    print("Number of users:", some.user.nunique(), "\n")
+
+    # Every combination gives these users their only country, so they are not clustered
+    trivial_users, clustered = split_trivial_users(some, "FIPS")
+
+    # Collapse posts at identical locations of the same user into unique points.
+    # The number of posts at each location is used as a weight.
+    unique_points, point_index = deduplicate_points(clustered["user"].values, clustered["lat"].values,
+                                                    clustered["lon"].values)
+
+    print("Number of unique user locations:", len(unique_points))
+
+    # -----------------------------------
+    # Get clusters for all combinations
+    # -----------------------------------
+    print("Getting clusters for %s epsilon and %s min_points values.." % (len(eps_values), len(min_points_values)))
+
+    # Labels of the unique points by (epsilon, min_points)
+    labels = {}
+
+    if 1 in min_points_values:
+        # With min_points=1, DBSCAN clusters are single-linkage clusters cut at epsilon
+        forest = build_single_linkage_forest(unique_points["lat"].values, unique_points["lon"].values,
+                                             unique_points["userid"].values)
+
+        for min_distance in eps_values:
+            labels[(min_distance, 1)] = cut_single_linkage_forest(forest, min_distance)
+
+    if any(min_points > 1 for min_points in min_points_values):
+        groups = list(unique_points.groupby("userid").indices.values())
+        tasks = [(unique_points["lat"].values[rows], unique_points["lon"].values[rows],
+                  unique_points["weight"].values[rows], eps_values, min_points_values) for rows in groups]
+
+        print("Computing OPTICS orderings of %s users with %s worker processes.." % (len(tasks), n_workers))
+
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                user_labels = list(executor.map(sweep_user, tasks, chunksize=16))
+
+        else:
+            user_labels = [sweep_user(task) for task in tasks]
+
+        for min_points in min_points_values:
+            if min_points == 1:
+                continue
+
+            combined = np.full((len(eps_values), len(unique_points)), -1, dtype=np.int64)
+
+            for rows, result in zip(groups, user_labels):
+                combined[:, rows] = result[min_points]
+
+            for i, min_distance in enumerate(eps_values):
+                labels[(min_distance, min_points)] = combined[i]
+
+    # ---------------------------------------------------------------------------------
+    # Determine origin country for users based on location of (1-x) biggest cluster(s)
+    # ---------------------------------------------------------------------------------
+    print("Determining origin countries..")
+
+    user_list = pd.DataFrame(index=some.user.unique())
+
+    for min_points in min_points_values:
+        for min_distance in eps_values:
+            method_name = column_name(min_distance, min_points)
+
+            # Cluster sizes and centroids are weighted with the number of posts at each location
+            cluster_results = summarize_clusters(unique_points["userid"].values, labels[(min_distance, min_points)],
+                                                 unique_points["lat"].values, unique_points["lon"].values,
+                                                 weights=unique_points["weight"].values)
+
+            clusters = join_cluster_regions(cluster_results, clustered, ["FIPS"])
+
+            user_list[method_name] = get_user_origins(clusters, reg_col="FIPS")
+
+            # Users with all posts in one country
+            user_list.loc[trivial_users.index, method_name] = trivial_users.values
+
+    # ------------------------------
+    # Write result to file by user
+    # ------------------------------
+    print("Writing results..")
+
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    # Decode user ids and region codes for output (users without a result are left empty)
+    user_list.index = pd.Index(decode(codebooks, "userid", user_list.index), name="userid")
+
+    for method_name in user_list.columns:
+        user_list[method_name] = decode(codebooks, "FIPS", user_list[method_name].fillna(-1).astype(int),
+                                        missing=np.nan)
+
+    fp_by_users = os.path.join(folder, "basic_dbscan_sensitivity%s_%susers.csv" % (trip_suffix, len(user_list)))
+    user_list.to_csv(fp_by_users, sep=";")
+
+    # -------------------------------
+    # Write result to file by country
+    fp_by_region = os.path.join(folder, "basic_dbscan_sensitivity%s_%susers_by_country.csv"
+                                % (trip_suffix, len(user_list)))
+
+    by_country = pd.concat([user_list[method_name].value_counts() for method_name in user_list.columns], axis=1)
+    by_country.columns = user_list.columns
+    by_country.fillna(0).astype(int).to_csv(fp_by_region, sep=";", index_label="FIPS")
+
+    print("DONE! Results in folder:", folder)
@@ -12,6 +12,10 @@ import os
 import glob
 import pandas as pd
 import geopandas as gpd
+from cluster_utils import build_single_linkage_forest, save_single_linkage_forest, load_single_linkage_forest, \
+    cut_single_linkage_forest, summarize_clusters, join_cluster_regions, get_user_origins
+from evaluation import bootstrap_scores
+from result_store import find_result_file, find_results, input_hash, load_result, result_key
 
 #------------------------------
 # Read in cluster results
@@ -19,6 +23,25 @@ import geopandas as gpd
 method = "hierarchical" #'basic'
 region_column = 'FIPS'  #'SubReg_2'# "RegCode"#
 
+# Upper level region and threshold for the hierarchical approach (see clusters_hierarchical.py)
+upper_region_column = 'SubReg_2'
+upper_threshold = "210"
+
+# Parameters of the compared clustering results (see clusters_basic.py and clusters_hierarchical.py)
+min_points = 1
+post_weighting = None
+trip_days = None
+
+# Single-linkage mode: with min_points=1, every DBSCAN result is a cut of each user's minimum spanning tree.
+# Build the trees once and cut them at each epsilon, instead of reading in separate clustering runs (clusters_repeat.py)
+use_single_linkage = False
+
+# Epsilon values (km) evaluated in the single-linkage mode
+eps_values = list(range(10, 1010, 10))
+
+# Number of bootstrap samples for the confidence intervals of the match percentages (0: no confidence intervals)
+n_bootstrap = 1000
+
 # Results by user
 output_folder = r"./demo_results/cluster_options"
 
@@ -33,12 +56,119 @@ refdata = pd.read_csv(os.path.join(r"./demo_results/basic_maxposts_35users.csv")
 # Create dataframe for results with userids as index
 results = pd.DataFrame(index=refdata["userid"])
 
-for csv in files:
-    data = pd.read_csv(csv, sep=";")
-    data.index = data[data.columns[-2]]
+# Input data of the clustering results
+input_fp = r"./demo_data/fake_input_data.shp"
+data_hash = input_hash(input_fp)
+
+# Upper level result of the hierarchical approach: latest result in the result store with the same input data and
+# parameters, or the result file (None if there is neither)
+upper_key = ""
+regions = None
+
+if method == "hierarchical" and region_column != "RegCode":
+    upper_method_name = "hierarchical_dbscan_%skm_%s" % (upper_threshold, upper_region_column)
+
+    upper_results = find_results("hierarchical_dbscan", data_hash=data_hash, eps=int(upper_threshold),
+                                 min_points=min_points, region_level=upper_region_column, weights=post_weighting,
+                                 trip_days=trip_days)
+    upper_fp = find_result_file(r"./demo_results/clusters_temp", upper_method_name)
+
+    if len(upper_results):
+        upper_key = upper_results.index[-1]
+        regions = load_result(upper_key).reset_index()
+
+    elif upper_fp is not None:
+        upper_key = input_hash(upper_fp)
+        regions = pd.read_csv(upper_fp, sep=";")
+
+    else:
+        upper_key = None
+
+# Clustering results with different epsilon values in the result store, with the same input data, parameters and
+# upper level result. Each key is one epsilon value (no hierarchical results, if the upper level result is missing).
+result_params = {"min_points": min_points, "region_level": region_column, "weights": post_weighting,
+                 "trip_days": trip_days}
+
+if method == "hierarchical":
+    result_params["upper_result"] = upper_key
+
+stored = find_results("%s_dbscan" % method, data_hash=data_hash, **result_params)
+
+if use_single_linkage:
+    # Posts outside the target area
+    some = gpd.read_file(input_fp)
+    some = some[some["FromKruger"] == 0]
+
+    # Parameters of the forest (the forest is valid only for the same input data and upper level result)
+    forest_params = {"method": method, "region_level": region_column}
+
+    # HIERARCHICAL APPROACH: SUBSET EACH USER FOR IDENTIFIED REGION
+    if method == "hierarchical" and region_column != "RegCode":
+        if regions is None:
+            raise FileNotFoundError("Upper level result %s was not found in the result store or in the result files."
+                                    % upper_method_name)
+
+        forest_params.update({"upper_threshold": upper_threshold, "upper_region_level": upper_region_column,
+                              "upper_result": upper_key})
+
+        regions["userid"] = regions["userid"].astype(str)
+        regions[upper_method_name] = regions[upper_method_name].astype(int)
 
-    print("adding result from ", data.columns[-2])
-    results = results.join(data[data.columns[-1]])
+        # Join the demo_data. drops out un-matching rows!
+        some = some.merge(regions, left_on=["userid", upper_region_column], right_on=["userid", upper_method_name])
+
+    lat, lon = some.geometry.y.values, some.geometry.x.values
+    posts = pd.DataFrame({"lat": lat, "lon": lon, region_column: some[region_column].values})
+
+    # Build the minimum spanning trees once (or use the stored ones). The file name contains a key of the input data
+    # and the forest parameters, as in the result store.
+    forest_key = result_key("single_linkage_forest", forest_params, data_hash)
+    forest_fp = os.path.join(cluster_folder, "single_linkage_forest_%s_%s_%s.npz" % (method, region_column, forest_key))
+
+    forest = load_single_linkage_forest(forest_fp) if os.path.isfile(forest_fp) else None
+
+    # Rebuild the forest if it does not match the current posts
+    if forest is not None and len(forest["order"]) != len(lat):
+        print("existing single-linkage forest has %s points instead of %s, rebuilding"
+              % (len(forest["order"]), len(lat)))
+        forest = None
+
+    if forest is not None:
+        print("using existing single-linkage forest")
+    else:
+        print("building single-linkage forest..")
+        forest = build_single_linkage_forest(lat, lon, some["userid"].values)
+        save_single_linkage_forest(forest, forest_fp)
+
+    for distance in eps_values:
+        if method == "basic":
+            method_name = "basic_dbscan_%s_km" % distance
+        else:
+            method_name = "hierarchical_dbscan_%skm_%s" % (distance, region_column)
+
+        print("adding result from ", method_name)
+
+        # Cut the trees at epsilon, and determine origins based on the biggest cluster(s)
+        labels = cut_single_linkage_forest(forest, distance)
+        clusters = summarize_clusters(some["userid"].values, labels, lat, lon)
+        clusters = join_cluster_regions(clusters, posts, [region_column])
+
+        results[method_name] = get_user_origins(clusters, reg_col=region_column).reindex(results.index.astype(str)).values
+
+elif len(stored):
+    for key in stored.index:
+        data = load_result(key)
+
+        print("adding result from ", data.columns[-1])
+        results[data.columns[-1]] = data[data.columns[-1]].reindex(results.index.astype(str)).values
+
+else:
+    for csv in files:
+        data = pd.read_csv(csv, sep=";")
+        data.index = data[data.columns[-2]]
+
+        print("adding result from ", data.columns[-2])
+        results = results.join(data[data.columns[-1]])
 
 # How many times the result was different among methods
 print(results.nunique(axis=1).value_counts())
@@ -108,4 +238,19 @@ perc.set_index("km", drop=True, inplace=True)
 perc.drop(columns=["method"], inplace=True)
 
 perc.to_csv(os.path.join(output_folder, "matches_%s_%s.csv" % (method, region_column)),
-                                        index_label="km", header="perc")
\ No newline at end of file
+                                        index_label="km", header="perc")
+
+#-------------------------------------------------------
+# Confidence intervals for the match percentages
+#-------------------------------------------------------
+if n_bootstrap:
+    print("bootstrapping confidence intervals..")
+
+    # Resample users with replacement, 95% percentile intervals of the match percentage (and macro F1-score)
+    ci = bootstrap_scores(joined[["expert_1"] + list(joined.columns[3:])], true_column="expert_1",
+                          n_draws=n_bootstrap, seed=0)
+
+    ci["km"] = [x.split("_")[2] for x in ci.index]
+    ci.set_index("km", drop=True, inplace=True)
+
+    ci.to_csv(os.path.join(output_folder, "matches_ci_%s_%s.csv" % (method, region_column)), index_label="km")
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+Sets of active days (days with posts) stored as bitmaps of uint64 words.
+
+Each set (e.g. the posts of a user in a region) is a bitmap over the observed date range of the user: bit i is set
+if the user has posts on day start + i. All bitmaps of the same user have the same start day and length, so:
+    - the number of distinct days is the popcount of the bitmap
+    - distinct weeks (Monday-Sunday, as pandas Period "W") and months are found by folding the active days
+    - the union of sets (e.g. rolling regions up the hierarchy, or adding new posts) is a bitwise OR
+The memory of a bitmap is bounded by the length of the user's posting history (one bit per day).
+
+The bitmaps are stored as a dictionary of numpy arrays:
+    - start: first day of each bitmap (days since 1970-01-01, always a Monday)
+    - offsets: position of the first word of each bitmap in words (length: number of bitmaps + 1)
+    - words: uint64 words of all bitmaps
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+"""
+import numpy as np
+from time_keys import FIRST_MONDAY, month_numbers, week_numbers
+
+WORD_BITS = 64
+
+# Number of set bits of each byte value
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(words):
+    """Number of set bits in each uint64 word"""
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).astype(np.int64)
+
+    return _BYTE_POPCOUNT[words.view(np.uint8)].reshape(-1, 8).sum(axis=1).astype(np.int64)
+
+
+def build_bitmaps(groups, days, group_users):
+    """Bitmaps of the active days of groups (e.g. cells of users and regions)
+
+    :param groups: numpy array of the group of each post (0 ... n_groups - 1)
+    :param days: numpy array of the day number of each post (see time_keys.day_numbers)
+    :param group_users: numpy array of the user of each group. The bitmaps of the same user cover the same days.
+    :return: bitmaps (dictionary of numpy arrays start, offsets, words)
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    group_users = np.asarray(group_users, dtype=np.int64)
+
+    # Observed date range of each user (first day aligned to Monday, so that the weeks are whole in the bitmaps)
+    users, user_index = np.unique(group_users, return_inverse=True)
+    post_users = user_index[groups]
+
+    first_day = np.full(len(users), np.iinfo(np.int64).max, dtype=np.int64)
+    last_day = np.full(len(users), np.iinfo(np.int64).min, dtype=np.int64)
+    np.minimum.at(first_day, post_users, days)
+    np.maximum.at(last_day, post_users, days)
+
+    user_start = first_day - np.mod(first_day - FIRST_MONDAY, 7)
+    user_words = (last_day - user_start) // WORD_BITS + 1
+
+    start = user_start[user_index]
+    offsets = np.r_[0, np.cumsum(user_words[user_index])].astype(np.int64)
+
+    words = np.zeros(offsets[-1], dtype=np.uint64)
+
+    position = days - start[groups]
+    bits = np.left_shift(np.uint64(1), (position % WORD_BITS).astype(np.uint64))
+    np.bitwise_or.at(words, offsets[groups] + position // WORD_BITS, bits)
+
+    return {"start": start, "offsets": offsets, "words": words}
+
+
+def union_bitmaps(bitmaps, rows, n_rows):
+    """Union of bitmaps: bitmaps with the same row are combined with bitwise OR.
+
+    NOTE! All bitmaps of a row must belong to the same user (same start day and length).
+
+    :param bitmaps: bitmaps (see build_bitmaps)
+    :param rows: numpy array of the row of each bitmap (-1: bitmap not included)
+    :param n_rows: number of rows
+    :return: bitmaps of the rows
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    offsets = bitmaps["offsets"]
+    lengths = np.diff(offsets)
+
+    included = np.flatnonzero(rows >= 0)
+
+    # Start day and length of each row from (any) one of its bitmaps
+    row_start = np.zeros(n_rows, dtype=np.int64)
+    row_lengths = np.zeros(n_rows, dtype=np.int64)
+    row_start[rows[included]] = bitmaps["start"][included]
+    row_lengths[rows[included]] = lengths[included]
+
+    row_offsets = np.r_[0, np.cumsum(row_lengths)].astype(np.int64)
+    words = np.zeros(row_offsets[-1], dtype=np.uint64)
+
+    # Word positions of the included bitmaps, and their target positions in the rows
+    word_counts = lengths[included]
+    source = np.repeat(offsets[:-1][included], word_counts) + _ranges(word_counts)
+    target = np.repeat(row_offsets[:-1][rows[included]], word_counts) + _ranges(word_counts)
+
+    np.bitwise_or.at(words, target, bitmaps["words"][source])
+
+    return {"start": row_start, "offsets": row_offsets, "words": words}
+
+
+def count_days(bitmaps):
+    """Number of distinct days in each bitmap (popcount)"""
+    counts = popcount(bitmaps["words"])
+    totals = np.r_[0, np.cumsum(counts)]
+
+    return totals[bitmaps["offsets"][1:]] - totals[bitmaps["offsets"][:-1]]
+
+
+def active_days(bitmaps):
+    """Active days of all bitmaps
+
+    :return: numpy arrays of the bitmap and the day number of each set bit
+    """
+    bits = np.unpackbits(bitmaps["words"].view(np.uint8), bitorder="little")
+
+    # NOTE! the words are little-endian on all supported platforms, so bit i of word w is bit 64 * w + i
+    positions = np.flatnonzero(bits)
+    bitmap = np.searchsorted(bitmaps["offsets"], positions // WORD_BITS, side="right") - 1
+
+    return bitmap, bitmaps["start"][bitmap] + positions - bitmaps["offsets"][bitmap] * WORD_BITS
+
+
+def count_periods(bitmaps, period):
+    """Number of distinct periods (days, weeks or months) in each bitmap. Weeks and months are folded from the
+    active days.
+
+    :param bitmaps: bitmaps (see build_bitmaps)
+    :param period: "day", "week" or "month"
+    :return: numpy array of the number of periods of each bitmap
+    """
+    if period == "day":
+        return count_days(bitmaps)
+
+    bitmap, days = active_days(bitmaps)
+
+    if period == "week":
+        periods = week_numbers(days)
+
+    elif period == "month":
+        periods = month_numbers(days)
+
+    else:
+        raise ValueError("unknown period %s (use day, week or month)" % period)
+
+    n_bitmaps = len(bitmaps["offsets"]) - 1
+
+    if len(days) == 0:
+        return np.zeros(n_bitmaps, dtype=np.int64)
+
+    # Distinct (bitmap, period) pairs (the active days are sorted by bitmap and day)
+    new_period = np.r_[True, (bitmap[1:] != bitmap[:-1]) | (periods[1:] != periods[:-1])]
+
+    return np.bincount(bitmap[new_period], minlength=n_bitmaps)
+
+
+def _ranges(counts):
+    """Concatenated ranges 0 ... count - 1 for each count"""
+    ends = np.cumsum(counts)
+
+    return np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts, counts)
@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+Evaluation of the origin detection methods against the expert assessment.
+
+Country codes are factorized once, and the confusion matrices of all methods are counted in one bincount over
+the (method, true, predicted) triplets. Precision, recall and F1-score (micro, macro and weighted averages) are
+derived from the confusion matrices, with the same definitions as in scikit-learn
+(precision_recall_fscore_support with zero_division=0):
+    - Metrics are computed for the labels present in the true or predicted values of the evaluated users.
+    - micro: metrics computed globally from the total true positives, false positives and false negatives.
+    - macro: unweighted mean of the metrics of each label.
+    - weighted: mean of the metrics of each label, weighted by support (number of true instances of the label).
+
+https://scikit-learn.org/stable/modules/generated/sklearn.metrics.precision_recall_fscore_support.html
+
+Subsets of users based on the true label (e.g. excluding users from South Africa) are taken directly from the
+confusion matrices (see subset_true_labels). Other user subsets are counted again using a row mask.
+
+The number of users per country of each method is compared to official visitor statistics with Spearman's
+rank-order correlation. All methods and subsets of countries are ranked at once (see spearman_table).
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+"""
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse import csr_matrix
+from scipy.stats import t as t_distribution
+
+
+def confusion_matrices(dataframe, true_column="expert_1", method_columns=None, mask=None):
+    """Confusion matrices of all methods.
+
+    Missing predictions (no result for the user) are counted as a separate label "N/A".
+
+    :param dataframe: Pandas DataFrame with the true values and a column of predicted values for each method
+    :param true_column: column with the true values (default: "expert_1")
+    :param method_columns: method columns (default: all other columns than the true column)
+    :param mask: optional boolean array for selecting the evaluated users (rows)
+    :return: confusion matrices (numpy array of shape (n_methods, n_labels, n_labels) with true values on rows,
+             and predicted values on columns), labels (numpy array) and method names (list)
+    """
+    if method_columns is None:
+        method_columns = [column for column in dataframe.columns if column != true_column]
+
+    if mask is not None:
+        dataframe = dataframe[np.asarray(mask, dtype=bool)]
+
+    # Factorize true and predicted values of all methods at once
+    values = dataframe[[true_column] + list(method_columns)].astype(object).fillna("N/A")
+    codes, labels = pd.factorize(values.values.ravel(), sort=True)
+    codes = codes.reshape(values.shape)
+
+    n_methods = len(method_columns)
+    n_labels = len(labels)
+
+    true_codes = np.broadcast_to(codes[:, :1], (len(codes), n_methods))
+    method_index = np.broadcast_to(np.arange(n_methods), (len(codes), n_methods))
+
+    pairs = (method_index * n_labels + true_codes) * n_labels + codes[:, 1:]
+    counts = np.bincount(pairs.ravel(), minlength=n_methods * n_labels * n_labels)
+
+    return counts.reshape(n_methods, n_labels, n_labels), np.asarray(labels), list(method_columns)
+
+
+def subset_true_labels(confusion, labels, include=None, exclude=None):
+    """Confusion matrices for the subset of users whose true value is (not) one of the given labels.
+
+    :param confusion: confusion matrices from confusion_matrices
+    :param labels: labels of the confusion matrices
+    :param include: list of true values to keep (e.g. ["SF"] for users from South Africa only)
+    :param exclude: list of true values to drop (e.g. ["SF"] for users outside South Africa)
+    :return: confusion matrices of the subset (same shape and labels)
+    """
+    keep = np.ones(len(labels), dtype=bool)
+
+    if include is not None:
+        keep &= np.isin(labels, include)
+
+    if exclude is not None:
+        keep &= ~np.isin(labels, exclude)
+
+    return confusion * keep[None, :, None]
+
+
+def _divide(numerator, denominator):
+    """Element-wise division, 0 where the denominator is 0 (zero_division=0)"""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+
+    result = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+
+    return result
+
+
+def precision_recall_f1(confusion, average="macro"):
+    """Precision, recall and F1-score of each method.
+
+    :param confusion: confusion matrices from confusion_matrices (or subset_true_labels)
+    :param average: type of averaging ("micro", "macro" or "weighted")
+    :return: precision, recall and F1-score (numpy arrays with one value per method)
+    """
+    true_positives = np.diagonal(confusion, axis1=1, axis2=2)
+
+    return _scores_from_sums(true_positives, confusion.sum(axis=2), confusion.sum(axis=1), average=average)
+
+
+def _scores_from_sums(true_positives, true_sum, predicted_sum, average="macro"):
+    """Averaged precision, recall and F1-score from the per label sums (labels on the last axis)"""
+    true_positives = np.asarray(true_positives, dtype=float)
+
+    if average == "micro":
+        tp = true_positives.sum(axis=-1)
+        precision = _divide(tp, predicted_sum.sum(axis=-1))
+        recall = _divide(tp, true_sum.sum(axis=-1))
+        f1 = _divide(2 * tp, predicted_sum.sum(axis=-1) + true_sum.sum(axis=-1))
+
+        return precision, recall, f1
+
+    precision = _divide(true_positives, predicted_sum)
+    recall = _divide(true_positives, true_sum)
+    f1 = _divide(2 * true_positives, predicted_sum + true_sum)
+
+    if average == "macro":
+        # Labels present in the true or predicted values of the evaluated users
+        weights = ((true_sum > 0) | (predicted_sum > 0)).astype(float)
+
+    elif average == "weighted":
+        weights = np.broadcast_to(true_sum, f1.shape).astype(float)
+
+    else:
+        raise ValueError("average should be 'micro', 'macro' or 'weighted', got %r" % average)
+
+    total = weights.sum(axis=-1)
+
+    return (_divide((precision * weights).sum(axis=-1), total),
+            _divide((recall * weights).sum(axis=-1), total),
+            _divide((f1 * weights).sum(axis=-1), total))
+
+
+def get_f1(confusion, methods, average_type="macro"):
+    """Get f1 scores average of a spesific type, and related precision and recall for all methods
+
+    :param confusion: confusion matrices from confusion_matrices (or subset_true_labels)
+    :param methods: method names of the confusion matrices
+    :param average_type: type of averaging ("micro", "macro" or "weighted")
+    :return: Pandas DataFrame with F1-score, precision and recall of each method, sorted by F1-score
+    """
+    precision, recall, f1 = precision_recall_f1(confusion, average=average_type)
+
+    # Number of evaluated users
+    n = int(confusion[0].sum()) if len(confusion) else 0
+
+    # Type will be replaced in a later step with basic/hierarchical for alphabetical sorting purposes
+    scores = pd.DataFrame({'n{}_TYPE_F1_'.format(n): f1,
+                           'n{}_TYPE_Pr_'.format(n): precision,
+                           'n{}_TYPE_Re_'.format(n): recall}, index=methods)
+
+    scores.sort_values(by=scores.columns[0], ascending=False, inplace=True)
+
+    return scores
+
+
+#---------------------------------------------
+# Bootstrap confidence intervals
+#---------------------------------------------
+
+def bootstrap_scores(dataframe, true_column="expert_1", method_columns=None, reference=None, average="macro",
+                     n_draws=1000, confidence=0.95, seed=None, batch_size=500, n_jobs=1):
+    """Bootstrap confidence intervals for the match percentage, F1-score and Spearman rho of all methods.
+
+    Users are resampled with replacement n_draws times. Each bootstrap sample is a row of multinomial weights
+    (how many times each user was drawn), and the scores of all methods are computed from the weighted sums of
+    the per user indicator matrices (correct predictions, true and predicted labels), in batches of draws.
+
+    :param dataframe: Pandas DataFrame with the true values and a column of predicted values for each method
+    :param true_column: column with the true values (default: "expert_1")
+    :param method_columns: method columns (default: all other columns than the true column)
+    :param reference: optional Pandas Series of official visitor numbers with country codes as index. If given,
+                      the Spearman rho between the number of users per country and the reference is computed
+                      (countries with no users are left out, as in the spearman notebook)
+    :param average: type of averaging for the F1-score ("micro", "macro" or "weighted")
+    :param n_draws: number of bootstrap samples
+    :param confidence: confidence level of the percentile intervals (default: 0.95)
+    :param seed: seed for the random number generator
+    :param batch_size: number of bootstrap samples computed at once
+    :param n_jobs: number of worker processes (1: no process pool)
+    :return: Pandas DataFrame with point estimates and confidence intervals (match, match_low, match_high, F1, ...)
+             for each method
+    """
+    if method_columns is None:
+        method_columns = [column for column in dataframe.columns if column != true_column]
+
+    indicators = _bootstrap_indicators(dataframe, true_column, method_columns, reference)
+    n_users = indicators["n_users"]
+
+    # Independent random streams for the batches (results do not depend on the number of worker processes)
+    batch_sizes = [min(batch_size, n_draws - start) for start in range(0, n_draws, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+    tasks = [(indicators, size, batch_seed, average) for size, batch_seed in zip(batch_sizes, seeds)]
+
+    if n_jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            batches = list(executor.map(_bootstrap_batch, tasks))
+
+    else:
+        batches = [_bootstrap_batch(task) for task in tasks]
+
+    # Point estimates from the original sample (each user drawn once)
+    point = _weighted_scores(indicators, np.ones((1, n_users)), average)
+
+    alpha = (1 - confidence) / 2
+    results = pd.DataFrame(index=list(method_columns))
+
+    for score in point:
+        draws = np.concatenate([batch[score] for batch in batches])
+        results[score] = point[score][0]
+        results[score + "_low"] = np.nanquantile(draws, alpha, axis=0)
+        results[score + "_high"] = np.nanquantile(draws, 1 - alpha, axis=0)
+
+    return results
+
+
+def _bootstrap_indicators(dataframe, true_column, method_columns, reference=None):
+    """Sparse per user indicator matrices of correct predictions, true labels and predicted labels"""
+    values = dataframe[[true_column] + list(method_columns)].astype(object).fillna("N/A")
+    codes, labels = pd.factorize(values.values.ravel(), sort=True)
+    codes = codes.reshape(values.shape)
+
+    n_users, n_methods, n_labels = len(codes), len(method_columns), len(labels)
+    true_codes = codes[:, 0]
+    predicted_codes = codes[:, 1:]
+
+    users = np.repeat(np.arange(n_users), n_methods)
+    columns = (np.arange(n_methods)[None, :] * n_labels + predicted_codes).ravel()
+    correct = (predicted_codes == true_codes[:, None])
+
+    indicators = {
+        "n_users": n_users,
+        "n_methods": n_methods,
+        "n_labels": n_labels,
+        "correct": correct.astype(float),
+        "true": csr_matrix((np.ones(n_users), (np.arange(n_users), true_codes)), shape=(n_users, n_labels)),
+        "predicted": csr_matrix((np.ones(len(users)), (users, columns)), shape=(n_users, n_methods * n_labels)),
+        "true_positives": csr_matrix((correct.ravel().astype(float), (users, columns)),
+                                     shape=(n_users, n_methods * n_labels)),
+        "reference": None
+    }
+
+    if reference is not None:
+        # Reference values in the order of the labels (NaN for labels without reference values)
+        indicators["reference"] = pd.Series(reference).reindex(labels).values.astype(float)
+
+    return indicators
+
+
+def _bootstrap_batch(task):
+    """Scores of one batch of bootstrap samples (run in a worker process if n_jobs > 1)"""
+    indicators, n_draws, seed, average = task
+
+    rng = np.random.default_rng(seed)
+    n_users = indicators["n_users"]
+    weights = rng.multinomial(n_users, np.full(n_users, 1.0 / n_users), size=n_draws).astype(float)
+
+    return _weighted_scores(indicators, weights, average)
+
+
+def _weighted_scores(indicators, weights, average):
+    """Scores of all methods for each row of user weights (bootstrap sample)"""
+    n_draws = len(weights)
+    shape = (n_draws, indicators["n_methods"], indicators["n_labels"])
+
+    # sparse.T @ dense.T is the weighted sum over users for each draw
+    true_sum = np.asarray((indicators["true"].T @ weights.T).T)
+    predicted_sum = np.asarray((indicators["predicted"].T @ weights.T).T).reshape(shape)
+    true_positives = np.asarray((indicators["true_positives"].T @ weights.T).T).reshape(shape)
+
+    scores = {"match": weights @ indicators["correct"] / weights.sum(axis=1, keepdims=True)}
+
+    scores["F1"] = _f1_from_sums(true_positives, true_sum[:, None, :], predicted_sum, average=average)
+
+    if indicators["reference"] is not None:
+        # Number of users per country, countries with no users are left out
+        counts = np.where(predicted_sum > 0, predicted_sum, np.nan)
+        scores["rho"] = spearman_rho(counts, np.broadcast_to(indicators["reference"], shape))
+
+    return scores
+
+
+def _f1_from_sums(true_positives, true_sum, predicted_sum, average="macro"):
+    """Averaged F1-score from the per label sums (labels on the last axis), see _scores_from_sums"""
+    denominator = predicted_sum + true_sum
+
+    if average == "micro":
+        return _divide(2 * true_positives.sum(axis=-1), denominator.sum(axis=-1))
+
+    f1 = _divide(2 * true_positives, denominator)
+
+    if average == "macro":
+        # Labels present in the true or predicted values: the denominator is positive
+        return _divide(f1.sum(axis=-1), (denominator > 0).sum(axis=-1))
+
+    elif average == "weighted":
+        return _divide((f1 * true_sum).sum(axis=-1), true_sum.sum(axis=-1))
+
+    raise ValueError("average should be 'micro', 'macro' or 'weighted', got %r" % average)
+
+
+#---------------------------------------------
+# Spearman rank-order correlation
+#---------------------------------------------
+
+def rank_average(values, axis=-1):
+    """Ranks of values along an axis, ties get the average rank (same as scipy.stats.rankdata).
+    NaN values are left out of the ranking and get a NaN rank.
+
+    :param values: numpy array
+    :param axis: axis along which the values are ranked
+    :return: numpy array of ranks (float, starting from 1)
+    """
+    values = np.moveaxis(np.asarray(values, dtype=float), axis, -1)
+    n = values.shape[-1]
+
+    if n == 0:
+        return np.moveaxis(values.copy(), -1, axis)
+
+    # NaN values are sorted last
+    order = np.argsort(values, axis=-1, kind="mergesort")
+    sorted_values = np.take_along_axis(values, order, axis=-1)
+
+    # First and last position of each group of tied values
+    positions = np.broadcast_to(np.arange(n), values.shape)
+    group_start = np.ones(values.shape, dtype=bool)
+    group_start[..., 1:] = sorted_values[..., 1:] != sorted_values[..., :-1]
+    group_end = np.ones(values.shape, dtype=bool)
+    group_end[..., :-1] = group_start[..., 1:]
+
+    first = np.maximum.accumulate(np.where(group_start, positions, 0), axis=-1)
+    last = np.flip(np.minimum.accumulate(np.flip(np.where(group_end, positions, n - 1), axis=-1), axis=-1), axis=-1)
+
+    ranks = np.empty(values.shape)
+    np.put_along_axis(ranks, order, (first + last) / 2.0 + 1, axis=-1)
+    ranks[np.isnan(values)] = np.nan
+
+    return np.moveaxis(ranks, -1, axis)
+
+
+def spearman_rho(x, y, axis=-1):
+    """Spearman rank-order correlation between x and y along an axis, leaving out pairs with a NaN value
+    (same as scipy.stats.spearmanr with nan_policy="omit", or pandas corr("spearman"))
+
+    :param x: numpy array
+    :param y: numpy array (same shape as x)
+    :param axis: axis of the observations
+    :return: numpy array of correlation coefficients (NaN if less than two observations)
+    """
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    valid = ~(np.isnan(x) | np.isnan(y))
+
+    rank_x = rank_average(np.where(valid, x, np.nan), axis=axis)
+    rank_y = rank_average(np.where(valid, y, np.nan), axis=axis)
+
+    n = valid.sum(axis=axis, keepdims=True)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dx = np.where(valid, rank_x - np.nansum(rank_x, axis=axis, keepdims=True) / n, 0)
+        dy = np.where(valid, rank_y - np.nansum(rank_y, axis=axis, keepdims=True) / n, 0)
+
+        rho = (dx * dy).sum(axis=axis) / np.sqrt((dx ** 2).sum(axis=axis) * (dy ** 2).sum(axis=axis))
+
+    return np.where(np.squeeze(n, axis=axis) > 1, rho, np.nan)
+
+
+def spearman_pvalue(rho, n):
+    """Two-sided p-value of Spearman rho with n observations (t-distribution, same as scipy.stats.spearmanr)
+
+    :param rho: numpy array of correlation coefficients
+    :param n: numpy array of number of observations
+    :return: numpy array of p-values
+    """
+    rho = np.asarray(rho, dtype=float)
+    dof = np.asarray(n, dtype=float) - 2
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = rho * np.sqrt(dof / ((rho + 1.0) * (1.0 - rho)))
+
+    # Perfect correlation: t is infinite, and the p-value 0
+    return np.where(dof > 0, 2 * t_distribution.sf(np.abs(t), dof), np.nan)
+
+
+def count_by_label(dataframe, columns=None):
+    """Number of rows per label in each column (same as dataframe.apply(lambda x: x.value_counts())).
+
+    :param dataframe: Pandas DataFrame (e.g. origin country of each user in a column per method)
+    :param columns: columns to count (default: all columns)
+    :return: Pandas DataFrame with labels as index and columns as columns. NaN if the label does not appear
+    """
+    if columns is None:
+        columns = list(dataframe.columns)
+
+    values = dataframe[list(columns)].values
+    codes, labels = pd.factorize(values.ravel(), sort=True)
+    codes = codes.reshape(values.shape)
+
+    # Missing values have the code -1 and are not counted
+    column_index = np.broadcast_to(np.arange(len(columns)), codes.shape)
+    valid = codes >= 0
+    counts = np.bincount((codes * len(columns) + column_index)[valid],
+                         minlength=len(labels) * len(columns)).reshape(len(labels), len(columns))
+
+    return pd.DataFrame(np.where(counts > 0, counts, np.nan), index=labels, columns=list(columns))
+
+
+def subsets_by_group(groups, prefix=""):
+    """Masks for the subsets of rows in each group (e.g. countries of each continent)
+
+    :param groups: group of each row (e.g. RegCode of each country)
+    :param prefix: prefix for the subset names
+    :return: dictionary of subset names and boolean masks
+    """
+    groups = pd.Series(groups)
+
+    return {"%s%s" % (prefix, group): (groups == group).values for group in sorted(groups.dropna().unique())}
+
+
+def spearman_table(data, reference_column="YEAR2014", method_columns=None, subsets=None):
+    """Spearman rank-order correlation and p-value between every method column and the reference column,
+    for several subsets of rows at once. Pairs with a NaN value are left out (nan_policy="omit").
+
+    The method columns of all subsets are stacked in one array, with NaN values outside the subset, and ranked
+    at once with tie-aware average ranks.
+
+    :param data: Pandas DataFrame with a row per country, a column per method and the reference column
+    :param reference_column: column of official visitor statistics (default: "YEAR2014")
+    :param method_columns: method columns (default: all numeric columns other than the reference column)
+    :param subsets: dictionary of subset names and boolean row masks (e.g. {"noSF": data["FIPS"] != "SF"}).
+                    Default: all rows ("all")
+    :return: Pandas DataFrame with methods as index, and columns (subset, "rho"/"p"/"n")
+    """
+    if method_columns is None:
+        method_columns = [column for column in data.select_dtypes("number").columns if column != reference_column]
+
+    if subsets is None:
+        subsets = {"all": np.ones(len(data), dtype=bool)}
+
+    names = list(subsets)
+    masks = np.array([np.asarray(subsets[name], dtype=bool) for name in names])
+
+    values = data[list(method_columns)].values.astype(float).T
+    reference = data[reference_column].values.astype(float)
+
+    # Array of shape (n_subsets, n_methods, n_rows), NaN outside each subset
+    x = np.where(masks[:, None, :], values[None, :, :], np.nan)
+    y = np.broadcast_to(reference, x.shape)
+
+    rho = spearman_rho(x, y)
+    n = (~(np.isnan(x) | np.isnan(y))).sum(axis=-1)
+    p = spearman_pvalue(rho, n)
+
+    table = {}
+    for i, name in enumerate(names):
+        table[(name, "rho")] = rho[i]
+        table[(name, "p")] = p[i]
+        table[(name, "n")] = n[i]
+
+    return pd.DataFrame(table, index=list(method_columns))
+
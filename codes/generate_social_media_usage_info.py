@@ -5,10 +5,25 @@ Code associated to following manuscript:
 
 
 Generate social media usage info per user
+
+The usage statistics are grouped on the integer time keys of the post table (day, week, month, year, see
+time_keys.py) instead of pandas Period columns.
 """
 import pandas as pd
-import  geopandas as gpd
 import matplotlib.pyplot as plt
+from post_table import decode, read_post_table
+from time_keys import NS_PER_DAY
+
+#--------------------------
+# Functions
+#--------------------------
+
+def posts_per_t(df, t):
+    """Coefficient of variation of the number of posts per time unit (or region) for each user"""
+    counts = df.groupby(["user", t]).photoid.nunique().groupby(level="user")
+    cf = counts.std() / counts.mean()
+    return cf
+
 #--------------------------
 # SOCIAL MEDIA DATA
 #--------------------------
@@ -19,12 +34,12 @@ plt.style.use('grayscale')
 #each point is assigned to the nearest region if found not on land. Also duplicates have been removed
 fp = r"./demo_data/fake_input_data.shp"
 
-#read demo_data with geopandas
-some = gpd.read_file(fp)
+# Read demo_data into a compact post table (integer user codes and time keys)
+some, codebooks = read_post_table(fp)
 
 # Print layer info
 print("Number of posts:", len(some))
-print("Number of users:", some.userid.nunique())
+print("Number of users:", some.user.nunique())
 
 # EXCLUDE POSTS WITHIN KRUGER NATIONAL PARK (ASSUME NO ONE LIVES THERE..even though in fact people do live there..)
 some = some[some["FromKruger"]==0]
@@ -32,48 +47,32 @@ some = some[some["FromKruger"]==0]
 # Print layer info
 print("\nAfter excluding posts from Kruger:")
 print("Number of posts:", len(some))
-print("Number of users:", some.userid.nunique(), "\n")
+print("Number of users:", some.user.nunique(), "\n")
 
-# Prepare the demo_data
-some["time_local"] = pd.to_datetime(some["time_local"])
-# Separate months, weeks and days into own columns for cross-tabulation:
-some["year"] = some.time_local.dt.to_period('Y')
-some["month"] = some.time_local.dt.to_period('M')  # some["time_local"].apply(lambda x: x.month)
-some["week"] = some.time_local.dt.to_period('W')
-some["day"] = some.time_local.dt.to_period('D')
+grouped = some.groupby("user")
 
-grouped = some.groupby("userid")
+# Users in the order of their first post
+users = pd.DataFrame(index=pd.unique(some["user"]))
 
-users = pd.DataFrame(index=some.userid.unique())
+# Count of photos
+users["photo_count"] = grouped.photoid.nunique()
 
-def posts_per_t(df, t):
-    cf = df.groupby(t).photoid.nunique().std() / df.groupby(t).photoid.nunique().mean()
-    return cf
+# Timedelta (days)
+users["timedelta"] = (grouped.time.max() - grouped.time.min()) // NS_PER_DAY
+
+# Number of countries
+users["country_count"] = grouped.FIPS.nunique()
+users["posts_per_country_count_cf"] = posts_per_t(some, "FIPS")
+
+# Max time units
+for t in ["year", "month", "week", "day"]:
+    users[t + "s"] = grouped[t].nunique()
+
+# Coefficients of variation for posts per time unit
+for t in ["year", "month", "week", "day"]:
+    users["posts_per_%s_cf" % t] = posts_per_t(some, t)
+
+users = users.astype(float)
+users.index = decode(codebooks, "userid", users.index)
 
-for key, group in grouped:
-    
-    # Count of photos
-    users.at[key, "photo_count"] = group.photoid.nunique()
-    
-    # Timedelta
-    timedelta = group.time_local.max() - group.time_local.min()
-    users.at[key, "timedelta"] = timedelta.days
-
-    # Number of countries
-    users.at[key, "country_count"] = group.FIPS.nunique()
-    users.at[key, "posts_per_country_count_cf"] = posts_per_t(group, "FIPS")
-
-    # Max time units
-    users.at[key, "years"] = group.year.nunique()
-    users.at[key, "months"] = group.month.nunique()
-    users.at[key, "weeks"] = group.week.nunique()
-    users.at[key, "days"] = group.day.nunique()
-    
-    # Coefficients of variation for posts per time unit
-    users.at[key, "posts_per_year_cf"] = posts_per_t(group, "year")
-    users.at[key, "posts_per_month_cf"] = posts_per_t(group, "month")
-    users.at[key, "posts_per_week_cf"] = posts_per_t(group, "week")
-    users.at[key, "posts_per_day_cf"] = posts_per_t(group, "day")
-
-
-users.to_csv(r"./demo_data/fake_user_info.csv", index_label="userid", sep=";")
\ No newline at end of file
+users.to_csv(r"./demo_data/fake_user_info.csv", index_label="userid", sep=";")
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+SOMEORIGINS - GRID - BASIC
+
+Script for identifying the most probable home country for Instagram users that have visited Kruger national park, SA.
+Grid-based alternative to the DBSCAN clustering (clusters_basic.py) and the centrographic methods (spatial_basic.py):
+
+1. Read input demo_data
+    - All posts from all users who visited Kruger in 2014
+        --> Exclude posts within target area (Kruger) from further analysis
+2. Bin the posts of all users into a global grid of equal-area cells (Lambert cylindrical equal-area), in one pass
+   with integer cell keys (see grid_cells.py)
+    --> Count the posts of each user in each occupied cell
+    --> (optional) Smooth the counts over the neighborhood of each cell with a separable kernel (box or gaussian)
+3. Find the densest (smoothed) cell of each user
+4. Determine origin country: the country of most of the user's posts within the densest cell
+5. Print origin country to file by user and by region
+
+Data:
+     Input: Entire posting history of social media users who visited the target area.
+     Input demo_data should already have information about the country of origin.
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+
+usage:
+    python grid_basic.py cell_size
+
+    cell size in km determines the size of the grid cells. If cell_size is not defined, it defaults to 50.
+"""
+import pandas as pd
+import os
+import sys
+from grid_cells import cell_counts, cell_regions, densest_cells, grid_cells, kernel_weights, smooth_cells
+from period_weights import post_weights
+from post_table import decode, read_post_table
+from result_store import input_hash, lookup_result, result_key, store_result
+from target_areas import exclude_target_area
+
+
+#-----------------------
+# Settings
+#-----------------------
+
+# cell size in kilometers
+try:
+    cell_size = int(sys.argv[1])
+
+except:
+    # 50 km if not set on command line
+    cell_size = 50
+
+# radius of the neighborhood in cells (0: densest single cell, 1: densest 3 x 3 cell neighborhood)
+radius = 1
+
+# kernel of the neighborhood smoothing ("box" or "gaussian") and standard deviation of the gaussian kernel in cells
+kernel = "box"
+sigma = 1.0
+
+# Weighting of the posts (None: each post counts once, "day": each day with posts counts once,
+# "location_day": each location counts once per day). See period_weights.py.
+post_weighting = None
+
+# Exclude also the posts within +-trip_days days of the visit to the target area (None: only the target area posts)
+trip_days = None
+
+# Suffix of the result names if the posts within the trip window are also excluded
+trip_suffix = "" if trip_days is None else "_trip_%sd" % trip_days
+
+# Suffix of the result names if the posts are weighted
+weight_suffix = "" if post_weighting is None else "_%s_weights" % post_weighting
+
+# Create column name for final output with info of used cell size
+method_name = "basic_grid_%s_km%s%s" % (cell_size, weight_suffix, trip_suffix)
+
+# --------------------------
+# Read in demo_data
+# --------------------------
+print("Reading demo_data..")
+
+# Social media mobility history for Kruger national park visitors, with regioninfo
+fp = r"./demo_data/fake_input_data.shp"
+
+# Key of the result in the result store: method, parameters and hash of the input data
+data_hash = input_hash(fp)
+params = {"cell_size": cell_size, "radius": radius, "kernel": kernel, "region_level": "FIPS"}
+
+if kernel == "gaussian":
+    params["sigma"] = sigma
+
+if post_weighting is not None:
+    params["weights"] = post_weighting
+
+if trip_days is not None:
+    params["trip_days"] = trip_days
+
+key = result_key("basic_grid", params, data_hash)
+
+# Skip the run if the same result already exists
+if lookup_result(key) is not None:
+    print("Result %s (%s) is already in the result store, skipping.." % (method_name, key))
+    sys.exit()
+
+some, codebooks = read_post_table(fp)
+
+# Print layer info
+print("Number of posts:", len(some))
+print("Number of users:", some.user.nunique())
+
+# EXCLUDE POSTS WITHIN KRUGER NATIONAL PARK (ASSUME NO ONE LIVES THERE..even though in fact people do live there..)
+some = exclude_target_area(some, some["FromKruger"].values == 1, trip_days)
+
+# Print layer info
+print("\nAfter excluding posts from Kruger:")
+print("Number of posts:", len(some))
+print("Number of users:", some.user.nunique(), "\n")
+
+# Weights of the posts (1 for each post, if post_weighting is None)
+some["weight"] = post_weights(some, post_weighting)
+
+# -----------------------------------
+# Count posts in grid cells
+# -----------------------------------
+print("Counting posts in %s km grid cells.." % cell_size)
+
+rows, columns = grid_cells(some["lat"].values, some["lon"].values, cell_size)
+cells, counts, post_cells = cell_counts(some["user"].values, rows, columns, cell_size, weights=some["weight"].values)
+
+print("Number of occupied user cells:", len(cells))
+
+# Smoothed counts over the neighborhood of each cell
+if radius > 0:
+    scores = smooth_cells(cells, counts, cell_size, kernel_weights(radius, kernel, sigma))
+else:
+    scores = counts
+
+# --------------------------------------------------------
+# Determine origin country based on the densest grid cell
+# --------------------------------------------------------
+print("Determining origin country..")
+
+winners = densest_cells(cells, scores, counts, cell_size)
+
+# Posts within the densest cell of their user, and the country of most of those posts
+in_winner = cells[post_cells] == winners.reindex(some["user"].values).values
+
+user_list = pd.DataFrame(index=some.user.unique())
+user_list[method_name] = cell_regions(some["user"].values, some["FIPS"].values, in_winner,
+                                      weights=some["weight"].values)
+
+# ------------------------------
+# Write result to file by user
+# ------------------------------
+print("Writing results with cell size %s.." % cell_size)
+
+# Drop users with no result
+user_list = user_list.dropna()
+
+# Decode user ids and region codes for output
+user_list.index = decode(codebooks, "userid", user_list.index)
+user_list[method_name] = decode(codebooks, "FIPS", user_list[method_name].astype(int))
+
+folder = r"./demo_results"
+fp_by_users = os.path.join(folder, "%s_%susers.csv" % (method_name, str(len(user_list))))
+
+user_list.to_csv(fp_by_users, sep=";", index=True, index_label="userid")
+
+# -------------------------------
+# Write result to file by country
+# --------------------------------
+fp_by_region = os.path.join(folder, "%s_%susers_by_country.csv" % (method_name, str(len(user_list))))
+
+user_list[method_name].value_counts().to_csv(fp_by_region, sep=";", index_label="FIPS", header=[method_name])
+
+# Save the result into the result store
+store_result(user_list[[method_name]], "basic_grid", params, data_hash)
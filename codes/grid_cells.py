@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+Equal-area grid cells of the posts, for the grid-based origin detection (grid_basic.py).
+
+The posts of all users are binned into a global grid in one pass, without per-user trees:
+    - The posts are projected to the Lambert cylindrical equal-area projection (on the authalic sphere), where a grid
+      of equal rectangles is also a grid of equal-area cells on the globe
+    - Each post gets an integer cell key (user, row, column), and the posts are counted in each occupied cell with
+      one hash-based factorization of the keys (see cell_counts)
+    - Optionally, the count of each occupied cell is smoothed over its neighborhood with a separable kernel (the
+      product of a 1D kernel along the rows and the columns). The neighbor cells are looked up by their keys.
+    - The densest (smoothed) cell of each user is the winning cell
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+"""
+import numpy as np
+import pandas as pd
+
+# Radius of the authalic sphere of WGS84 in meters (sphere with the same surface area as the ellipsoid)
+AUTHALIC_RADIUS = 6371007.181
+
+
+def equal_area_coordinates(lat, lon):
+    """Project WGS84 coordinates to the Lambert cylindrical equal-area projection (on the authalic sphere)
+
+    :param lat: numpy array of latitudes in degrees
+    :param lon: numpy array of longitudes in degrees
+    :return: numpy arrays of x (-pi * R ... pi * R) and y (-R ... R) coordinates in meters
+    """
+    x = AUTHALIC_RADIUS * np.radians(np.asarray(lon, dtype=float))
+    y = AUTHALIC_RADIUS * np.sin(np.radians(np.asarray(lat, dtype=float)))
+
+    return x, y
+
+
+def grid_shape(cell_size_km):
+    """Number of rows and columns of the global grid. The cell width and height are adjusted so that the cells cover
+    the whole projection exactly, the area of each cell is approximately cell_size_km ** 2.
+
+    :param cell_size_km: cell size in kilometers
+    :return: number of rows, number of columns
+    """
+    cell_size = cell_size_km * 1000.0
+
+    n_rows = max(int(round(2 * AUTHALIC_RADIUS / cell_size)), 1)
+    n_columns = max(int(round(2 * np.pi * AUTHALIC_RADIUS / cell_size)), 1)
+
+    return n_rows, n_columns
+
+
+def grid_cells(lat, lon, cell_size_km):
+    """Row and column of the grid cell of each point
+
+    :param lat: numpy array of latitudes in degrees
+    :param lon: numpy array of longitudes in degrees
+    :param cell_size_km: cell size in kilometers (see grid_shape)
+    :return: numpy arrays of rows and columns (int64)
+    """
+    n_rows, n_columns = grid_shape(cell_size_km)
+    x, y = equal_area_coordinates(lat, lon)
+
+    rows = np.floor((y + AUTHALIC_RADIUS) / (2 * AUTHALIC_RADIUS) * n_rows).astype(np.int64)
+    columns = np.floor((x + np.pi * AUTHALIC_RADIUS) / (2 * np.pi * AUTHALIC_RADIUS) * n_columns).astype(np.int64)
+
+    # Points on the north pole and the antimeridian (180) are in the last row / column
+    return np.clip(rows, 0, n_rows - 1), np.clip(columns, 0, n_columns - 1)
+
+
+def cell_counts(users, rows, columns, cell_size_km, weights=None):
+    """Number of posts (or sum of the post weights) of each user in each occupied grid cell
+
+    :param users: numpy array of the user code of each post
+    :param rows: numpy array of the grid row of each post (see grid_cells)
+    :param columns: numpy array of the grid column of each post
+    :param cell_size_km: cell size in kilometers
+    :param weights: optional weight of each post (see period_weights.py)
+    :return: numpy array of the keys of the occupied cells (user, row and column in one int64), numpy array of the
+             counts of the cells, and numpy array of the position of each post's cell in the occupied cells
+    """
+    n_rows, n_columns = grid_shape(cell_size_km)
+
+    keys = (np.asarray(users, dtype=np.int64) * n_rows + rows) * n_columns + columns
+
+    # Hash-based factorization, one pass over the posts
+    post_cells, cells = pd.factorize(keys)
+    counts = np.bincount(post_cells, weights=weights, minlength=len(cells))
+
+    return np.asarray(cells, dtype=np.int64), counts, post_cells
+
+
+def kernel_weights(radius, kernel="box", sigma=1.0):
+    """1D kernel of the neighborhood smoothing
+
+    :param radius: radius of the neighborhood in cells (0: no smoothing)
+    :param kernel: "box" (all cells of the neighborhood count equally) or "gaussian"
+    :param sigma: standard deviation of the gaussian kernel in cells
+    :return: numpy array of the kernel weights (length 2 * radius + 1, 1 in the middle)
+    """
+    offsets = np.arange(-radius, radius + 1)
+
+    if kernel == "box":
+        return np.ones(len(offsets))
+
+    elif kernel == "gaussian":
+        return np.exp(-offsets ** 2 / (2.0 * sigma ** 2))
+
+    raise ValueError("unknown kernel %s (use box or gaussian)" % kernel)
+
+
+def smooth_cells(cells, counts, cell_size_km, kernel):
+    """Smoothed counts of the occupied cells: sum of the counts of the user's cells in the neighborhood, weighted
+    with a separable kernel. The neighborhood wraps around the antimeridian.
+
+    :param cells: numpy array of the keys of the occupied cells (see cell_counts)
+    :param counts: numpy array of the counts of the cells
+    :param cell_size_km: cell size in kilometers
+    :param kernel: 1D kernel weights (see kernel_weights)
+    :return: numpy array of the smoothed counts
+    """
+    n_rows, n_columns = grid_shape(cell_size_km)
+    radius = len(kernel) // 2
+
+    users = cells // (n_rows * n_columns)
+    rows = cells // n_columns % n_rows
+    columns = cells % n_columns
+
+    lookup = pd.Index(cells)
+    smoothed = np.zeros(len(cells))
+
+    for row_offset in range(-radius, radius + 1):
+        neighbor_rows = rows + row_offset
+        valid = np.flatnonzero((neighbor_rows >= 0) & (neighbor_rows < n_rows))
+
+        for column_offset in range(-radius, radius + 1):
+            neighbor_columns = (columns[valid] + column_offset) % n_columns
+            neighbor_keys = (users[valid] * n_rows + neighbor_rows[valid]) * n_columns + neighbor_columns
+            neighbors = lookup.get_indexer(neighbor_keys)
+
+            found = neighbors >= 0
+            smoothed[valid[found]] += kernel[row_offset + radius] * kernel[column_offset + radius] * \
+                counts[neighbors[found]]
+
+    return smoothed
+
+
+def densest_cells(cells, scores, counts, cell_size_km):
+    """Densest cell of each user: the cell with the highest score (e.g. smoothed count). Equal scores are resolved
+    with the count of the cell itself, and then by the cell key.
+
+    :param cells: numpy array of the keys of the occupied cells (see cell_counts)
+    :param scores: numpy array of the scores of the cells
+    :param counts: numpy array of the counts of the cells
+    :param cell_size_km: cell size in kilometers
+    :return: Pandas Series of the winning cell key of each user (user code as index)
+    """
+    n_rows, n_columns = grid_shape(cell_size_km)
+    users = cells // (n_rows * n_columns)
+
+    order = np.lexsort((cells, -counts, -scores, users))
+    first = np.r_[True, users[order][1:] != users[order][:-1]]
+
+    return pd.Series(cells[order][first], index=users[order][first])
+
+
+def cell_regions(users, regions, in_cell, weights=None):
+    """Region of each user's winning cell: the region of most posts (or highest sum of the post weights) of the user
+    within the cell. Equal counts are resolved by the region code.
+
+    :param users: numpy array of the user code of each post
+    :param regions: numpy array of the region code of each post (e.g. FIPS)
+    :param in_cell: boolean numpy array of the posts within the winning cell of their user
+    :param weights: optional weight of each post
+    :return: Pandas Series of the region code of each user (user code as index)
+    """
+    posts = pd.DataFrame({"user": np.asarray(users)[in_cell], "region": np.asarray(regions)[in_cell],
+                          "weight": 1.0 if weights is None else np.asarray(weights)[in_cell]})
+
+    totals = posts.groupby(["user", "region"])["weight"].sum().reset_index()
+    totals = totals.sort_values(["user", "weight", "region"], ascending=[True, False, True])
+
+    return totals.drop_duplicates("user").set_index("user")["region"]
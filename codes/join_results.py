@@ -11,6 +11,7 @@ import os
 import glob
 import pandas as pd
 import geopandas as gpd
+from result_store import find_results, input_hash, load_result
 
 # Results by user
 in_folder = r"./demo_results"
@@ -27,6 +28,23 @@ for csv in files:
     data.index = data["userid"]
     results = results.join(data[data.columns[-1]])
 
+# Results in the result store without a result file, computed from the same input data. Results of different
+# parameters can have the same column name (e.g. different min_points), so these are named with their key.
+stored = find_results(data_hash=input_hash(r"./demo_data/fake_input_data.shp"))
+file_columns = set(results.columns)
+
+for key in stored.index:
+    column = stored.at[key, "column"]
+
+    if column in file_columns:
+        continue
+
+    if (stored["column"] == column).sum() > 1:
+        column = "%s_%s" % (column, key)
+
+    data = load_result(key)
+    results[column] = data[data.columns[-1]].reindex(results.index.astype(str)).values
+
 
 codes_fp = "country_codes.csv"
 codes = pd.read_csv(codes_fp, sep=";")
@@ -21,10 +21,10 @@ License:
     Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
 """
 
-import geopandas as gpd
 import pandas as pd
 import os, sys
-from fiona.crs import from_epsg
+from post_table import decode, read_post_table, split_trivial_users
+from target_areas import exclude_target_area
 
 
 #-----------------------------------------------------------------------
@@ -43,7 +43,8 @@ def homelocation_maxposts(in_df, regioncolname, index=1):
         region, photo_cnt = value_counts.index[i], value_counts[value_counts.index[i]]
 
     except:
-        region, photo_cnt = "N/A", 0
+        # No region (code -1 is decoded to "N/A" for output)
+        region, photo_cnt = -1, 0
 
     # Return the region and associated photo count:
     return region, photo_cnt
@@ -85,8 +86,14 @@ def joinHomeLocWithCountryShape(region_matrix, region_column, region_shape):
     return region_join
 
 
+# Exclude also the posts within +-trip_days days of the visit to the target area (None: only the target area posts)
+trip_days = None
+
+# Suffix of the result names if the posts within the trip window are also excluded
+trip_suffix = "" if trip_days is None else "_trip_%sd" % trip_days
+
 # set method name
-method_name = "basic_maxposts"
+method_name = "basic_maxposts" + trip_suffix
 
 #--------------------------
 # SOCIAL MEDIA DATA
@@ -95,31 +102,35 @@ method_name = "basic_maxposts"
 # each point is assigned to the nearest region if found not on land
 fp = r"./demo_data/fake_input_data.shp"
 
-#read demo_data with geopandas
-some = gpd.read_file(fp)
+# Read demo_data into a compact post table: integer codes for users and regions.
+# Original user ids and region values are in the codebooks, and are decoded only for output.
+some, codebooks = read_post_table(fp)
 
 # Print layer info
 print("Number of posts:", len(some))
-print("Number of users:", some.userid.nunique())
+print("Number of users:", some.user.nunique())
 
 # EXCLUDE POSTS WITHIN KRUGER NATIONAL PARK (ASSUME NO ONE LIVES THERE..even though in fact people do live there..)
-some = some[some["FromKruger"]==0]
+some = exclude_target_area(some, some["FromKruger"].values == 1, trip_days)
 
 # Print layer info
 print("\nAfter excluding posts from Kruger:")
 print("Number of posts:", len(some))
-print("Number of users:", some.userid.nunique(), "\n")
+print("Number of users:", some.user.nunique(), "\n")
+
+# Fast path: users with all posts in one country need no ranking of countries
+trivial_users, ranked = split_trivial_users(some, "FIPS")
 
 # Group by individual users
-grouped = some.groupby('userid')
+grouped = ranked.groupby('user')
 
 #-----------------------------------------
 # Detect 1st and 2nd country with maxposts for each user
 #------------------------------------------
 
-# Create GeoDataFrame for the results
-geo = gpd.GeoDataFrame(crs=from_epsg(4326), columns = ['userid', 'post_cnt', "FIPS_1",
-                                                       "FIPS_1_photocount", "FIPS_2", "FIPS_2_photocount"])
+# Create DataFrame for the results
+geo = pd.DataFrame(columns = ['userid', 'post_cnt', "FIPS_1",
+                              "FIPS_1_photocount", "FIPS_2", "FIPS_2_photocount"])
 
 for userid, data in grouped:
     # Get userid and number of posts
@@ -130,6 +141,16 @@ for userid, data in grouped:
     geo.loc[userid, ["FIPS_1", "FIPS_1_photocount"]] = homelocation_maxposts(data, "FIPS", 1)
     geo.loc[userid, ["FIPS_2", "FIPS_2_photocount"]] = homelocation_maxposts(data, "FIPS", 2)
 
+# Users with all posts in one country: the only country has all posts, and there is no 2nd country
+post_counts = some.groupby("user").size()
+
+trivial_geo = pd.DataFrame({"userid": trivial_users.index, "post_cnt": post_counts[trivial_users.index].values,
+                            "FIPS_1": trivial_users.values,
+                            "FIPS_1_photocount": post_counts[trivial_users.index].values,
+                            "FIPS_2": -1, "FIPS_2_photocount": 0}, index=trivial_users.index, dtype=object)
+
+geo = pd.concat([geo, trivial_geo]).sort_index()
+
 # Check if there were any regions with equal amount of posts for some user
 checkTop2homes(geo, "FIPS_1","FIPS_2")
 
@@ -139,13 +160,19 @@ checkTop2homes(geo, "FIPS_1","FIPS_2")
 # Reset index
 geo = geo.reset_index(drop=True)
 
+# Decode user ids and regions for output (regions are "N/A" if the user has no 2nd region)
+geo["userid"] = decode(codebooks, "userid", geo["userid"].astype(int))
+
+for column in ["FIPS_1", "FIPS_2"]:
+    geo[column] = decode(codebooks, column.rsplit("_", 1)[0], geo[column].astype(int), missing="N/A")
+
 # save the user list with home country info in a file:
 homelocs = geo
 
 homelocs[method_name] = homelocs["FIPS_1"]
 
 
-homelocs.to_csv(r"./../demo_results/%s_%susers.csv" % (method_name, str(homelocs.userid.nunique())),
+homelocs.to_csv(r"./demo_results/%s_%susers.csv" % (method_name, str(homelocs.userid.nunique())),
                 sep=";")
 
 #------------------------------
@@ -157,7 +184,7 @@ country_matrix = aggregateRegionInfo(geo, 'FIPS_1')
 country_matrix.rename(columns={"FIPS_1_visitorcount": method_name},
                       inplace=True)
 
-country_matrix.to_csv(r"./../demo_results/%s_%susers_by_country.csv" % (method_name, str(homelocs.userid.nunique())),
+country_matrix.to_csv(r"./demo_results/%s_%susers_by_country.csv" % (method_name, str(homelocs.userid.nunique())),
                       index = False,
                       sep=";")
 
@@ -18,6 +18,13 @@ The script calculates following things:
     - Create an output file with probable home country, subregion and region for each user
     - Create an output file for regions, subregions and countries with number of home locations
 
+    The number of posts is counted once for each user and region unit, and rolled up to the continents, and to the
+    sub-regions and countries within the top continent / sub-region (see region_rollup.py).
+
+    NOTE! Regions with equally many posts are ranked by the first post of the user in the region (see
+    region_rollup.rank_regions). The committed demo results were made with an older pandas version, whose value_counts
+    ordered equal counts differently: user 6 in the demo data gets AU (not SP) as the country.
+
 Data:
     Input: Entire posting history of social media users who have visited the target area (visitors to Kruger national park in 2014)
     Input demo_data should already have information about the continent, subregion and country of origin.
@@ -30,32 +37,36 @@ Usage:
 
 """
 
-import geopandas as gpd
+import numpy as np
 import pandas as pd
 import os, sys
-from fiona.crs import from_epsg
+from post_table import decode, read_post_table, region_hierarchy
+from region_rollup import aggregate_units, rank_regions, rollup
+from target_areas import exclude_target_area
 
 
 #------------------------
 # Functions
 #------------------------
-def homelocation_maxposts(in_df, regioncolname, index = 1):
-    """Return the region with most posts (or 2nd most posts etc.) and associated photocount"""
-    # Create index for accessing the correct position among potential homelocations
-    i= index - 1
+def top_regions(table, users):
+    """Return the regions with most posts and 2nd most posts, and associated photocounts for each user
 
-    # List number of posts per region:
-    value_counts = in_df[regioncolname].value_counts()
+    :param table: number of posts of each user in each region (see region_rollup.rollup)
+    :param users: user codes
+    :return: region with most posts, photo count, region with 2nd most posts, photo count (numpy arrays).
+             If there is no region, the region code is -1 and the photo count is 0.
+    """
+    # Rank of the regions by the number of posts (equal counts are ranked by the first post in the region)
+    ranks = rank_regions(table, "n_posts")
 
-    # get the region with most posts, 2nd mosts posts etc. depending on the index
-    try:
-        region, photo_cnt = value_counts.index[i], value_counts[value_counts.index[i]]
+    result = []
 
-    except:
-        region, photo_cnt = "N/A", 0
+    for rank in (1, 2):
+        top = table[ranks == rank].set_index("user")
+        result.append(top["region"].reindex(users, fill_value=-1).values)
+        result.append(top["n_posts"].reindex(users, fill_value=0).values)
 
-    #Return the region and associated photo count:
-    return region, photo_cnt
+    return result
 
 def checkTop2homes(inDF, regioncol1, regioncol2):
     """ Check if the 1st and 2nd most probable home locations have the same amount of posts"""
@@ -92,84 +103,85 @@ def joinHomeLocWithCountryShape(region_matrix, region_column, region_shape):
     return region_join
 
 
+# Exclude also the posts within +-trip_days days of the visit to the target area (None: only the target area posts)
+trip_days = None
+
+# Suffix of the result names if the posts within the trip window are also excluded
+trip_suffix = "" if trip_days is None else "_trip_%sd" % trip_days
+
 # set method name
-method_name = "hierarchical_maxposts"
+method_name = "hierarchical_maxposts" + trip_suffix
 
 #--------------------------
 # SOCIAL MEDIA DATA
 #--------------------------
 # Social media mobility history for Kruger national park visitors, with regioninfo, each point is assigned to the nearest region if found not on land
-fp = r"./../demo_data/fake_input_data.shp"
+fp = r"./demo_data/fake_input_data.shp"
 
-#read demo_data with geopandas
-some = gpd.read_file(fp)
+# Read demo_data into a compact post table: integer codes for users and regions.
+# Original user ids and region values are in the codebooks, and are decoded only for output.
+some, codebooks = read_post_table(fp)
 
 # Print layer info
 print("Number of posts:", len(some))
-print("Number of users:", some.userid.nunique())
+print("Number of users:", some.user.nunique())
 
 # -----------------------------------
 # Posts within Kruger
 # -----------------------------------
 
 # EXCLUDE POSTS WITHIN KRUGER NATIONAL PARK (ASSUME NO ONE LIVES THERE..even though in fact people do live there..)
-some = some[some["FromKruger"]==0]
+some = exclude_target_area(some, some["FromKruger"].values == 1, trip_days)
 
 # Print layer info
 print("\nAfter excluding posts from Kruger:")
 print("Number of posts:", len(some))
-print("Number of users:", some.userid.nunique(), "\n")
+print("Number of users:", some.user.nunique(), "\n")
 
 #-------------------------------------------------------
 # Detect regions and country with maxposts for each user
 #-------------------------------------------------------
 
-# Group by individual users
-grouped = some.groupby('userid')
+# Region unit (continent, sub-region, country) of each post
+hierarchy, units = region_hierarchy(some)
+
+# Number of posts of each user in each region unit. These are rolled up to the continents, and to the sub-regions
+# and countries within the top continent / sub-region of each user.
+aggregates, _ = aggregate_units(some["user"].values, units, some["time"].values)
 
-# Create GeoDataFrame for the results
-geo = gpd.GeoDataFrame(crs=from_epsg(4326), columns = ['userid', 'post_cnt', 't_bef_KNP', 'time_dif', "FIPS_1",
-                                                       "FIPS_1_photocount", "FIPS_2", "FIPS_2_photocount",
-                                                       "SubReg_2_1", "SubReg_2_1_photocnt", "RegCode_1",
-                                                       "RegCode_1_photocnt","RegCode_2", "RegCode_2_photocnt",
-                                                       "SubReg_2_2", "SubReg_2_2_photocnt"])
+users = np.unique(some["user"].values)
 
-# Number of posts for each user
-for userid, data in grouped:
-    # Get userid and number of posts
-    geo.loc[userid, "userid"] = userid
-    geo.loc[userid, "post_cnt"] = len(data)
+# Create DataFrame for the results
+geo = pd.DataFrame(index=users, columns = ['userid', 'post_cnt', 't_bef_KNP', 'time_dif', "FIPS_1",
+                                           "FIPS_1_photocount", "FIPS_2", "FIPS_2_photocount",
+                                           "SubReg_2_1", "SubReg_2_1_photocnt", "RegCode_1",
+                                           "RegCode_1_photocnt","RegCode_2", "RegCode_2_photocnt",
+                                           "SubReg_2_2", "SubReg_2_2_photocnt"])
+
+# Get userid and number of posts
+geo["userid"] = users
+geo["post_cnt"] = some.groupby("user").size()
 
 # REGION/CONTINENT with maxposts for each user using the basic approach
 # (list also the second most visited region for accuracy assesment)
-for userid, data in grouped:
-    # DETERMINE CONTINENT/LARGER REGION with 1st and 2nd most posts
-    geo.loc[userid, ["RegCode_1", "RegCode_1_photocnt"]] = homelocation_maxposts(data, "RegCode", 1)
-    geo.loc[userid, ["RegCode_2", "RegCode_2_photocnt"]] = homelocation_maxposts(data, "RegCode", 2)
+continents = rollup(aggregates, hierarchy, "RegCode")
+geo["RegCode_1"], geo["RegCode_1_photocnt"], geo["RegCode_2"], geo["RegCode_2_photocnt"] = \
+    top_regions(continents, users)
 
 # Check if there were any regions with equal amount of posts for some user
 checkTop2homes(geo, "RegCode_1","RegCode_2")
 
 # SUBREGION (within top continent)
-for userid, data in grouped:
-    # SELECT POST WITHIN THE CONTINENT WITH MOST POSTS
-    data = data[data["RegCode"] == geo.loc[userid, "RegCode_1"]]
-
-    # DETERMINE REGION with 1st and 2nd most posts
-    geo.loc[userid, ["SubReg_2_1", "SubReg_2_1_photocnt"]] = homelocation_maxposts(data, "SubReg_2", 1)
-    geo.loc[userid, ["SubReg_2_2", "SubReg_2_2_photocnt"]] = homelocation_maxposts(data, "SubReg_2", 2)
+subregions = rollup(aggregates, hierarchy, "SubReg_2", selected=geo["RegCode_1"], upper_level="RegCode")
+geo["SubReg_2_1"], geo["SubReg_2_1_photocnt"], geo["SubReg_2_2"], geo["SubReg_2_2_photocnt"] = \
+    top_regions(subregions, users)
 
 # Check if there were any regions with equal amount of posts for some user
 checkTop2homes(geo, "SubReg_2_1", "SubReg_2_2")
 
 # COUNTRIES (within top subregion)
-for userid, data in grouped:
-    # SELECT POST WITHIN THE REGION WITH MOST POSTS
-    data = data[data["SubReg_2"] == geo.loc[userid, "SubReg_2_1"]]
-
-    # DETERMINE COUNTRY with 1st and 2nd most posts
-    geo.loc[userid, ["FIPS_1", "FIPS_1_photocount"]] = homelocation_maxposts(data, "FIPS",1)
-    geo.loc[userid, ["FIPS_2", "FIPS_2_photocount"]] = homelocation_maxposts(data, "FIPS", 2)
+countries = rollup(aggregates, hierarchy, "FIPS", selected=geo["SubReg_2_1"], upper_level="SubReg_2")
+geo["FIPS_1"], geo["FIPS_1_photocount"], geo["FIPS_2"], geo["FIPS_2_photocount"] = top_regions(countries, users)
 
 # Check if there were any regions with equal amount of posts for some user
 checkTop2homes(geo, "FIPS_1", "FIPS_2")
@@ -177,6 +189,12 @@ checkTop2homes(geo, "FIPS_1", "FIPS_2")
 # Reset index
 geo = geo.reset_index(drop=True)
 
+# Decode user ids and regions for output (regions are "N/A" if the user has no 2nd region)
+geo["userid"] = decode(codebooks, "userid", geo["userid"].astype(int))
+
+for column in ["FIPS_1", "FIPS_2", "SubReg_2_1", "SubReg_2_2", "RegCode_1", "RegCode_2"]:
+    geo[column] = decode(codebooks, column.rsplit("_", 1)[0], geo[column].astype(int), missing="N/A")
+
 # save the userlist with home country info in a file:
 homelocs = geo[['userid', 'post_cnt', 't_bef_KNP', 'time_dif', 'FIPS_1', 'FIPS_1_photocount', 'FIPS_2',
                 'FIPS_2_photocount', 'SubReg_2_1','SubReg_2_1_photocnt', 'RegCode_1', 'RegCode_1_photocnt',
@@ -185,7 +203,7 @@ homelocs = geo[['userid', 'post_cnt', 't_bef_KNP', 'time_dif', 'FIPS_1', 'FIPS_1
 homelocs[method_name] = homelocs["FIPS_1"]
 
 
-homelocs.to_csv(r"./../demo_results/%s_%susers.csv" % (method_name, str(homelocs.userid.nunique())), sep=";")
+homelocs.to_csv(r"./demo_results/%s_%susers.csv" % (method_name, str(homelocs.userid.nunique())), sep=";")
 
 #------------------------------
 # Aggregate results by region
@@ -200,7 +218,7 @@ country_matrix.rename(columns={"FIPS_1_visitorcount": method_name}, inplace=True
 subregion2_matrix = aggregateRegionInfo(geo, 'SubReg_2_1')
 continent_matrix = aggregateRegionInfo(geo, 'RegCode_1')
 
-country_matrix.to_csv(r"./../demo_results/%s_%susers_by_country.csv" % (method_name, str(homelocs.userid.nunique())),
+country_matrix.to_csv(r"./demo_results/%s_%susers_by_country.csv" % (method_name, str(homelocs.userid.nunique())),
                       index=False, sep=";")
 
 
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+Weights of the posts based on the time periods of the posts (see time_keys.py).
+
+Heavy posting bursts (e.g. hundreds of photos on one holiday day) dominate the spatial methods when each post counts
+once. The posts can be weighted instead, so that bursts count less:
+    - None: each post counts once (weight 1)
+    - "day": each day with posts counts once, i.e. 1 / number of the user's posts on the same day.
+      Also "week" and "month".
+    - "location_day": each location of the user counts once per day, i.e. 1 / number of the user's posts at the same
+      location on the same day. Also "location_week" and "location_month".
+
+The weights are used as sample weights in the DBSCAN clustering (minimum cluster size and cluster sizes, see
+cluster_utils.deduplicate_points), and as weights of the centrographic measures (see centrography.py).
+Posts of the same user at identical locations can be collapsed into one weighted point (see collapse_posts), which
+gives the same weighted results with fewer points.
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+"""
+import numpy as np
+from time_keys import TIME_KEYS
+
+
+def post_weights(posts, scheme=None):
+    """Weights of the posts
+
+    :param posts: post table (columns user, lat, lon and the time keys)
+    :param scheme: weighting scheme: None (each post counts once), a period ("day", "week" or "month": each period of
+                   the user counts once) or "location_" + period (each location of the user counts once per period)
+    :return: numpy array of weights
+    """
+    if scheme is None:
+        return np.ones(len(posts))
+
+    period = scheme[len("location_"):] if scheme.startswith("location_") else scheme
+
+    if period not in TIME_KEYS:
+        raise ValueError("unknown weighting scheme %s (use a period in %s, or location_ + period)"
+                         % (scheme, ", ".join(TIME_KEYS)))
+
+    keys = ["user", period] + (["lat", "lon"] if scheme.startswith("location_") else [])
+
+    # Number of posts in the same group (user and period, and location)
+    groups = posts.groupby(keys, sort=False).ngroup().values
+    counts = np.bincount(groups)
+
+    return 1.0 / counts[groups]
+
+
+def collapse_posts(posts, weights):
+    """Collapse posts of the same user at identical locations into one point, with the sum of the weights. The other
+    columns are taken from the first post at each location.
+
+    :param posts: post table (columns user, lat and lon)
+    :param weights: numpy array of the weight of each post
+    :return: post table of the collapsed points (in the order of first appearance) with a weight column
+    """
+    groups = posts.groupby(["user", "lat", "lon"], sort=False).ngroup().values
+
+    collapsed = posts.loc[~posts.duplicated(["user", "lat", "lon"]).values].copy()
+    collapsed["weight"] = np.bincount(groups, weights=weights, minlength=len(collapsed))
+
+    return collapsed
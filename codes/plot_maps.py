@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+Plot the world maps of origins per country (Figure 2) for all methods.
+
+Cached version of notebooks/plot_maps.ipynb:
+    1. The world regions are re-projected to Robinson, simplified and stored once into a cache file (GeoPackage).
+       The name of the cache file contains a key of the world regions file and the simplification tolerance, so the
+       cache is re-created when either of them changes.
+    2. The number of origins per country of every method and their ranks (used in notebooks/plot_slopegraph.ipynb)
+       are written into the cache folder on each run, and the quantile classes for the maps are computed.
+    3. The maps of all methods are rendered to PNG and SVG in parallel worker processes.
+
+Data:
+    Input: results by country with official visitor statistics (results_by_country_w_visitor_stats.csv,
+           written in notebooks/spearman.ipynb, not included in this repository)
+           World regions with FIPS codes (Global_regions.gpkg, not included in this repository)
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+
+usage:
+    python plot_maps.py n_workers
+
+    n_workers is the number of worker processes for rendering the maps. If not defined, it defaults to 4.
+"""
+import os
+import sys
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from concurrent.futures import ProcessPoolExecutor
+from pyproj import CRS
+from result_store import input_hash, result_key
+
+import matplotlib
+# Render to files only (no interactive plotting)
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.lines import Line2D
+
+#-----------------------
+# Settings
+#-----------------------
+
+# number of worker processes
+try:
+    n_workers = int(sys.argv[1])
+
+except:
+    n_workers = 4
+
+# Results by country with visitor statistics
+data_fp = r"./notebooks/results_by_country_w_visitor_stats.csv"
+
+# World regions
+world_fp = r"./world/Global_regions.gpkg"
+
+# Cached files
+cache_folder = r"./demo_fig/map_cache"
+counts_cache_fp = os.path.join(cache_folder, "origins_per_country.csv")
+ranks_cache_fp = os.path.join(cache_folder, "origins_per_country_ranks.csv")
+
+# Output folder for the maps
+out_folder = r"./demo_fig/maps"
+
+# Simplification tolerance in meters (Robinson projection). Not visible at the size of the figures.
+simplify_tolerance = 5000
+
+# Number of quantile classes
+n_classes = 5
+
+# Map titles (other columns are plotted with the column name as title)
+titles = {"H_maxtimedelta": "Max timedelta (hierarchical)",
+          "H_maxdays": "Max days (hierarchical)",
+          "H_maxmonths": "Max months (hierarchical)",
+          "H_MedianCenters": "Median centers (hierarchical)",
+          "YEAR2014": "Visitor statistics"}
+
+# Define projection Eckert IV from https://spatialreference.org/ref/esri/54012/
+# eckert_IV = CRS.from_proj4("+proj=eck4 +lon_0=0 +x_0=0 +y_0=0 +ellps=WGS84 +datum=WGS84 +units=m +no_defs")
+robinson = CRS.from_proj4("+proj=robin +lon_0=0 +x_0=0 +y_0=0 +datum=WGS84 +units=m +no_defs")
+
+
+#-----------------------------------------------------------------------
+# Functions used in this script
+#-----------------------------------------------------------------------
+def get_world(world_fp, cache_fp, tolerance):
+    """Read the re-projected and simplified world regions from the cache, or create the cache file.
+
+    :param world_fp: file path of the world regions
+    :param cache_fp: file path of the cached world regions
+    :param tolerance: simplification tolerance (meters)
+    :return: Geopandas GeoDataFrame with FIPS codes in Robinson projection
+    """
+    if os.path.isfile(cache_fp):
+        return gpd.read_file(cache_fp)
+
+    world = gpd.read_file(world_fp)
+
+    # Remove antarctica
+    world = world.loc[(world["RegioName"].str.contains("Antartica")) == False]
+
+    # Re-project and simplify
+    world = world[["FIPS", "geometry"]].to_crs(robinson)
+    world["geometry"] = world.simplify(tolerance, preserve_topology=True)
+
+    world.to_file(cache_fp, driver="GPKG")
+
+    return world
+
+
+def quantile_classes(values, k=5):
+    """Quantile classification (same as scheme="quantiles" in geopandas plot, using mapclassify.Quantiles)
+
+    :param values: Pandas Series of values (NaN values are not classified)
+    :param k: number of classes
+    :return: classes (Pandas Series of class numbers, NaN for missing values) and upper bounds of the classes
+    """
+    valid = values.notna().values
+    classes = np.full(len(values), np.nan)
+
+    if not valid.any():
+        return pd.Series(classes, index=values.index), np.array([])
+
+    bins = np.unique(np.percentile(values.values[valid], np.linspace(100.0 / k, 100, k)))
+    classes[valid] = np.searchsorted(bins, values.values[valid], side="left")
+
+    return pd.Series(classes, index=values.index), bins
+
+
+def get_classes(counts, k=5):
+    """Quantile classes of all columns, and legend labels of the classes
+
+    :param counts: Pandas DataFrame of counts per country (FIPS as index)
+    :param k: number of classes
+    :return: Pandas DataFrame of classes, and dictionary of legend labels for each column
+    """
+    classes = pd.DataFrame(index=counts.index)
+    legends = {}
+
+    for column in counts.columns:
+        classes[column], bins = quantile_classes(counts[column], k=k)
+
+        # Legend labels "lower, upper" as in geopandas
+        lower = np.concatenate([[counts[column].min()], bins[:-1]])
+        legends[column] = ["{:.2f}, {:.2f}".format(low, high) for low, high in zip(lower, bins)]
+
+    return classes, legends
+
+
+def init_worker(cache_fp):
+    """Read the cached world regions once in each worker process"""
+    global world
+    world = gpd.read_file(cache_fp)
+
+
+def plot_map(task):
+    """Plot the map of one column (run in a worker process)
+
+    :param task: column name, title, class of each country (Pandas Series, FIPS as index), legend labels and
+                 output folder
+    :return: file paths of the figures
+    """
+    column, title, classes, legend_labels, out_folder = task
+
+    layer = world.merge(classes.rename("class"), left_on="FIPS", right_index=True, how="inner")
+
+    fig, ax = plt.subplots(figsize=(24, 12))
+
+    layer.plot(ax=ax, color="white", facecolor="none", edgecolor="black", linewidth=0.03)
+
+    # Colors of the classes as in geopandas: the classes present are scaled to the colormap
+    cmap = plt.get_cmap("Blues")
+    valid = layer["class"].notna()
+    low, high = (layer.loc[valid, "class"].min(), layer.loc[valid, "class"].max()) if valid.any() else (0, 0)
+    class_colors = cmap((np.arange(len(legend_labels)) - low) / max(high - low, 1))
+
+    handles = [Line2D([0], [0], linestyle="none", marker="o", markersize=10, markeredgewidth=0, markerfacecolor=color)
+               for color in class_colors]
+    labels = list(legend_labels)
+
+    if valid.any():
+        layer[valid].plot(ax=ax, color=class_colors[layer.loc[valid, "class"].astype(int).values],
+                          edgecolor="black", linewidth=0.03)
+
+    # Countries with no origins
+    if (~valid).any():
+        layer[~valid].plot(ax=ax, color="white", edgecolor="red", hatch="////", linewidth=0.03)
+
+        handles.append(Line2D([0], [0], linestyle="none", marker="o", markersize=10, markerfacecolor="white",
+                              markeredgecolor="red"))
+        labels.append("No data")
+
+    ax.legend(handles, labels, loc="lower left", fontsize="20",
+              title="Visitors per country" if column == "YEAR2014" else "Origins per country", title_fontsize="22")
+
+    plt.axis('off')
+    plt.title(title, fontsize=20)
+
+    # Crop the figure
+    ax.set_xlim(-17000000, 17000000)
+    ax.set_ylim(-8880000, 8880000)
+
+    out_fps = [os.path.join(out_folder, "World_map_%s.%s" % (column, extension)) for extension in ("png", "svg")]
+
+    for fp in out_fps:
+        plt.savefig(fp, bbox_inches='tight')
+
+    plt.close('all')
+
+    return out_fps
+
+
+if __name__ == "__main__":
+
+    for folder in (cache_folder, out_folder):
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    # ----------------------------------------------------
+    # Cached world regions and origins per country
+    # ----------------------------------------------------
+    print("Reading world regions..")
+
+    # The cached world regions are keyed by the world regions file and the simplification tolerance
+    world_key = result_key("world_robinson_simplified", {"tolerance": simplify_tolerance}, input_hash(world_fp))
+    world_cache_fp = os.path.join(cache_folder, "world_robinson_simplified_%s.gpkg" % world_key)
+
+    world = get_world(world_fp, world_cache_fp, simplify_tolerance)
+
+    print("Computing origins per country..")
+
+    # NOTE! Namibia (NA) is not a missing value
+    counts = pd.read_csv(data_fp, keep_default_na=False, na_values=[""]).set_index("FIPS")
+
+    # Ranks for the slopegraphs (rank 1: most origins, equal counts share the average rank)
+    ranks = counts.rank(ascending=False)
+
+    counts.to_csv(counts_cache_fp, sep=";")
+    ranks.to_csv(ranks_cache_fp, sep=";")
+
+    # Quantile classes of the countries on the map
+    classes, legends = get_classes(counts.loc[counts.index.isin(world["FIPS"])], k=n_classes)
+
+    # -------------------------------
+    # Render the maps of all methods
+    # -------------------------------
+    print("Rendering %s maps with %s worker processes.." % (len(classes.columns), n_workers))
+
+    tasks = [(column, titles.get(column, column), classes[column], legends[column], out_folder)
+             for column in classes.columns]
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker, initargs=(world_cache_fp,)) as executor:
+        for out_fps in executor.map(plot_map, tasks):
+            print("saved", ", ".join(out_fps))
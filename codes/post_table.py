@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+Compact post table for the hot paths of the origin detection scripts.
+
+Instead of a GeoDataFrame of shapely points, the posts are kept as a struct of numpy arrays
+(a pandas DataFrame with numeric columns only):
+    - user: int32 user code
+    - lat, lon: float64 coordinates (taken from the point geometries)
+    - FIPS, SubReg_2, RegCode: int8/int16 region codes
+    - time: int64 epoch timestamp of time_local (nanoseconds, parsed with an explicit format, see time_keys.py)
+    - day, week, month, year: int32 time keys derived from time (see time_keys.py)
+    - photoid: int64 post identifier
+    - FromKruger: int8 flag for posts within the target area
+
+The original values of the coded columns are stored in codebooks: the code of a value is its position in the
+sorted codebook, so sorting by codes is the same as sorting by the original values. All methods work on the
+codes (integer crosstabs, groupbys and merges), and the original values are decoded only for output.
+
+The region hierarchy (FIPS within SubReg_2 within RegCode) is available as a lookup table of region units
+(see region_hierarchy).
+Point geometries are only built for output (see to_geodataframe).
+
+The post table and codebooks are cached (one .npz file per input in CACHE_FOLDER), and re-used as long as the
+input data does not change (see result_store.input_hash). The timestamps and time keys are then parsed and computed
+only once for all scripts. Posts with malformed local times are reported together and excluded when the post
+table is built.
+
+Users whose posts are all in one region (e.g. one country) get the same result from every origin detection
+method, so the scripts give them the result directly, and leave them out of the expensive stages (clustering,
+crosstabs and tie-breaks, see split_trivial_users).
+
+Subsets of the posts (e.g. the posts of each user in the user's top region, for each method in the hierarchical
+approach) are kept as arrays of row numbers of the shared post table (see subset_rows), instead of copies of
+the posts.
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+"""
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from result_store import input_hash
+from time_keys import TIME_FORMAT, encode_time, parse_times
+
+# Region columns from the largest (continent) to the smallest (country) unit
+REGION_COLUMNS = ["RegCode", "SubReg_2", "FIPS"]
+
+# Folder for the cached post tables
+CACHE_FOLDER = r"./demo_results/post_table_cache"
+
+
+def read_post_table(fp, cache_folder=CACHE_FOLDER, time_format=TIME_FORMAT):
+    """Read social media posts from file into a compact post table. The post table is cached, and read from the
+    cache if the input data (and time format) has not changed.
+
+    :param fp: file path of the input posts (e.g. ./demo_data/fake_input_data.shp)
+    :param cache_folder: folder of the cached post tables (None: no cache)
+    :param time_format: format of the local times (see time_keys.TIME_FORMAT)
+    :return: post table (Pandas DataFrame) and codebooks (dictionary of numpy arrays)
+    """
+    if cache_folder is None:
+        return build_post_table(gpd.read_file(fp), time_format)
+
+    data_hash = input_hash(fp)
+    cache_fp = os.path.join(cache_folder, os.path.splitext(os.path.basename(fp))[0] + "_posts.npz")
+
+    if os.path.isfile(cache_fp):
+        with np.load(cache_fp, allow_pickle=True) as cache:
+            if str(cache["input_hash"]) == data_hash and str(cache["time_format"]) == time_format:
+                print("using cached post table", cache_fp)
+
+                posts = pd.DataFrame({column: cache["posts/" + column] for column in cache["columns"]})
+                codebooks = {key.split("/", 1)[1]: cache[key] for key in cache.files if key.startswith("codebooks/")}
+
+                return posts, codebooks
+
+    posts, codebooks = build_post_table(gpd.read_file(fp), time_format)
+
+    if not os.path.isdir(cache_folder):
+        os.makedirs(cache_folder)
+
+    arrays = {"posts/" + column: posts[column].values for column in posts.columns}
+    arrays.update({"codebooks/" + key: values for key, values in codebooks.items()})
+    np.savez(cache_fp, columns=np.array(posts.columns.tolist()), input_hash=np.array(data_hash),
+             time_format=np.array(time_format), **arrays)
+
+    return posts, codebooks
+
+
+def build_post_table(some, time_format=TIME_FORMAT):
+    """Convert a GeoDataFrame of posts into a compact post table. Posts with malformed local times are reported
+    and excluded.
+
+    :param some: Geopandas GeoDataFrame of posts with point geometries, and columns userid, time_local, photoid,
+                 FromKruger and the region columns
+    :param time_format: format of the local times (see time_keys.TIME_FORMAT)
+    :return: post table (Pandas DataFrame) and codebooks (dictionary of numpy arrays)
+    """
+    # Parse all local times at once, and report the malformed ones together
+    times, malformed = parse_times(some["time_local"].values, time_format)
+
+    if malformed.any():
+        report_malformed_times(some, malformed, time_format)
+
+        some = some[~malformed].reset_index(drop=True)
+        times = times[~malformed]
+
+    codebooks = {}
+    posts = pd.DataFrame(index=pd.RangeIndex(len(some)))
+
+    user_codes, codebooks["userid"] = pd.factorize(some["userid"], sort=True)
+    posts["user"] = user_codes.astype(np.int32)
+
+    # NOTE! in shapely points, x=longitude (east-west), y=latitude (north-south).
+    posts["lat"] = some.geometry.y.values.astype(np.float64)
+    posts["lon"] = some.geometry.x.values.astype(np.float64)
+
+    for column in REGION_COLUMNS:
+        region_codes, codebooks[column] = pd.factorize(some[column], sort=True)
+        posts[column] = region_codes.astype(code_dtype(len(codebooks[column])))
+
+    posts["time"] = times
+
+    for key, values in encode_time(posts["time"].values).items():
+        posts[key] = values
+
+    posts["photoid"] = some["photoid"].values.astype(np.int64)
+    posts["FromKruger"] = some["FromKruger"].values.astype(np.int8)
+
+    codebooks = {key: np.asarray(values) for key, values in codebooks.items()}
+
+    return posts, codebooks
+
+
+def report_malformed_times(some, malformed, time_format, n_examples=10):
+    """Print the number and examples of posts with malformed local times
+
+    :param some: posts (with columns userid and time_local)
+    :param malformed: boolean numpy array of the posts with malformed local times
+    :param time_format: expected format of the local times
+    :param n_examples: number of examples to print
+    """
+    examples = some.loc[malformed, ["userid", "time_local"]].head(n_examples)
+
+    print("NOTE! %s posts (of %s) have malformed time_local values (expected format %s), and are excluded:"
+          % (malformed.sum(), len(some), time_format))
+    print(examples.to_string())
+
+
+def code_dtype(n_values):
+    """Smallest signed integer type for coding n_values different values (-1 is left for missing values)"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_values <= np.iinfo(dtype).max:
+            return dtype
+
+    return np.int64
+
+
+def encode(codebooks, column, values):
+    """Get the codes of original values (-1 for values that are not in the codebook)
+
+    :param codebooks: codebooks of the post table
+    :param column: coded column (e.g. "userid", "FIPS")
+    :param values: original values
+    :return: numpy array of codes
+    """
+    return pd.Index(codebooks[column]).get_indexer(np.asarray(values))
+
+
+def decode(codebooks, column, codes, missing=None):
+    """Get the original values of codes
+
+    :param codebooks: codebooks of the post table
+    :param column: coded column (e.g. "userid", "FIPS")
+    :param codes: codes (e.g. a column of the post table)
+    :param missing: value for missing codes (-1). If None, all codes must be valid.
+    :return: numpy array of original values
+    """
+    codes = np.asarray(codes)
+
+    if missing is None:
+        return codebooks[column][codes]
+
+    values = codebooks[column][np.maximum(codes, 0)].astype(object)
+    values[codes < 0] = missing
+
+    return values
+
+
+def region_hierarchy(posts):
+    """Lookup table of the region hierarchy: the region units are the different combinations of RegCode,
+    SubReg_2 and FIPS codes in the posts.
+
+    NOTE! A country can be split into several sub-regions (e.g. CH in the demo data), so a FIPS code alone does
+    not always identify its sub-region. The region units are nested in all region columns.
+
+    :param posts: post table
+    :return: lookup table (Pandas DataFrame with the region unit code as index, and codes of REGION_COLUMNS),
+             and numpy array of the region unit code of each post
+    """
+    # Combine the region codes into one integer key (sorted by RegCode, SubReg_2 and FIPS). The codes are shifted by
+    # one, so that missing regions (-1) get units of their own instead of aliasing into neighboring keys.
+    sizes = [int(posts[column].max()) + 2 if len(posts) else 1 for column in REGION_COLUMNS]
+    keys = np.zeros(len(posts), dtype=np.int64)
+
+    for column, size in zip(REGION_COLUMNS, sizes):
+        keys = keys * size + posts[column].values.astype(np.int64) + 1
+
+    unit_keys, units = np.unique(keys, return_inverse=True)
+
+    # Split the keys of the units back into region codes
+    hierarchy = pd.DataFrame(index=pd.RangeIndex(len(unit_keys), name="unit"))
+
+    for column, size in reversed(list(zip(REGION_COLUMNS, sizes))):
+        hierarchy[column] = (unit_keys % size - 1).astype(posts[column].dtype)
+        unit_keys = unit_keys // size
+
+    return hierarchy[REGION_COLUMNS], units.astype(code_dtype(len(hierarchy)))
+
+
+def to_geodataframe(posts, codebooks, crs="EPSG:4326"):
+    """Build a GeoDataFrame with decoded columns and point geometries from the post table (only needed for output).
+
+    :param posts: post table
+    :param codebooks: codebooks of the post table
+    :param crs: coordinate reference system of the coordinates (default: WGS84)
+    :return: Geopandas GeoDataFrame
+    """
+    data = pd.DataFrame(index=posts.index)
+
+    for column in posts.columns:
+        if column == "user":
+            data["userid"] = decode(codebooks, "userid", posts[column])
+        elif column in codebooks:
+            data[column] = decode(codebooks, column, posts[column])
+        else:
+            data[column] = posts[column].values
+
+    if "time" in data.columns:
+        data["time_local"] = pd.to_datetime(data.pop("time"))
+
+    return gpd.GeoDataFrame(data, geometry=gpd.points_from_xy(posts["lon"], posts["lat"]), crs=crs)
+
+
+def subset_rows(posts, codebooks, selection, region_column):
+    """Row numbers of the posts of each user in the user's selected region (e.g. the region where the centroid
+    of the user's posts was located).
+
+    :param posts: post table
+    :param codebooks: codebooks of the post table
+    :param selection: Pandas DataFrame with columns userid and region_column (original values, one row per user)
+    :param region_column: region column (e.g. "RegCode", "SubReg_2")
+    :return: numpy array of row numbers of the post table (positions, not index labels)
+    """
+    users = encode(codebooks, "userid", selection["userid"].astype(str))
+    regions = encode(codebooks, region_column, selection[region_column].values.astype(codebooks[region_column].dtype))
+
+    # Selected (user, region) pairs as single integer keys
+    n_regions = len(codebooks[region_column])
+    valid = (users >= 0) & (regions >= 0)
+    selected = users[valid].astype(np.int64) * n_regions + regions[valid]
+
+    keys = posts["user"].values.astype(np.int64) * n_regions + posts[region_column].values
+
+    return np.flatnonzero(np.isin(keys, selected))
+
+
+def single_region_users(posts, region_column):
+    """Users whose posts are all in one region (e.g. one FIPS code)
+
+    :param posts: post table
+    :param region_column: region column (e.g. "FIPS", "SubReg_2", "RegCode")
+    :return: Pandas Series of the region code of each single region user (user code as index)
+    """
+    users = posts["user"].values.astype(np.int64)
+
+    # Region codes are shifted by one, so that missing regions (-1) are a region of their own and do not alias into
+    # the last region of the previous user. Users with missing regions are not single region users.
+    regions = posts[region_column].values.astype(np.int64) + 1
+    n_regions = int(regions.max()) + 1 if len(regions) else 1
+
+    # Distinct (user, region) pairs, sorted by user
+    pairs = np.unique(users * n_regions + regions)
+    pair_users = pairs // n_regions
+    pair_regions = pairs % n_regions - 1
+
+    distinct_users, n_user_regions = np.unique(pair_users, return_counts=True)
+    single = np.repeat(n_user_regions == 1, n_user_regions) & (pair_regions >= 0)
+
+    return pd.Series(pair_regions[single].astype(posts[region_column].dtype), index=pair_users[single])
+
+
+def split_trivial_users(posts, region_column):
+    """Split the users into trivial users (all posts in one region) and the rest, and report how many users and
+    posts are left out of the expensive stages.
+
+    :param posts: post table
+    :param region_column: region column of the results (e.g. "FIPS")
+    :return: Pandas Series of the region code of each trivial user (user code as index), and the post table of the
+             other users
+    """
+    trivial = single_region_users(posts, region_column)
+    is_trivial = np.isin(posts["user"].values, trivial.index.values)
+
+    n_users = posts["user"].nunique()
+    print("Fast path: %s of %s users (%.1f %%) have all posts in one %s, skipping %s of %s posts (%.1f %%)"
+          % (len(trivial), n_users, 100.0 * len(trivial) / max(n_users, 1), region_column, is_trivial.sum(),
+             len(posts), 100.0 * is_trivial.sum() / max(len(posts), 1)))
+
+    return trivial, posts[~is_trivial].copy()
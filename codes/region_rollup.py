@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+Per-user aggregates of the posts in each region unit, rolled up the region hierarchy.
+
+The region hierarchy is strictly nested in region units (see post_table.region_hierarchy), so the aggregates
+needed by the hierarchical methods can be computed once from the posts for each (user, region unit):
+    - number of posts
+    - time of the first and the last post
+    - position of the first post in the input data (for resolving ties in the same order as value_counts)
+    - set of days with posts, as a bitmap over the user's observed date range (see day_bitmaps.py)
+and rolled up to any region level (FIPS, SubReg_2, RegCode) by summing the post counts, taking the min/max
+of the times and the union (bitwise OR) of the day bitmaps. The number of distinct days is the popcount of the
+rolled up bitmap, and distinct weeks and months are folded from its days. At each level of the hierarchical
+approach, only the units within the region selected for the user at the upper level are rolled up, so the raw posts
+are not re-grouped or re-merged.
+
+All users, regions and days are integer codes, and the merges are done with integer keys
+(e.g. user * n_regions + region).
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+"""
+import numpy as np
+import pandas as pd
+from day_bitmaps import build_bitmaps, count_periods, union_bitmaps
+
+
+def aggregate_units(users, units, times, days=None, tags=None):
+    """Aggregates of the posts of each user in each region unit
+
+    :param users: numpy array of user codes (one per post)
+    :param units: numpy array of region unit codes (one per post, see post_table.region_hierarchy)
+    :param times: numpy array of post times (int64, e.g. nanoseconds)
+    :param days: numpy array of day numbers (one per post, see time_keys.day_numbers)
+    :param tags: numpy array of integer tags (one per post, e.g. target area code, -1 for no tag). If given, the
+                 posts of each user and unit are aggregated separately for each tag, so that tagged posts can be
+                 left out of the rollups (see rollup).
+    :return: aggregates (Pandas DataFrame with one row (cell) for each user and unit (and tag): user, unit, n_posts,
+             t_min, t_max, first_post (and tag)), and the day bitmaps of the cells (None if days are not given)
+    """
+    users = np.asarray(users, dtype=np.int64)
+    units = np.asarray(units, dtype=np.int64)
+    times = np.asarray(times, dtype=np.int64)
+
+    n_units = int(units.max()) + 1 if len(units) else 1
+
+    if tags is None:
+        tags = np.full(len(units), -1, dtype=np.int64)
+
+    # Tags are shifted by one, so that -1 (no tag) is coded as 0
+    tags = np.asarray(tags, dtype=np.int64) + 1
+    n_tags = int(tags.max()) + 1 if len(tags) else 1
+
+    cell_keys, cells = np.unique((users * n_units + units) * n_tags + tags, return_inverse=True)
+
+    aggregates = pd.DataFrame({"user": cell_keys // n_tags // n_units, "unit": cell_keys // n_tags % n_units,
+                               "n_posts": np.bincount(cells, minlength=len(cell_keys))})
+
+    # First and last post of each cell: sort posts by cell and time
+    order = np.lexsort((times, cells))
+    sorted_cells = cells[order]
+    starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    ends = np.r_[starts[1:], len(order)] - 1
+
+    aggregates["t_min"] = times[order][starts]
+    aggregates["t_max"] = times[order][ends]
+
+    # Position of the first post of each cell in the input data
+    first_post = np.full(len(cell_keys), len(cells), dtype=np.int64)
+    np.minimum.at(first_post, cells, np.arange(len(cells)))
+    aggregates["first_post"] = first_post
+    aggregates["tag"] = cell_keys % n_tags - 1
+
+    bitmaps = None
+
+    if days is not None:
+        bitmaps = build_bitmaps(cells, days, aggregates["user"].values)
+
+    return aggregates, bitmaps
+
+
+def rollup(aggregates, hierarchy, level, bitmaps=None, periods=("day", "week", "month"), selected=None,
+           upper_level=None, cells=None):
+    """Roll up the aggregates of region units to a region level
+
+    :param aggregates: aggregates of the region units (see aggregate_units)
+    :param hierarchy: region hierarchy lookup table (see post_table.region_hierarchy)
+    :param level: region level (e.g. "RegCode", "SubReg_2", "FIPS")
+    :param bitmaps: day bitmaps of the region units (see aggregate_units)
+    :param periods: periods to count from the rolled up day bitmaps ("day", "week", "month")
+    :param selected: Pandas Series of the selected upper level region code of each user (user code as index).
+                     If given, only the units within the selected region are included.
+    :param upper_level: region level of the selected regions (e.g. "RegCode")
+    :param cells: boolean numpy array of the aggregates (cells) to include (e.g. the visitors of a target area,
+                  without their posts within the area). If None, all cells are included.
+    :return: Pandas DataFrame with one row for each user and region: user, region, n_posts, t_min, t_max,
+             first_post, and the number of distinct periods (e.g. n_day) if bitmaps are given
+    """
+    unit = aggregates["unit"].values
+    user = aggregates["user"].values
+
+    include = np.ones(len(aggregates), dtype=bool) if cells is None else np.asarray(cells, dtype=bool)
+
+    if selected is not None:
+        upper_region = hierarchy[upper_level].values[unit]
+        include = include & (selected.reindex(user).values == upper_region)
+
+    region = hierarchy[level].values[unit].astype(np.int64)
+    n_regions = int(hierarchy[level].max()) + 1
+
+    # Cells with a missing region (-1) are left out, so that they do not alias into the last region of the previous
+    # user in the keys
+    include = include & (region >= 0)
+
+    region_keys, inverse = np.unique(user[include] * n_regions + region[include], return_inverse=True)
+
+    table = pd.DataFrame({"user": region_keys // n_regions, "region": region_keys % n_regions})
+    table["n_posts"] = np.bincount(inverse, weights=aggregates["n_posts"].values[include],
+                                   minlength=len(table)).astype(np.int64)
+    table["t_min"] = pd.Series(aggregates["t_min"].values[include]).groupby(inverse).min().values
+    table["t_max"] = pd.Series(aggregates["t_max"].values[include]).groupby(inverse).max().values
+    table["first_post"] = pd.Series(aggregates["first_post"].values[include]).groupby(inverse).min().values
+
+    # Row of the rolled up table for each cell (-1 for excluded cells)
+    cell_rows = np.full(len(aggregates), -1, dtype=np.int64)
+    cell_rows[include] = inverse
+
+    if bitmaps is not None:
+        # Union of the day bitmaps of the units in each region
+        region_bitmaps = union_bitmaps(bitmaps, cell_rows, len(table))
+
+        for period in periods:
+            table["n_" + period] = count_periods(region_bitmaps, period)
+
+    return table
+
+
+def select_regions(table, value_column, tiebreak_column="n_posts", seed=None):
+    """Select the region with the highest value for each user. If several regions have the highest value
+    (candidates), the candidate with most posts is selected. If there are still several options, the region is
+    selected randomly among these.
+
+    :param table: Pandas DataFrame with columns user, region, the value column and the tiebreak column
+    :param value_column: column of the values (e.g. time difference or number of distinct days)
+    :param tiebreak_column: column of the values for breaking ties (e.g. number of posts)
+    :param seed: seed for the random selection
+    :return: table with boolean columns candidate and selected
+    """
+    table = table.copy()
+
+    max_value = table.groupby("user")[value_column].transform("max")
+    table["candidate"] = (table[value_column] == max_value).values
+
+    # Candidates ordered by user, tiebreak value (descending) and random order
+    candidates = np.flatnonzero(table["candidate"].values)
+    random_order = np.random.default_rng(seed).random(len(candidates))
+    order = np.lexsort((random_order, -table[tiebreak_column].values[candidates], table["user"].values[candidates]))
+
+    ordered = candidates[order]
+    first = np.r_[True, table["user"].values[ordered][1:] != table["user"].values[ordered][:-1]]
+
+    table["selected"] = False
+    table.iloc[ordered[first], table.columns.get_loc("selected")] = True
+
+    return table
+
+
+def select_hierarchically(aggregates, hierarchy, value_column, bitmaps=None, cells=None, seed=None):
+    """Select the region with the highest value for each user at each level of the region hierarchy:
+    continent, sub-region within the selected continent, and country within the selected sub-region.
+    Equal values are resolved with the number of posts, and then randomly (see select_regions).
+
+    :param aggregates: aggregates of the region units (see aggregate_units)
+    :param hierarchy: region hierarchy lookup table
+    :param value_column: "TimeDelta" or number of distinct periods (e.g. "n_day")
+    :param bitmaps: day bitmaps of the region units (needed for the number of distinct periods)
+    :param cells: boolean numpy array of the aggregates to include (see rollup)
+    :param seed: seed for the random selection
+    :return: table of the country level (user, region, value, candidate, selected)
+    """
+    selected = None
+    upper_level = None
+
+    for level in ["RegCode", "SubReg_2", "FIPS"]:
+        # Count only the period of the value column (e.g. "n_day" --> "day")
+        periods = [value_column.replace("n_", "", 1)] if value_column.startswith("n_") else []
+        table = rollup(aggregates, hierarchy, level, bitmaps=bitmaps, periods=periods, selected=selected,
+                       upper_level=upper_level, cells=cells)
+
+        # Time delta between the first and last post in the region (t_max >= t_min, so no absolute value is needed)
+        table["TimeDelta"] = table["t_max"] - table["t_min"]
+
+        table = select_regions(table, value_column, seed=seed)
+
+        selected = table[table["selected"]].set_index("user")["region"]
+        upper_level = level
+
+    return table
+
+
+def rank_regions(table, value_column="n_posts"):
+    """Rank the regions of each user by a value (1: highest value). Equal values are ranked by the first post of the
+    user in the region, as in value_counts of the user's posts in current pandas versions.
+
+    NOTE! The tie order of value_counts depends on the pandas version. The committed demo results were made with a
+    version that ordered equal counts differently, so users with equally many posts in several regions can get
+    another region than in those files (e.g. user 6 gets AU instead of SP with hierarchical maxposts).
+
+    :param table: Pandas DataFrame with columns user, region, first_post and the value column
+    :param value_column: column of the values (e.g. number of posts)
+    :return: numpy array of the rank of each row
+    """
+    order = np.lexsort((table["first_post"].values, -table[value_column].values, table["user"].values))
+
+    sorted_users = table["user"].values[order]
+    starts = np.r_[True, sorted_users[1:] != sorted_users[:-1]]
+    group_start = np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))
+
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order)) - group_start + 1
+
+    return ranks
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+Result store for the origin detection methods.
+
+Each result (origin of each user) is stored under a key computed from:
+    - method name (e.g. "basic_dbscan", "hierarchical_dbscan")
+    - parameters (e.g. eps, min_points, region level, time unit, key of the upper level result)
+    - hash of the input data files
+
+Scripts can skip runs whose key is already in the store, and read results by key (or by method and parameters)
+instead of guessing file names. The store is a folder with one CSV file per result, and an index file
+(index.csv) listing the keys, methods and parameters.
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+"""
+import glob
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+
+STORE_FOLDER = r"./demo_results/result_store"
+
+INDEX_COLUMNS = ["key", "method", "params", "input_hash", "column", "n_users", "created"]
+
+
+def input_hash(fp):
+    """Hash of the input data. For a shapefile, all files of the dataset (.shp, .dbf, .shx, .prj ..) are hashed.
+
+    :param fp: file path of the input data
+    :return: sha1 hex digest
+    """
+    base, extension = os.path.splitext(fp)
+    fps = sorted(glob.glob(base + ".*")) if extension.lower() == ".shp" else [fp]
+
+    sha = hashlib.sha1()
+
+    for path in fps:
+        sha.update(os.path.basename(path).encode("utf-8"))
+
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+
+    return sha.hexdigest()
+
+
+def result_key(method, params, data_hash):
+    """Key of a result.
+
+    :param method: method name (e.g. "basic_dbscan")
+    :param params: dictionary of parameters (values must be JSON serializable)
+    :param data_hash: hash of the input data (see input_hash)
+    :return: key (str)
+    """
+    content = json.dumps({"method": method, "params": params, "input_hash": data_hash}, sort_keys=True)
+
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+def read_index(store_folder=STORE_FOLDER):
+    """Read the index of the result store (empty if there is no store yet)
+
+    :param store_folder: folder of the result store
+    :return: Pandas DataFrame with key as index
+    """
+    fp = os.path.join(store_folder, "index.csv")
+
+    if not os.path.isfile(fp):
+        return pd.DataFrame(columns=INDEX_COLUMNS).set_index("key")
+
+    return pd.read_csv(fp, sep=";", index_col="key", dtype={"key": str, "input_hash": str})
+
+
+def lookup_result(key, store_folder=STORE_FOLDER):
+    """File path of a stored result (None if the key is not in the store)"""
+    fp = os.path.join(store_folder, "%s.csv" % key)
+
+    if key in read_index(store_folder).index and os.path.isfile(fp):
+        return fp
+
+    return None
+
+
+def load_result(key, store_folder=STORE_FOLDER):
+    """Read a stored result
+
+    :param key: key of the result
+    :param store_folder: folder of the result store
+    :return: Pandas DataFrame with userid (str) as index and the result column
+    """
+    fp = lookup_result(key, store_folder)
+
+    if fp is None:
+        raise KeyError("result %s is not in the result store %s" % (key, store_folder))
+
+    # NOTE! Namibia (NA) is not a missing value
+    return pd.read_csv(fp, sep=";", index_col="userid", dtype={"userid": str}, keep_default_na=False, na_values=[""])
+
+
+def store_result(result, method, params, data_hash, store_folder=STORE_FOLDER):
+    """Save a result into the store, and add it to the index
+
+    :param result: Pandas DataFrame with userid as index and one result column (named e.g. "basic_dbscan_500_km")
+    :param method: method name
+    :param params: dictionary of parameters
+    :param data_hash: hash of the input data
+    :param store_folder: folder of the result store
+    :return: key of the result
+    """
+    if not os.path.isdir(store_folder):
+        os.makedirs(store_folder)
+
+    key = result_key(method, params, data_hash)
+
+    result.to_csv(os.path.join(store_folder, "%s.csv" % key), sep=";", index=True, index_label="userid")
+
+    index = read_index(store_folder)
+    index.loc[key, INDEX_COLUMNS[1:]] = [method, json.dumps(params, sort_keys=True), data_hash,
+                                         result.columns[-1], len(result), time.strftime("%Y-%m-%d %H:%M:%S")]
+
+    index["n_users"] = index["n_users"].astype(int)
+    index.to_csv(os.path.join(store_folder, "index.csv"), sep=";", index=True, index_label="key")
+
+    return key
+
+
+def find_results(method=None, data_hash=None, store_folder=STORE_FOLDER, **params):
+    """Find stored results by method, input data and parameters
+
+    Example: find_results("hierarchical_dbscan", region_level="SubReg_2", eps=210)
+
+    :param method: method name (None: all methods)
+    :param data_hash: hash of the input data (None: any input data)
+    :param store_folder: folder of the result store
+    :param params: parameter values that the results must have
+    :return: Pandas DataFrame of matching index rows (key as index), latest result last
+    """
+    index = read_index(store_folder)
+
+    if method is not None:
+        index = index[index["method"] == method]
+
+    if data_hash is not None:
+        index = index[index["input_hash"] == data_hash]
+
+    if params:
+        stored_params = index["params"].apply(json.loads)
+        match = stored_params.apply(lambda x: all(x.get(name) == value for name, value in params.items()))
+        index = index[match.astype(bool)]
+
+    return index.sort_values(by="created", kind="mergesort")
+
+
+def find_result_file(folder, method_name):
+    """Find the latest result file of a method (<method_name>_<number of users>users.csv), for results that are not
+    in the result store
+
+    :param folder: folder of the result files
+    :param method_name: method name of the result (e.g. "hierarchical_dbscan_210km_SubReg_2")
+    :return: path of the result file (None if there is no result file)
+    """
+    fps = [fp for fp in glob.glob(os.path.join(folder, "%s_*users.csv" % method_name))
+           if os.path.basename(fp)[len(method_name) + 1:-len("users.csv")].isdigit()]
+
+    return max(fps, key=os.path.getmtime) if fps else None
@@ -7,19 +7,32 @@ NOTE! This is not an arcpy code. ;)
 
 This srcipt reads in the centroids, and gets users posts from that region /subregion for the hierarchical approach.
 
+The row numbers of the selected posts in the shared post table (see post_table.py) are saved for each method into one
+file (top<region>_subsets.npz). The posts are written into a new shapefile for each method
+(<method>_top<region>_posts.shp) only if export_shapefiles is True (needed by the arcpy script 1b).
+
 input:
-    - Folder containing the centroids with region info (output of script 2b).
+    - Folder containing the centroids with region info (output of script 2a).
 
 Next:
-    - run the hierarchical homelocation script (1b). Repeat for regions and subregions. columns ["RegCode", "SubReg_2"]
+    - run the hierarchical homelocation script (spatial_hierarchical.py, or 1b with export_shapefiles = True).
+      Repeat for regions and subregions. columns ["RegCode", "SubReg_2"]
 
 """
 
 
 import geopandas as gpd
-import pandas as pd
+import numpy as np
 import glob
 import os
+import sys
+
+# Run from the root folder of the repository (modules in ./codes)
+sys.path.append(r"./codes")
+from post_table import read_post_table, subset_rows, to_geodataframe
+from result_store import input_hash
+from target_areas import trip_window
+from time_keys import TIME_FORMAT
 
 
 #-----------------------
@@ -30,11 +43,16 @@ import os
 # input demo_data is in WGS84
 some_fp = r"./demo_data/fake_input_data.shp"
 
-#read file to GDB
-some = gpd.read_file(some_fp)
+#read file into a compact post table
+some, codebooks = read_post_table(some_fp)
+
+# Exclude also the posts within +-trip_days days of the visit to the target area (None: only the target area posts)
+trip_days = None
 
-# EXCLUDE POSTS WITHIN KRUGER NATIONAL PARK (ASSUME NO ONE LIVES THERE..even though in fact people do live there..)
-some = some[some["FromKruger"] == 0]
+excluded = some["FromKruger"].values == 1
+
+if trip_days is not None:
+    excluded = trip_window(some["user"].values, some["time"].values, excluded, trip_days)
 
 #folder = r"./demo_results/spatial_temp"
 folder = r"./demo_results/spatial_temp/hierarchical_reg"
@@ -48,10 +66,16 @@ files = glob.glob(os.path.join(folder, "*WGS84_Regioninfo.shp"))
 # RegCode: continental regions, SubReg_2: sub-continental regions, FIPS: admin unit code (most often, a country)
 hierarchyregion = "SubReg_2""RegCode"#"FIPS" # ##  #
 
+# Write also the posts of each method into a shapefile (input of the arcpy script 1b_spatial_arcpy_hierarchical.py)
+export_shapefiles = False
+
 #---------------------------------------------
 # Get posting history from the detected region
 # ---------------------------------------------
 
+# Row numbers of the selected posts of each method
+subsets = {}
+
 for input_file in files:
     data = gpd.read_file(input_file)
     method = os.path.basename(input_file).split("_")[0]
@@ -60,12 +84,27 @@ for input_file in files:
     # Select only userid and info of the region where the detected centroid was located:
     data = data[["userid", hierarchyregion]]
 
-    #Inner join between full demo_data and top continent per each user
-    joined = pd.merge(some, data, how="inner", on=["userid", hierarchyregion])
-    print("Joined: ", method, len(joined), "records")
+    #Posts of each user in the top region (same as an inner join between full demo_data and top region per user)
+    rows = subset_rows(some, codebooks, data, hierarchyregion)
+
+    # EXCLUDE POSTS WITHIN KRUGER NATIONAL PARK (ASSUME NO ONE LIVES THERE..even though in fact people do live there..)
+    rows = rows[~excluded[rows]]
+    print("Joined: ", method, len(rows), "records")
+
+    subsets[method] = rows
+
+    if export_shapefiles:
+        # Points to file (these will be used as input in the next iteration of the hierarchical approach in script 1b)
+        joined = to_geodataframe(some.iloc[rows], codebooks)
+        joined["time_local"] = joined["time_local"].dt.strftime(TIME_FORMAT)
+
+        outfilename = os.path.join(out_folder, method + "_top" + hierarchyregion + "_posts.shp")
+        joined.to_file(outfilename)
 
-    # Points to file (these will be used as input in the next iteration of the hierarchical approach in script 1b)
-    outfilename = os.path.join(out_folder, method + "_top" + hierarchyregion + "_posts.shp")
-    joined.to_file(outfilename)
+# Row numbers to file (these will be used as input in the next iteration of the hierarchical approach)
+# The hash of the input data is saved to check that the row numbers match the post table.
+outfilename = os.path.join(out_folder, "top" + hierarchyregion + "_subsets.npz")
+np.savez(outfilename, input_hash=np.array(input_hash(some_fp)), **subsets)
+print("Saved subsets of", len(subsets), "methods:", outfilename)
 
 
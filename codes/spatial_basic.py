@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+SOMEORIGINS - SPATIAL - BASIC (without arcpy)
+
+Script for identifying the most probable home country for Instagram users that have visited Kruger national park, SA.
+Same centrographic methods as in spatial_arcpy/1a_spatial_arcpy_basic.py, computed with numpy and pyproj:
+    - Project the posts to World Azimuthal Equidistant (ESRI:54032) in one batch. The projected coordinates are
+      cached (projected_posts.npz), and re-used as long as the input data does not change.
+    - For each user's posts, calculate the
+        - Standard deviational ellipse --> center point of ellipse
+        - Standard distance circle --> center point of circle
+        - Mean center
+        - Median center
+        - (optional) Mean center of 3D unit vectors, without projection distortion
+    - Transform the centers of all users back to WGS84 in one batch
+
+    Posts within the trip window around the visit to the target area can be excluded (trip_days) or down-weighted
+    (trip_days and trip_weight) in all centers, see target_areas.py.
+
+    Posting bursts can be down-weighted with post_weighting (e.g. each day with posts counts once, see
+    period_weights.py). The weighted posts of a user at identical locations are then collapsed into one point.
+
+    The ellipses and circles are computed as attributes (center, standard distances, rotation) from grouped
+    moments of the coordinates. Polygons are only written if write_polygons is set.
+
+Outputs:
+    - 1 point layer in WGS84 for each method (same file names as from the arcpy script)
+    - (optional) 2 x polygon layers (SD Ellipses & SD Circles)
+
+Next steps:
+    - spatial_arcpy/2a_join_region_info_to_centroids.py (joins region info to centroids)
+    - spatial_arcpy/3_shp_to_csv.py (prepare result file with detected origin countries)
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+
+usage:
+    python spatial_basic.py
+"""
+import os
+from centrography import centers_to_wgs84, mean_centers, median_centers, projected_coordinates, \
+    standard_deviational_ellipses, standard_distances, unit_vector_mean_centers
+from period_weights import collapse_posts, post_weights
+from post_table import decode, read_post_table, to_geodataframe
+from result_store import input_hash
+from target_areas import exclude_target_area, trip_weights
+
+#-----------------------
+# Settings
+#-----------------------
+
+# Compute also the mean center of 3D unit vectors
+unit_vector_mean_center = False
+
+# Write the polygons of the standard deviational ellipses and standard distance circles (not needed for the centers)
+write_polygons = False
+
+# Exclude also the posts within +-trip_days days of the visit to the target area (None: only the target area posts)
+trip_days = None
+
+# Weight of the posts within the trip window (None: exclude the posts). Used only if trip_days is set.
+trip_weight = None
+
+# Weighting of the posts (None: each post counts once, "day": each day with posts counts once,
+# "location_day": each location counts once per day). See period_weights.py.
+post_weighting = None
+
+#------------------------------
+# Inputs & outputs
+#------------------------------
+
+# input demo_data is in WGS84
+fp = r"./demo_data/fake_input_data.shp"
+
+#output folder
+out_folder = r"./demo_results/spatial_temp"
+
+# cache file for projected coordinates of the posts
+projected_fp = os.path.join(out_folder, "projected_posts.npz")
+
+if not os.path.isdir(out_folder):
+    os.makedirs(out_folder)
+
+#---------------------
+# Read and project input demo_data
+#---------------------
+print("Reading demo_data..")
+some, codebooks = read_post_table(fp)
+
+# Projected coordinates of all posts (cached)
+some["x"], some["y"] = projected_coordinates(some, projected_fp, input_hash(fp))
+
+in_area = some["FromKruger"].values == 1
+
+if trip_days is not None and trip_weight is not None:
+    # Down-weight the posts within the trip window
+    some["weight"] = trip_weights(some, in_area, trip_days, trip_weight)
+    some = exclude_target_area(some, in_area)
+else:
+    # EXCLUDE POSTS WITHIN KRUGER NATIONAL PARK (ASSUME NO ONE LIVES THERE..even though in fact people do live there..)
+    some = exclude_target_area(some, in_area, trip_days)
+    some["weight"] = 1.0
+
+if post_weighting is not None:
+    # Weights of the posts, and one point for each location of each user
+    some = collapse_posts(some, some["weight"].values * post_weights(some, post_weighting))
+
+    print("Number of weighted points:", len(some))
+
+print("Number of posts:", len(some))
+print("Number of users:", some.user.nunique(), "\n")
+
+#-----------------
+# Centers
+#-----------------
+centers = {}
+
+print("Creating Ellipses...")
+ellipses = standard_deviational_ellipses(some["user"].values, some["x"].values, some["y"].values,
+                                         weights=some["weight"].values, geometry=write_polygons)
+centers["EllipseCentroids"] = centers_to_wgs84(ellipses[["CenterX", "CenterY"]])
+
+print("Creating Standard Distance Circles...")
+circles = standard_distances(some["user"].values, some["x"].values, some["y"].values, weights=some["weight"].values,
+                             geometry=write_polygons)
+centers["CircleCentroids"] = centers_to_wgs84(circles[["CenterX", "CenterY"]])
+
+if write_polygons:
+    for polygons, name in ((ellipses, "SDEllipses.shp"), (circles, "SDCircles.shp")):
+        polygons = polygons.reset_index()
+        polygons["userid"] = decode(codebooks, "userid", polygons.pop("user"))
+        polygons.to_file(os.path.join(out_folder, name))
+
+print("Calculating Mean Center...")
+centers["MeanCenters"] = centers_to_wgs84(mean_centers(some["user"].values, some["x"].values, some["y"].values,
+                                                      weights=some["weight"].values))
+
+print("Calculating Median Center...")
+centers["MedianCenters"] = centers_to_wgs84(median_centers(some["user"].values, some["x"].values, some["y"].values,
+                                                          weights=some["weight"].values))
+
+if unit_vector_mean_center:
+    print("Calculating Mean Center of unit vectors...")
+    centers["UnitVectorMeanCenters"] = unit_vector_mean_centers(some["user"].values, some["lat"].values,
+                                                                some["lon"].values, weights=some["weight"].values)
+
+#-----------------
+# Write centers to file
+#-----------------
+for method, method_centers in centers.items():
+    out_fp = os.path.join(out_folder, method + "_WGS84.shp")
+
+    to_geodataframe(method_centers.reset_index(), codebooks).to_file(out_fp)
+    print(method, "ok!", out_fp)
+
+# DONE
+print("DONE! Results in folder: ", out_folder)
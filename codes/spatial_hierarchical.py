@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+SOMEORIGINS - SPATIAL - HIERARCHICAL (without arcpy)
+
+Same as spatial_arcpy/1b_spatial_arcpy_hierarchical.py, computed with numpy and pyproj (see centrography.py).
+
+Inputs:
+    - Row numbers of the posts FROM THE REGION where the detected origin was located, for each method
+      (top<region>_subsets.npz). The rows refer to the shared post table of the input data.
+    - inputs have been generated using
+        spatial_basic.py,
+        2a_join_region_info_to_centroids.py and
+        2b_get_posts_from_top_region.py
+
+For the posts of each user in the subset of each method, calculate the centrographic measure of the method:
+    - Standard deviational ellipse --> center point of ellipse
+    - Standard distance circle --> center point of circle
+    - Mean center
+    - Median center
+
+Outputs:
+    - 1 point layer in WGS84 for each method
+
+Next steps:
+    - 2a_join_region_info_to_centroids.py and
+    - 2b_get_posts_from_top_region.py
+    - [Repeat scrits spatial_hierarchical.py, 2a, 2b for sub-regions.]
+    - 3_shp_to_csv.py
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+
+usage:
+    python spatial_hierarchical.py
+"""
+import os
+import numpy as np
+from centrography import centers_to_wgs84, mean_centers, median_centers, projected_coordinates, \
+    standard_deviational_ellipses, standard_distances
+from period_weights import post_weights
+from post_table import read_post_table, to_geodataframe
+from result_store import input_hash
+
+#-----------------------
+# Settings
+#-----------------------
+
+# Weighting of the posts (None: each post counts once, "day": each day with posts counts once,
+# "location_day": each location counts once per day). Use the same weighting as in spatial_basic.py.
+post_weighting = None
+
+#------------------------------
+# Inputs & outputs
+#------------------------------
+
+# input demo_data is in WGS84
+fp = r"./demo_data/fake_input_data.shp"
+
+# cache file for projected coordinates of the posts (see spatial_basic.py)
+projected_fp = r"./demo_results/spatial_temp/projected_posts.npz"
+
+# Subsets of posts in the target region for each method (output of 2b_get_posts_from_top_region.py)
+#subset_fp = r"./demo_results/spatial_temp/hierarchical_reg/topRegCode_subsets.npz"
+subset_fp = r"./demo_results/spatial_temp/hierarchical_subreg/topSubReg_2_subsets.npz"
+
+#Result folder
+#result_folder = r"./demo_results/spatial_temp/hierarchical_reg"
+result_folder = r"./demo_results/spatial_temp/hierarchical_subreg"
+
+# Centrographic measure of each method
+measures = {"EllipseCentroids": standard_deviational_ellipses,
+            "CircleCentroids": standard_distances,
+            "MeanCenters": mean_centers,
+            "MedianCenters": median_centers}
+
+#---------------------
+# Read input demo_data and subsets
+#---------------------
+print("Reading demo_data..")
+data_hash = input_hash(fp)
+
+some, codebooks = read_post_table(fp)
+x, y = projected_coordinates(some, projected_fp, data_hash)
+
+subsets = np.load(subset_fp)
+
+if str(subsets["input_hash"]) != data_hash:
+    raise ValueError("subsets in %s were not created from the input data %s" % (subset_fp, fp))
+
+# Level of the subsets (e.g. topSubReg_2)
+level = os.path.basename(subset_fp).replace("_subsets.npz", "")
+
+#---------------------
+# Centers in the subsets
+#---------------------
+for method in subsets.files:
+    if method == "input_hash":
+        continue
+
+    rows = subsets[method]
+    users = some["user"].values[rows]
+
+    print("Calculating", method, "for", len(rows), "posts of", len(np.unique(users)), "users...")
+    # Weights among the posts of the subset (None: each post counts once)
+    weights = None if post_weighting is None else post_weights(some.iloc[rows], post_weighting)
+
+    centers = centers_to_wgs84(measures[method](users, x[rows], y[rows], weights=weights)[["CenterX", "CenterY"]])
+
+    outfile = os.path.join(result_folder, "%s_%s_WGS84.shp" % (method, level))
+    to_geodataframe(centers.reset_index(), codebooks).to_file(outfile)
+
+    print("DONE!", method, "Restults in folder: ", result_folder)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+Target areas (e.g. national parks or event venues) of the origin detection.
+
+The scripts for a single target area use the FromKruger flag of the input data: the visitors are the users in the
+data, and their posts within the target area are excluded. For many target areas, each post is tagged with the
+target area it is located in, with one indexed point-in-polygon pass (spatial join) over the whole posting history:
+    - the visitors of an area are the users with at least one post in the area
+    - the posts of the visitors within the area are excluded, as the Kruger posts in the single area scripts
+NOTE! If target areas overlap, a post is tagged with the first area (in the order of the target area file).
+
+Posts from the rest of the trip to the target area (e.g. elsewhere in South Africa) can be excluded or down-weighted
+with a trip window: the visit of each user lasts from the first to the last post within the target area, and the
+window extends it by a number of days before and after the visit (see trip_window).
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+"""
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+
+def read_target_areas(fp, id_column):
+    """Read target area polygons
+
+    :param fp: file path of the target area polygons
+    :param id_column: column with the identifier of each area
+    :return: Geopandas GeoDataFrame of the target areas (in WGS84), and numpy array of area identifiers (the code of
+             an area is its position in the array)
+    """
+    areas = gpd.read_file(fp).to_crs("EPSG:4326").reset_index(drop=True)
+
+    if areas[id_column].duplicated().any():
+        raise ValueError("target area identifiers in column %s are not unique" % id_column)
+
+    return areas, areas[id_column].values
+
+
+def tag_posts(posts, areas):
+    """Target area of each post, with a spatial join of the post locations and the target area polygons (using the
+    spatial index of the areas).
+
+    :param posts: post table (columns lat, lon in WGS84)
+    :param areas: Geopandas GeoDataFrame of the target areas (see read_target_areas)
+    :return: numpy array of the target area code of each post (-1: not in any target area)
+    """
+    # NOTE! in shapely points, x=longitude (east-west), y=latitude (north-south).
+    points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(posts["lon"].values, posts["lat"].values), crs="EPSG:4326")
+
+    joined = gpd.sjoin(points, areas[["geometry"]], how="inner", predicate="within")
+
+    # First area of each post (if the areas overlap)
+    first_area = pd.Series(joined["index_right"].values, index=joined.index).groupby(level=0).min()
+
+    tags = np.full(len(posts), -1, dtype=np.int32)
+    tags[first_area.index.values] = first_area.values
+
+    return tags
+
+
+def visitor_sets(users, tags, n_areas):
+    """Users that have posts in each target area
+
+    :param users: numpy array of the user code of each post
+    :param tags: numpy array of the target area code of each post (see tag_posts)
+    :param n_areas: number of target areas
+    :return: list of numpy arrays of user codes (sorted), one for each target area
+    """
+    tagged = tags >= 0
+    n_users = int(users.max()) + 1 if len(users) else 1
+
+    # Distinct (area, user) pairs as single integer keys, sorted by area
+    pairs = np.unique(tags[tagged].astype(np.int64) * n_users + users[tagged])
+
+    areas = pairs // n_users
+    visitors = pairs % n_users
+    bounds = np.searchsorted(areas, np.arange(n_areas + 1))
+
+    return [visitors[bounds[area]:bounds[area + 1]] for area in range(n_areas)]
+
+
+def trip_window(users, times, in_area, days_before, days_after=None):
+    """Posts within the trip window of each user: from days_before days before the first post within the target
+    area, to days_after days after the last post within the target area. Users without posts within the target area
+    have no trip window.
+
+    The posts are sorted once by user and time, and the window limits are found with a binary search (searchsorted)
+    over the sorted timestamps of all users at once.
+
+    :param users: numpy array of the user code of each post
+    :param times: numpy array of the time of each post (int64 nanoseconds)
+    :param in_area: boolean numpy array of the posts within the target area
+    :param days_before: number of days before the visit
+    :param days_after: number of days after the visit (default: same as days_before)
+    :return: boolean numpy array of the posts within the trip window (including the posts within the target area)
+    """
+    if days_after is None:
+        days_after = days_before
+
+    users = np.asarray(users, dtype=np.int64)
+    in_area = np.asarray(in_area, dtype=bool)
+
+    # Times in seconds from the first post, so that (user, time) fits into one int64 key
+    seconds = np.asarray(times, dtype=np.int64) // 10 ** 9
+    seconds = seconds - seconds.min() if len(seconds) else seconds
+    span = int(seconds.max()) + 1 if len(seconds) else 1
+
+    order = np.lexsort((seconds, users))
+    sorted_keys = users[order] * span + seconds[order]
+
+    # Visit of each user (first and last post within the target area)
+    visitors, visitor_index = np.unique(users[in_area], return_inverse=True)
+    visit_start = np.full(len(visitors), span, dtype=np.int64)
+    visit_end = np.full(len(visitors), -1, dtype=np.int64)
+    np.minimum.at(visit_start, visitor_index, seconds[in_area])
+    np.maximum.at(visit_end, visitor_index, seconds[in_area])
+
+    # Window limits as keys (clipped to the user's time range), and their positions among the sorted posts
+    window_start = visitors * span + np.maximum(visit_start - days_before * 86400, 0)
+    window_end = visitors * span + np.minimum(visit_end + days_after * 86400, span - 1)
+
+    first = np.searchsorted(sorted_keys, window_start, side="left")
+    last = np.searchsorted(sorted_keys, window_end, side="right")
+
+    # Mark the ranges of sorted posts within the windows
+    counts = np.zeros(len(order) + 1, dtype=np.int64)
+    np.add.at(counts, first, 1)
+    np.add.at(counts, last, -1)
+
+    within = np.zeros(len(order), dtype=bool)
+    within[order] = np.cumsum(counts[:-1]) > 0
+
+    return within
+
+
+def exclude_target_area(posts, in_area, trip_days=None):
+    """Exclude the posts within the target area (and within the trip window, if trip_days is given)
+
+    :param posts: post table (columns user and time)
+    :param in_area: boolean numpy array of the posts within the target area (e.g. FromKruger == 1)
+    :param trip_days: number of days before and after the visit to exclude (None: only the target area)
+    :return: post table without the excluded posts
+    """
+    excluded = np.asarray(in_area, dtype=bool)
+
+    if trip_days is not None:
+        excluded = trip_window(posts["user"].values, posts["time"].values, excluded, trip_days)
+
+        print("Excluding %s posts within the target area and %s other posts within +-%s days of the visit"
+              % (np.asarray(in_area, dtype=bool).sum(), excluded.sum() - np.asarray(in_area, dtype=bool).sum(),
+                 trip_days))
+
+    return posts[~excluded]
+
+
+def trip_weights(posts, in_area, trip_days, weight):
+    """Weights of the posts for down-weighting (instead of excluding) the posts within the trip window. The posts
+    within the target area get weight 0.
+
+    :param posts: post table (columns user and time)
+    :param in_area: boolean numpy array of the posts within the target area
+    :param trip_days: number of days before and after the visit
+    :param weight: weight of the posts within the trip window (e.g. 0.5)
+    :return: numpy array of weights (1.0 for the posts outside the trip window)
+    """
+    in_area = np.asarray(in_area, dtype=bool)
+    within = trip_window(posts["user"].values, posts["time"].values, in_area, trip_days)
+
+    weights = np.where(within, weight, 1.0)
+    weights[in_area] = 0.0
+
+    return weights
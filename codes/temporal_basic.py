@@ -15,6 +15,9 @@ The script calculates following things:
         - For each user, calculate the [continent, subregion and] country with maximum number of time units
         (months / weeks / days) with social media posts
         - Save results into csv (month, week and day results per user and per region).
+
+    The distinct months / weeks / days are counted from bitmaps of the days with posts of each user in each
+    country (see region_rollup.py and day_bitmaps.py).
 Data:
     Input: Mobility history of social media users who have visited a spesific area.
     Data is required to have region info in separate columns (generated with preprocess_somedata.py)
@@ -26,26 +29,28 @@ License:
     Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
 """
 
-import geopandas as gpd
 import pandas as pd
 import random
 import os
+from post_table import decode, read_post_table, region_hierarchy, split_trivial_users
+from region_rollup import aggregate_units, rollup
+from target_areas import exclude_target_area
 
 
 #functions
 def crosstabulate_users_posts_per_region(df, region_column):
     """Crosstabulate users posts per region"""
 
-    post_count_matrix = pd.crosstab(df.userid, df[region_column])
+    post_count_matrix = pd.crosstab(df.user, df[region_column])
     return post_count_matrix
 
 
-def get_maxtimedelta_region(df, region_column):
+def get_maxtimedelta_region(df, region_column, trivial_users=None):
     """ Calculate max time delta in each region for each user"""
 
     # Crosstabulate min and max timestamp for each user in each country (if they'be been there)
-    crossTmin = pd.crosstab(df.userid, df[region_column], values=df.time_local, aggfunc=pd.Series.min)
-    crossTmax = pd.crosstab(df.userid, df[region_column], values=df.time_local, aggfunc=pd.Series.max)
+    crossTmin = pd.crosstab(df.user, df[region_column], values=df.time_local, aggfunc=pd.Series.min)
+    crossTmax = pd.crosstab(df.user, df[region_column], values=df.time_local, aggfunc=pd.Series.max)
 
     # Calculate time difference for each user in each country. Returns a matrix of time deltas
     #NOTE: TAKING THE ABSOLUTE VALUE OF TIME DELTA
@@ -58,7 +63,8 @@ def get_maxtimedelta_region(df, region_column):
     #timedelta_matrix[regioncol] = timedelta_matrix.idxmax(axis=1)
 
     # Use another function to detect if user has posted equally as often from many countries, add related columns
-    timedelta_matrix = list_maxtime_countries(df, timedelta_matrix, region_column, timecol="TimeDelta")
+    timedelta_matrix = list_maxtime_countries(df, timedelta_matrix, region_column, timecol="TimeDelta",
+                                              trivial_users=trivial_users)
 
     # convert max time diff to format: days
     timedelta_matrix[timecol] = timedelta_matrix[timecol].apply(lambda x: x.days)
@@ -66,12 +72,16 @@ def get_maxtimedelta_region(df, region_column):
     return timedelta_matrix
 
 
-def get_maxtime_region(df, region_column, timecol, truncate=True):
-    """Cross-tabulate number of unique time units (days, months, weeks) in each country, and get country or 
-    list of countries where this value is highest into a new column"""
-    
-    #print("Crosstabulating number of unique %ss for each users within each region..." % timecol)
-    time_matrix = pd.crosstab(df.userid, df[region_column], values=df[timecol], aggfunc=pd.Series.nunique)
+def get_maxtime_region(df, region_column, timecol, region_periods, truncate=True, trivial_users=None):
+    """Tabulate number of unique time units (days, months, weeks) in each country, and get country or
+    list of countries where this value is highest into a new column
+
+    :param region_periods: number of distinct periods of each user in each region (see region_rollup.rollup)
+    """
+
+    #print("Tabulating number of unique %ss for each users within each region..." % timecol)
+    time_matrix = region_periods.pivot(index="user", columns="region", values="n_" + timecol)
+    time_matrix.columns.name = region_column
 
     # Generate column names
     most_frequent_region = "%s_withMax%s" % (region_column, timecol)
@@ -88,14 +98,18 @@ def get_maxtime_region(df, region_column, timecol, truncate=True):
         time_matrix = time_matrix[[most_frequent_region, max_time_units]]
 
     #Use another function to detect if user has posted equally as often from many countries, add related columns
-    time_matrix = list_maxtime_countries(df, time_matrix, region_column, timecol)
+    time_matrix = list_maxtime_countries(df, time_matrix, region_column, timecol, trivial_users=trivial_users)
 
     return time_matrix
 
 
-def list_maxtime_countries(df, time_matrix, region_column, timecol):
+def list_maxtime_countries(df, time_matrix, region_column, timecol, trivial_users=None):
     """Count how many countries have the max number of time units and 
-    List region codes of those regions which have equally many time units"""
+    List region codes of those regions which have equally many time units
+
+    :param trivial_users: region code of each user with all posts in one region (user code as index). These users
+                          have only one region with the max number of time units, and are not checked row by row.
+    """
 
     max_t_column = "MAX%ss" % (timecol)
     count_column = "N_of_%s_withMax%s" % (region_column, timecol)
@@ -104,15 +118,28 @@ def list_maxtime_countries(df, time_matrix, region_column, timecol):
     # Check how many potential values there are (how many columns in time matrix with country codes)
     datarange = df[region_column].nunique()
 
+    # Fast path: users with all posts in one region
+    if trivial_users is None:
+        trivial_users = pd.Series(dtype=int)
+
+    trivial = time_matrix.index.isin(trivial_users.index)
+    time_matrix.loc[trivial, count_column] = 1
+
     #Count how many countries have the max number of time units
-    for i, row, in time_matrix.iterrows():
+    for i, row, in time_matrix[~trivial].iterrows():
         time_matrix.loc[i, count_column] = (row[:datarange] == row[max_t_column]).sum()
 
     # List Top Regions (check those instances where the number of time units equals to the max time unit) row by row
     # (x.index is a series of the true values in each row!)
     # In other words; check the value range where country info is located using demo_data range,
     # and check which items are equal to the max time units
-    time_matrix["HomeLocList"] = time_matrix.apply(lambda x: x.index[:datarange][x[:datarange] == x[max_t_column]].tolist(), axis=1)
+    home_loc_lists = pd.Series([[int(region)] for region in trivial_users.reindex(time_matrix.index[trivial])],
+                               index=time_matrix.index[trivial], dtype=object)
+
+    for i, x in time_matrix[~trivial].iterrows():
+        home_loc_lists[i] = x.index[:datarange][x[:datarange] == x[max_t_column]].tolist()
+
+    time_matrix["HomeLocList"] = home_loc_lists.reindex(time_matrix.index)
 
     return time_matrix
 
@@ -147,11 +174,67 @@ def apply_maxposts_to_candidate_countries(candidates):
     home_loc = [key for key, value in candidates.items() if value == max(candidates.values())]
 
     if len(home_loc) == 1:
-        return str(home_loc[0])
+        return home_loc[0]
     else:
         # RANDOM COUNTRY OUT OF THE CANDIDATES (these countries have equal number of maxtime, and maxposts)
         return random.choice(home_loc)
-    
+
+
+def resolve_candidates(time_matrix, trivial_users, postcountDF, result_column):
+    """Add the post counts of the candidate regions (homeLocDict) and the resulting region of each user. Users with
+    all posts in one region get their only region directly, the other users are resolved with the number of posts
+    (and randomly, see apply_maxposts_to_candidate_countries).
+
+    :param time_matrix: Pandas DataFrame with user codes as index, and column HomeLocList
+    :param trivial_users: region code of each user with all posts in one region (user code as index)
+    :param postcountDF: number of posts of each user in each region
+    :param result_column: column name of the result
+    :return: time_matrix with columns userid, homeLocDict and the result column
+    """
+    time_matrix["userid"] = time_matrix.index
+    trivial = time_matrix.index.isin(trivial_users.index)
+
+    home_loc_dicts = pd.Series(index=time_matrix.index, dtype=object)
+    results = pd.Series(index=time_matrix.index, dtype=object)
+
+    for user in time_matrix.index[trivial]:
+        region = int(trivial_users[user])
+        home_loc_dicts[user] = {region: postcountDF.loc[user, region]}
+        results[user] = region
+
+    for user, countrylist in time_matrix.loc[~trivial, "HomeLocList"].items():
+        home_loc_dicts[user] = get_regional_post_counts(user, countrylist, postcountDF)
+        results[user] = apply_maxposts_to_candidate_countries(home_loc_dicts[user])
+
+    time_matrix["homeLocDict"] = home_loc_dicts
+    time_matrix[result_column] = results
+
+    return time_matrix
+
+
+def decode_output(results, codebooks, region_column, result_column):
+    """Decode user ids and region codes of the results for output
+
+    :param results: Pandas DataFrame with user codes as index, region codes as column names, and columns HomeLocList,
+                    homeLocDict and the result column
+    :param codebooks: codebooks of the post table
+    :param region_column: region column (e.g. "FIPS")
+    :param result_column: column with the region code of the result
+    :return: Pandas DataFrame with userid as index
+    """
+    results = results.rename(columns=dict(enumerate(codebooks[region_column].tolist())))
+    results.index = pd.Index(decode(codebooks, "userid", results.index), name="userid")
+
+    if "userid" in results.columns:
+        results["userid"] = results.index
+
+    results["HomeLocList"] = results["HomeLocList"].apply(lambda x: decode(codebooks, region_column, x).tolist())
+    results["homeLocDict"] = results["homeLocDict"].apply(
+        lambda x: dict(zip(decode(codebooks, region_column, list(x.keys())).tolist(), x.values())))
+    results[result_column] = decode(codebooks, region_column, results[result_column].astype(int))
+
+    return results
+
 #-------------------------
 # Result folder
 #------------------------
@@ -165,43 +248,50 @@ folder = r"./demo_results"
 #each point is assigned to the nearest region if found not on land. Also duplicates have been removed
 fp = r"./demo_data/fake_input_data.shp"
 
-#read demo_data with geopandas
-some = gpd.read_file(fp)
+# Read demo_data into a compact post table: integer codes for users and regions.
+# Original user ids and region values are in the codebooks, and are decoded only for output.
+some, codebooks = read_post_table(fp)
 
 # Print layer info
 print("Number of posts:", len(some))
-print("Number of users:", some.userid.nunique())
+print("Number of users:", some.user.nunique())
+
+# Exclude also the posts within +-trip_days days of the visit to the target area (None: only the target area posts)
+trip_days = None
+
+# Suffix of the result names if the posts within the trip window are also excluded
+trip_suffix = "" if trip_days is None else "_trip_%sd" % trip_days
 
-# Continue only with posts outside Kruger NP borders
-some = some[some["FromKruger"]==0]
+# Continue only with posts outside Kruger NP borders (and the rest of the trip, if trip_days is set)
+some = exclude_target_area(some, some["FromKruger"].values == 1, trip_days)
 
 # Print layer info
 print("Number of posts without Kruger posts:", len(some))
-print("Number of users without Kruger posts:", some.userid.nunique())
+print("Number of users without Kruger posts:", some.user.nunique())
 
 #Crosstabulate number of posts per country (needed if unambiquous result from temporal method)
 users_posts_per_country = crosstabulate_users_posts_per_region(some, 'FIPS')
 
+# Fast path: users with all posts in one country get it directly, without checking the candidates row by row
+trivial_users, _ = split_trivial_users(some, 'FIPS')
+
 #-----------------------------------------------
 # MAX TIME DIFFERENCE WITHIN REGION
 #-----------------------------------------------
-method_name = "basic_maxtimedelta"
+method_name = "basic_maxtimedelta" + trip_suffix
 
 #convert to datetime
-some["time_local"] = pd.to_datetime(some["time_local"])
+some["time_local"] = pd.to_datetime(some["time"])
 
 #Crosstabulate country with max time delta
-maxtimedelta_countries = get_maxtimedelta_region(some, 'FIPS')
+maxtimedelta_countries = get_maxtimedelta_region(some, 'FIPS', trivial_users=trivial_users)
 
 # Deal with unambiguous results:
-maxtimedelta_countries["userid"] = maxtimedelta_countries.index
-maxtimedelta_countries["homeLocDict"] = maxtimedelta_countries.apply(lambda x: get_regional_post_counts(x["userid"],
-                                                                                                        x["HomeLocList"],
-                                                                                                        users_posts_per_country),
-                                                                     axis=1)
+maxtimedelta_countries = resolve_candidates(maxtimedelta_countries, trivial_users, users_posts_per_country,
+                                            method_name)
 
-maxtimedelta_countries[method_name] = maxtimedelta_countries.apply(lambda x: apply_maxposts_to_candidate_countries(x["homeLocDict"]),
-                                                                   axis=1)
+# Decode user ids and countries for output
+maxtimedelta_countries = decode_output(maxtimedelta_countries, codebooks, 'FIPS', method_name)
 
 # Write result to file by user
 users_filename = "%s_%susers.csv" % (method_name, str(maxtimedelta_countries.index.nunique()))
@@ -215,13 +305,14 @@ maxtimedelta_countries[method_name].value_counts().to_csv(os.path.join(folder,
                                                  header=[method_name])
 
 #--------------------------------------------------
-# ADD COLUMNS FOR MONTHS/WEEKS/DAYS
+# DISTINCT MONTHS/WEEKS/DAYS IN EACH COUNTRY
 #-------------------------------------------------
 
-# Separate months, weeks and days into own columns for cross-tabulation:
-some["month"] = some.time_local.dt.to_period('M') #some["time_local"].apply(lambda x: x.month)
-some["week"] = some.time_local.dt.to_period('W')
-some["day"] = some.time_local.dt.to_period('D')
+# Bitmap of the days with posts (day keys of the post table) of each user in each region unit, rolled up to
+# countries. The number of distinct days is the popcount of the bitmap, weeks and months are folded from the days.
+hierarchy, units = region_hierarchy(some)
+aggregates, bitmaps = aggregate_units(some["user"].values, units, some["time"].values, some["day"].values)
+country_periods = rollup(aggregates, hierarchy, 'FIPS', bitmaps=bitmaps)
 
 #-----------------------------
 # MAX MONTHS; WEEKS and DAYS
@@ -229,15 +320,17 @@ some["day"] = some.time_local.dt.to_period('D')
 
 for time in ["month", "week", "day"]:
 
-    method_name = "basic_max%ss" % time
+    method_name = "basic_max%ss%s" % (time, trip_suffix)
     
     #Crosstabulate country, region and continent with max number of unique visit months
-    results = get_maxtime_region(some, 'FIPS', timecol=time, truncate=False)
-    
+    results = get_maxtime_region(some, 'FIPS', timecol=time, region_periods=country_periods, truncate=False,
+                                 trivial_users=trivial_users)
+
     # Deal with unambiguous results:
-    results["userid"] = results.index
-    results["homeLocDict"] = results.apply(lambda x: get_regional_post_counts(x["userid"], x["HomeLocList"], users_posts_per_country), axis=1)
-    results[method_name] = results.apply(lambda x: apply_maxposts_to_candidate_countries(x["homeLocDict"]), axis=1)
+    results = resolve_candidates(results, trivial_users, users_posts_per_country, method_name)
+
+    # Decode user ids and countries for output
+    results = decode_output(results, codebooks, 'FIPS', method_name)
 
     # Organize columns for printing 
     results = results[['MAX%ss' % time, 'N_of_FIPS_withMax%s' % time, 'HomeLocList', 'homeLocDict', method_name]]
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+
+Code associated to following manuscript:
+    "Identifying the origins of social media users."
+
+Integer time keys of the posts.
+
+The local time of each post is parsed once at ingest with an explicit format (TIME_FORMAT) to an int64 epoch
+timestamp (nanoseconds, see post_table.py), and the time units used by the temporal methods and the usage
+statistics are derived from it by integer arithmetic:
+    - day: days since 1970-01-01
+    - week: weeks since Monday 1970-01-05 (weeks from Monday to Sunday, as ISO weeks and pandas Period "W")
+    - month: months since 1970-01
+    - year: calendar year
+All keys are int32, so grouping, comparing and hashing them is fast (unlike pandas Period columns).
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+"""
+import numpy as np
+import pandas as pd
+
+# Format of the local times in the input data (e.g. "2015-07-04 12:19:11")
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+NS_PER_DAY = 86400 * 10 ** 9
+
+# Day number of the first Monday since 1970-01-01 (1970-01-05)
+FIRST_MONDAY = 4
+
+TIME_KEYS = ["day", "week", "month", "year"]
+
+
+def parse_times(values, time_format=TIME_FORMAT):
+    """Parse local times into int64 epoch timestamps (nanoseconds) with an explicit format. Malformed values do not
+    raise an error, they are flagged so that they can be reported and excluded all at once.
+
+    :param values: array of local time strings (or datetimes, which are not parsed)
+    :param time_format: strftime format of the local times
+    :return: numpy array of timestamps (int64 nanoseconds, 0 for malformed values) and boolean numpy array of the
+             malformed values
+    """
+    values = pd.Series(np.asarray(values))
+
+    if pd.api.types.is_datetime64_any_dtype(values):
+        parsed = values
+    else:
+        parsed = pd.to_datetime(values, format=time_format, errors="coerce")
+
+    malformed = parsed.isna().values
+    times = parsed.values.astype("datetime64[ns]").view(np.int64).copy()
+    times[malformed] = 0
+
+    return times, malformed
+
+
+def day_numbers(times):
+    """Day numbers (days since 1970-01-01) of timestamps
+
+    :param times: numpy array of timestamps (int64 nanoseconds)
+    :return: numpy array of day numbers (int64)
+    """
+    return np.floor_divide(np.asarray(times, dtype=np.int64), NS_PER_DAY)
+
+
+def week_numbers(days):
+    """Week numbers (weeks since Monday 1970-01-05) of day numbers"""
+    return np.floor_divide(np.asarray(days, dtype=np.int64) - FIRST_MONDAY, 7)
+
+
+def civil_dates(days):
+    """Calendar year and month (1-12) of day numbers (days since 1970-01-01), in the proleptic Gregorian calendar
+
+    :param days: numpy array of day numbers
+    :return: numpy arrays of years and months
+    """
+    # Days since 0000-03-01, split into 400-year eras (years starting from March, so leap days are last)
+    days = np.asarray(days, dtype=np.int64) + 719468
+    era = np.floor_divide(days, 146097)
+    day_of_era = days - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+    month_index = (5 * day_of_year + 2) // 153
+
+    months = np.where(month_index < 10, month_index + 3, month_index - 9)
+    years = year_of_era + era * 400 + (months <= 2)
+
+    return years, months
+
+
+def month_numbers(days):
+    """Month numbers (months since 1970-01) of day numbers"""
+    years, months = civil_dates(days)
+
+    return (years - 1970) * 12 + months - 1
+
+
+def encode_time(times):
+    """Integer time keys of timestamps
+
+    :param times: numpy array of timestamps (int64 nanoseconds)
+    :return: dictionary of int32 numpy arrays (day, week, month, year)
+    """
+    days = day_numbers(times)
+    years, months = civil_dates(days)
+
+    keys = {"day": days,
+            "week": week_numbers(days),
+            "month": (years - 1970) * 12 + months - 1,
+            "year": years}
+
+    return {key: values.astype(np.int32) for key, values in keys.items()}